@@ -4,6 +4,11 @@ import datetime
 import inputs
 import processes
 import outputs
+import pipeline
+import status
+import exports
+import sessions
+import uuid
 import datetime
 import pandas as pd
 
@@ -23,17 +28,31 @@ if 'api_key' not in st.session_state:
 if 'type_selected' not in st.session_state:
     st.session_state.type_selected = False
 
-if 'instruments' not in st.session_state:
-    st.session_state.instruments = None
+if 'plotdata_key' not in st.session_state:
+    st.session_state.plotdata_key = None
 
-if 'plotdata_df' not in st.session_state:
-    st.session_state.plotdata_df = None
+# Changes whenever the plot table is replaced or modified, so that exports of earlier tables are not offered
+if 'plotdata_revision' not in st.session_state:
+    st.session_state.plotdata_revision = None
 
-if 'appendixf_df' not in st.session_state:
-    st.session_state.appendixf_df = None
+# Bulky data is kept out of session state, in session data measured against the session and server memory budgets.
+# Prepared exports and map payloads can be made again, so they are dropped first when the session is over budget.
+session_data = sessions.sessionData(evictable={'exports': {}, 'plot_payloads': None})
 
-if 'appendixg_df' not in st.session_state:
-    st.session_state.appendixg_df = None
+if 'raw_data' not in session_data:
+    session_data['raw_data'] = None
+
+if 'derived_data' not in session_data:
+    session_data['derived_data'] = {}
+
+if 'plotdata_df' not in session_data:
+    session_data['plotdata_df'] = None
+
+if 'plot_payloads' not in session_data:
+    session_data['plot_payloads'] = None
+
+if 'exports' not in session_data:
+    session_data['exports'] = {}
 
 st.title('Weekly Report Plotting')
 st.subheader('Lantau Portfolio Project')
@@ -141,6 +160,35 @@ with st.expander(
         options=all_types,
         default=[instr_type for instr_type in ['IS', 'IW'] if instr_type in all_types]
     )
+    use_readings_cache = st.checkbox(
+        label='Use local readings cache',
+        help='Only download readings for days which have not been downloaded before. Uncheck to download everything again.',
+        value=True
+    )
+    download_workers = st.number_input(
+        label='Number of concurrent downloads',
+        help='Readings are downloaded in chunks. Choose how many chunks to request from the API at the same time.',
+        min_value=1,
+        value=8,
+        step=1,
+        format='%d'
+    )
+    download_instruments_per_chunk = st.number_input(
+        label='Instruments per download chunk',
+        help='Smaller chunks are quicker to retry if a request fails',
+        min_value=1,
+        value=50,
+        step=10,
+        format='%d'
+    )
+    download_days_per_chunk = st.number_input(
+        label='Days per download chunk',
+        help='Smaller chunks are quicker to retry if a request fails',
+        min_value=1,
+        value=7,
+        step=1,
+        format='%d'
+    )
 
 get_data = st.button(
     label='Get data',
@@ -149,155 +197,120 @@ get_data = st.button(
     disabled=st.session_state.type_selected
 )
 
+selected_subtypes_dict = {}
+for type_subtype in selected_subtypes_list:
+    instr_type, subtype = type_subtype.split(': ')
+    if instr_type in selected_subtypes_dict.keys():
+        selected_subtypes_dict[instr_type] += [subtype]
+    else:
+        selected_subtypes_dict[instr_type] = [subtype]
+
 if get_data:
-    selected_subtypes_dict = {}
-    for type_subtype in selected_subtypes_list:
-        instr_type, subtype = type_subtype.split(': ')
-        if instr_type in selected_subtypes_dict.keys():
-            selected_subtypes_dict[instr_type] += [subtype]
-        else:
-            selected_subtypes_dict[instr_type] = [subtype]
-    # Get instrument setup from API
-    st.session_state.instruments = inputs.getInstrumentSetup(
-        subtype_list=selected_subtypes_dict,
+    # Each download starts a new performance trace, to which later recomputed stages are added
+    status.startTrace('Get data')
+    # Raw layer: everything downloaded from the API. Derived results of earlier downloads no longer apply.
+    session_data['raw_data'] = pipeline.fetchRawData(
+        subtype_dict=selected_subtypes_dict,
         imc_cc_selection=imc_cc_selection,
-        api_key=st.session_state.api_key
-    )
-
-    # Get parent-child relationships from API
-    st.session_state.instruments = inputs.getParentChildRelationships(
-        instruments=st.session_state.instruments,
-        api_key=st.session_state.api_key
-    )
-
-    # for instrument in st.session_state.instruments.values():
-    #     st.write(instrument.id)
-    #     st.write(instrument.parents)
-    #     st.write(instrument.children)
-
-    # Get IMC-Contractor pairing, if both instrument owners were selected
-    st.session_state.instruments = inputs.identifyIMCPairing(
-        instruments=st.session_state.instruments
-    )
-
-    # Get instrument readings from API
-    st.session_state.instruments = inputs.getInstrumentReadings(
-        instruments=st.session_state.instruments,
+        inclinometer_types=inclinometer_types,
         report_period=report_period,
         buffer_start=buffer_start,
-        api_key=st.session_state.api_key
-    )
-
-    # Get instrument review levels from API
-    st.session_state.instruments = inputs.getInstrumentReviewLevels(
-        instruments=st.session_state.instruments,
-        api_key=st.session_state.api_key
-    )
-
-    # if list(set(selected_types) & set(inclinometer_types)):
-    #     st.session_state.instruments = inputs.getCalibrationData(
-    #         instruments=st.session_state.instruments,
-    #         inclinometer_types=inclinometer_types,
-            # api_key=st.session_state.api_key
-    #     )
-    #     # inclinometer_displacement_fields = {
-    #     #     'A': 'child_cum_diff_a',
-    #     #     'B': 'child_cum_diff_b'
-    #     # }
-    #     inclinometer_displacement_fields = {
-    #         'A': 'child_cumulative_displacement_a',
-    #         'B': 'child_cumulative_displacement_b'
-    #     }
-    #     st.session_state.instruments = processes.ab_to_ne(
-    #         instruments=st.session_state.instruments,
-    #         inclinometer_types=inclinometer_types,
-    #         inclinometer_displacement_fields=inclinometer_displacement_fields
-    #     )
-
-    # Find start and end readings, and the change between the two
-    st.session_state.instruments = processes.findSummaryOutput(
-        instruments=st.session_state.instruments,
-        report_period=report_period
+        api_key=st.session_state.api_key,
+        max_workers=download_workers,
+        instruments_per_chunk=download_instruments_per_chunk,
+        days_per_chunk=download_days_per_chunk,
+        use_cache=use_readings_cache
     )
-
-    # Find the readings most exceeding the review levels
-    st.session_state.instruments = processes.findMaxExceedance(
-        instruments=st.session_state.instruments,
-        report_period=report_period,
-        period_exceedances=period_exceedances
-    )
-
-    # Calculate differences in reading at period end between an IMC and Contractor pair
-    st.session_state.instruments = processes.compareIMCWithContractor(
-        instruments=st.session_state.instruments,
-        report_period=report_period,
-        imc_maxdatediff=imc_maxdatediff
-    )
-
-    # Map contractor 1202 sites ("A", "B", etc.) to IMR sites ("West of TCE", "TCE Station", "East of TCE")
-    st.session_state.instruments = processes.map1202Sites(
-        instruments=st.session_state.instruments
-    )
-
-    # if list(set(selected_types) & set(inclinometer_types)):
-    #     st.session_state.instruments = processes.findInclinometerOutput(
-    #         instruments=st.session_state.instruments,
-    #         inclinometer_types=inclinometer_types,
-    #         displacement_scale_factor=100 / 1000
-    #     )
-
-    # Construct dataframe from which to filter data for plotting and output tables
-    st.session_state.plotdata_df = processes.collatePlotData(instruments=st.session_state.instruments)
-
-    # Construct dataframe for Appendix F
-    st.session_state.appendixf_df = processes.collateAppendixF(all_data=st.session_state.plotdata_df)
-
-    # Construct dataframe for Appendix G
-    st.session_state.appendixg_df = processes.collateAppendixG(
-        all_data=st.session_state.plotdata_df
-    )
-
-if st.session_state.plotdata_df is not None:
-    st.divider()
-    st.subheader('Download CSV data')
-    all_data_col, app_f_col, app_g_col = st.columns(3)
-    with all_data_col:
-        download_all_data = st.download_button(
-            label='All data',
-            help='Download all data, including start, end & change, IMC-Contractor comparison and review level status',
-            type='secondary',
-            data=st.session_state.plotdata_df.to_csv(path_or_buf=None, index=False),
-            file_name='lpp_data_' + report_period[0].strftime('%Y%m%d') + '–' + report_period[1].strftime('%Y%m%d') + '.csv',
-            mime='text/csv'
-        )
-    with app_f_col:
-        download_appendix_f = st.download_button(
-            label='Appendix F',
-            help='Download details of exceedances',
-            type='secondary',
-            data=st.session_state.appendixf_df.to_csv(path_or_buf=None, index=False),
-            file_name='lpp_appendixf_' + report_period[0].strftime('%Y%m%d') + '–' + report_period[1].strftime('%Y%m%d') + '.csv',
-            mime='text/csv'
+    session_data['derived_data'] = {}
+
+raw_data = session_data['raw_data']
+if raw_data is not None:
+    if raw_data['key'] != pipeline.rawDataKey(selected_subtypes_dict, imc_cc_selection, inclinometer_types):
+        st.info('The instrument selection has changed since the data was downloaded. Press Get data to download the new selection.')
+    elif not pipeline.coversWindow(raw_data, report_period, buffer_start):
+        st.info('The report period needs readings which have not been downloaded. Press Get data to download them.')
+    else:
+        # Derived layer: recompute only the stages whose analysis parameters or inputs have changed
+        derived_data = session_data['derived_data']
+        stage_keys = {name: stage['key'] for name, stage in derived_data.items()}
+        derived_data = pipeline.runDerivedStages(
+            raw=raw_data,
+            derived=derived_data,
+            params={
+                'report_period': tuple(report_period),
+                'buffer_start': buffer_start,
+                'period_exceedances': period_exceedances,
+                'imc_maxdatediff': imc_maxdatediff
+            }
         )
-    with app_g_col:
-        download_appendix_g = st.download_button(
-            label='Appendix G',
-            help='Download comparison of Contractor and IMC readings',
+        # Stored again only when stages were recomputed, so that the session's memory is measured again
+        if stage_keys != {name: stage['key'] for name, stage in derived_data.items()}:
+            session_data['derived_data'] = derived_data
+        # The plot table is replaced only when it has been recomputed, so that plotting keeps working on its own table.
+        # Plotting replaces rather than modifies the table, so it starts from a compacted view instead of a deep copy.
+        if st.session_state.plotdata_key != derived_data['plotdata']['key']:
+            st.session_state.plotdata_key = derived_data['plotdata']['key']
+            session_data['plotdata_df'] = sessions.compactFrame(derived_data['plotdata']['result'])
+            session_data['plot_payloads'] = None
+            st.session_state.plotdata_revision = uuid.uuid4().hex
+
+if session_data['plotdata_df'] is not None:
+    st.divider()
+    st.subheader('Download data')
+    export_format = st.radio(
+        label='Format',
+        help='Files are prepared when first requested and kept until the data changes',
+        options=list(exports.EXPORT_FORMATS),
+        format_func=lambda export_format: exports.EXPORT_FORMAT_LABELS[export_format],
+        horizontal=True
+    )
+    export_version = exports.dataVersion(st.session_state.plotdata_key, st.session_state.plotdata_revision)
+    export_tables = {
+        'plotdata': session_data['plotdata_df'],
+        'appendix_f': session_data['derived_data']['appendix_f']['result'],
+        'appendix_g': session_data['derived_data']['appendix_g']['result']
+    }
+    *artefact_cols, trace_col = st.columns(len(exports.TABLE_ARTEFACTS) + 1)
+    for artefact_col, (artefact, (label, artefact_help, _, _)) in zip(artefact_cols, exports.exportArtefacts(export_format).items()):
+        with artefact_col:
+            export_data = exports.cachedExport(session_data['exports'], export_version, artefact, export_format)
+            if export_data is None and st.button(label='Prepare ' + label, help=artefact_help, key='prepare_' + artefact + '_' + export_format):
+                export_data = exports.exportArtefact(session_data['exports'], export_version, artefact, export_format, export_tables)
+                session_data.touch('exports')
+            if export_data is not None:
+                st.download_button(
+                    label=label,
+                    help=artefact_help,
+                    type='secondary',
+                    data=export_data,
+                    file_name=exports.exportFileName(artefact, export_format, report_period),
+                    mime=exports.EXPORT_FORMATS[export_format][0],
+                    key='download_' + artefact + '_' + export_format
+                )
+    with trace_col:
+        download_trace = st.download_button(
+            label='Performance trace',
+            help='Download the time, rows, bytes and memory of each stage of this run',
             type='secondary',
-            data=st.session_state.appendixg_df.to_csv(path_or_buf=None, index=False),
-            file_name='lpp_appendixg_' + report_period[0].strftime('%Y%m%d') + '–' + report_period[1].strftime('%Y%m%d') + '.csv',
-            mime='text/csv'
+            data=status.traceJSON(),
+            file_name='lpp_trace_' + report_period[0].strftime('%Y%m%d') + '–' + report_period[1].strftime('%Y%m%d') + '.json',
+            mime='application/json'
         )
+    memory_usage = sessions.serverUsage()
+    st.caption('Data held in memory: {:,.0f} MB by this session, {:,.0f} of {:,.0f} MB by all sessions'.format(
+        session_data.memoryUsage() / 2 ** 20,
+        memory_usage['memory'] / 2 ** 20,
+        memory_usage['server_budget'] / 2 ** 20
+    ))
 
-    available_fieldnames = []
     # Get unique list of field names
-    available_fieldnames = list(set().union(*[list(instrument.readings) for instrument in st.session_state.instruments.values() if instrument.readings is not None]))
-    if 'Timestamp' in available_fieldnames:
-        available_fieldnames.remove('Timestamp')
+    available_fieldnames = list(session_data['raw_data']['readings_store'].fields['field'].cat.categories)
 
     if list(set(selected_types) & set(inclinometer_types)):
         st.divider()
         st.subheader('Plot vector data')
+        if session_data['derived_data'].get('inclinometer_vectors', {}).get('result') is not None:
+            st.write(session_data['derived_data']['inclinometer_vectors']['result'])
 
     st.divider()
     st.subheader('Plot scalar data')
@@ -311,7 +324,7 @@ if st.session_state.plotdata_df is not None:
     hidden_instruments = st.multiselect(
         label='Choose instruments to hide',
         help='Selected instruments will be omitted from the plots',
-        options=[instrument.id for instrument in st.session_state.instruments.values()],
+        options=[instrument.id for instrument in session_data['raw_data']['instruments'].values()],
         default=None,
         placeholder='Choose zero or more instruments'
     )
@@ -324,23 +337,31 @@ if st.session_state.plotdata_df is not None:
     
     if plot_data:
         # Convert eastings and northings to latitudes and longitudes
-        st.session_state.plotdata_df = processes.hk1980_to_latlong(plotdata_df=st.session_state.plotdata_df)
+        plotdata_df = processes.hk1980_to_latlong(plotdata_df=session_data['plotdata_df'])
 
         # Hardcode omission of markers with erroneous values
-        st.session_state.plotdata_df = st.session_state.plotdata_df.loc[~st.session_state.plotdata_df['id'].isin(hidden_instruments)]
+        plotdata_df = plotdata_df.loc[~plotdata_df['id'].isin(hidden_instruments)]
 
         # Assign colour scales to start, end and change values
-        st.session_state.plotdata_df = outputs.assignColourScales(
-            plotdata_df=st.session_state.plotdata_df,
+        plotdata_df = outputs.assignColourScales(
+            plotdata_df=plotdata_df,
+            field_names=selected_fieldnames
+        )
+        session_data['plotdata_df'] = plotdata_df
+        st.session_state.plotdata_revision = uuid.uuid4().hex
+
+        st.write(plotdata_df)
+
+        # Partition the plot table once per field, so that switching between summaries only redraws the maps
+        session_data['plot_payloads'] = outputs.partitionPlotData(
+            plotdata_df=plotdata_df,
             field_names=selected_fieldnames
         )
 
-        st.write(st.session_state.plotdata_df)
-        
+    if session_data['plot_payloads'] is not None:
         # Plot one chart for each field name
-        for selected_fieldname in selected_fieldnames:
+        for selected_fieldname, plot_payload in session_data['plot_payloads'].items():
             outputs.plotChartTabs(
-                plotdata_df=st.session_state.plotdata_df,
+                plot_payload=plot_payload,
                 field_name=selected_fieldname
-            )
-            st.write(st.session_state.plotdata_df.loc[st.session_state.plotdata_df['field_name'] == selected_fieldname])    
\ No newline at end of file
+            )    
\ No newline at end of file
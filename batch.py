@@ -0,0 +1,225 @@
+import inputs
+import pipeline
+import exports
+import status
+import client
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import datetime
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def defaultReportPeriod() -> tuple:
+    # The report period the app offers by default: the week ending two days ago
+    today = datetime.date.today()
+    return (today - datetime.timedelta(days=8), today - datetime.timedelta(days=2))
+
+
+def batchJobs(report_periods: list, contracts: list = None) -> list:
+    """
+    **batchJobs** Lists the reports to produce: one for each report period, or for each report period and contract
+
+    :param contracts: Contracts to report on separately, or None for one report on all contracts
+    :type list:
+    """
+    return [
+        {'report_period': report_period, 'contracts': None if contract is None else [contract]}
+        for report_period in report_periods
+        for contract in (contracts or [None])
+    ]
+
+
+def jobDirectory(output_dir: str, job: dict) -> str:
+    if job['contracts'] is None:
+        return output_dir
+    return os.path.join(output_dir, '_'.join(job['contracts']))
+
+
+def runJob(job: dict, settings: dict) -> dict:
+    """
+    **runJob** Downloads and processes the data of one report and writes its exports and performance trace
+
+    Runs without a Streamlit session, so stage status is logged instead of displayed.
+
+    :param settings: Instrument selection, analysis parameters, download settings, API key and URL, export formats and
+    output directory shared by all jobs
+    :type dict:
+    """
+    started = time.perf_counter()
+    if settings['api_url'] is not None:
+        client.setClient(settings['api_url'])
+    report_period = job['report_period']
+    status.startTrace('Batch report ' + report_period[0].isoformat() + ' to ' + report_period[1].isoformat())
+
+    raw = pipeline.fetchRawData(
+        subtype_dict=settings['subtype_dict'],
+        imc_cc_selection=settings['imc_cc_selection'],
+        inclinometer_types=settings['inclinometer_types'],
+        report_period=report_period,
+        buffer_start=settings['buffer_start'],
+        api_key=settings['api_key'],
+        max_workers=settings['download_workers'],
+        instruments_per_chunk=settings['instruments_per_chunk'],
+        days_per_chunk=settings['days_per_chunk'],
+        use_cache=settings['use_cache'],
+        contracts=job['contracts']
+    )
+    derived = pipeline.runDerivedStages(
+        raw=raw,
+        derived={},
+        params={
+            'report_period': report_period,
+            'buffer_start': settings['buffer_start'],
+            'period_exceedances': settings['period_exceedances'],
+            'imc_maxdatediff': settings['imc_maxdatediff']
+        }
+    )
+    tables = {name: derived[name]['result'] for name in ['plotdata', 'appendix_f', 'appendix_g']}
+
+    job_dir = jobDirectory(settings['output_dir'], job)
+    os.makedirs(job_dir, exist_ok=True)
+    files = []
+    for export_format in settings['export_formats']:
+        for artefact, (_, _, _, sheets) in exports.exportArtefacts(export_format).items():
+            file_path = os.path.join(job_dir, exports.exportFileName(artefact, export_format, report_period))
+            with open(file_path, 'wb') as export_file:
+                export_file.write(exports.serialiseTables(
+                    {sheet_name: tables[table_name] for table_name, sheet_name in sheets.items()},
+                    export_format
+                ))
+            files.append(file_path)
+    trace_path = os.path.join(job_dir, 'lpp_trace_' + report_period[0].strftime('%Y%m%d') + '–' + report_period[1].strftime('%Y%m%d') + '.json')
+    with open(trace_path, 'w') as trace_file:
+        trace_file.write(status.traceJSON())
+    files.append(trace_path)
+
+    return {
+        'instruments': len(raw['instruments']),
+        'readings': len(raw['readings_store'].readings),
+        'rows': len(tables['plotdata']),
+        'files': files,
+        'seconds': time.perf_counter() - started
+    }
+
+
+def configureLogging(level: int) -> None:
+    logging.basicConfig(level=level, format='%(asctime)s %(processName)s %(levelname)s %(message)s')
+
+
+def runBatch(jobs: list, settings: dict, max_processes: int = None, log_level: int = logging.WARNING) -> dict:
+    """
+    **runBatch** Runs report jobs in parallel worker processes, returning the result or error of each job in order
+
+    Each process runs one job and then exits, so that the memory of one report is returned before the next starts.
+    Jobs use the readings cache on disk through their own connection. A job reuses readings stored by jobs which
+    finished before it looked them up, but jobs running at the same time may each download the same missing ranges.
+    The result of each job is logged at INFO level.
+    """
+    max_processes = min(max_processes or os.cpu_count() or 1, len(jobs)) or 1
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    with ProcessPoolExecutor(
+            max_workers=max_processes,
+            mp_context=context,
+            initializer=configureLogging,
+            initargs=(log_level,),
+            max_tasks_per_child=1
+        ) as executor:
+        futures = {executor.submit(runJob, job, settings): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            index = futures[future]
+            job = jobs[index]
+            try:
+                results[index] = future.result()
+            except Exception as error:
+                logger.exception('Report for {} to {}{} failed'.format(job['report_period'][0], job['report_period'][1], '' if job['contracts'] is None else ', contract ' + ', '.join(job['contracts'])))
+                results[index] = {'error': repr(error)}
+                continue
+            logger.info('{} to {}{}: {:,} instruments, {:,} readings, {:,} rows in {:.1f} s, {:,} files written to {}'.format(
+                job['report_period'][0],
+                job['report_period'][1],
+                '' if job['contracts'] is None else ', contract ' + ', '.join(job['contracts']),
+                results[index]['instruments'],
+                results[index]['readings'],
+                results[index]['rows'],
+                results[index]['seconds'],
+                len(results[index]['files']),
+                jobDirectory(settings['output_dir'], job)
+            ))
+
+    return {index: results[index] for index in range(len(jobs))}
+
+
+def parseDate(value: str) -> datetime.date:
+    return datetime.date.fromisoformat(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Produce LPP weekly report data without the app')
+    parser.add_argument('--types', nargs='+', required=True, help='Instrument types to report on, with all of their sub-types')
+    parser.add_argument('--period', type=parseDate, nargs=2, action='append', metavar=('START', 'END'), help='Inclusive report period as YYYY-MM-DD dates. Repeat to produce several reports. Defaults to the week ending two days ago.')
+    parser.add_argument('--contracts', nargs='+', default=None, help='Produce a separate report for each of these contracts, e.g. 1202')
+    parser.add_argument('--imc-cc', nargs='+', choices=['IMC', 'Contractor'], default=['IMC', 'Contractor'], help='Include IMC or contractor\'s instruments, or both')
+    parser.add_argument('--inclinometer-types', nargs='*', default=['IS', 'IW'])
+    parser.add_argument('--buffer-start', type=int, default=3, help='Days before the start date to search for missing readings')
+    parser.add_argument('--all-exceedances', action='store_true', help='Include exceedance of the first reading found before the start date')
+    parser.add_argument('--imc-maxdatediff', type=int, default=3, help='Longest period in days to compare IMC and contractor readings')
+    parser.add_argument('--formats', nargs='+', choices=list(exports.EXPORT_FORMATS), default=['csv'])
+    parser.add_argument('--output-dir', default='reports')
+    parser.add_argument('--processes', type=int, default=None, help='Reports produced at the same time. Defaults to the number of CPUs.')
+    parser.add_argument('--download-workers', type=int, default=inputs.download.MAX_WORKERS, help='Concurrent downloads in each process')
+    parser.add_argument('--instruments-per-chunk', type=int, default=inputs.download.INSTRUMENTS_PER_CHUNK)
+    parser.add_argument('--days-per-chunk', type=int, default=inputs.download.DAYS_PER_CHUNK)
+    parser.add_argument('--no-cache', action='store_true', help='Download all readings again instead of using the local readings cache')
+    parser.add_argument('--api-url', default=None, help='Defaults to the LPP_API_URL environment variable or the LPP API')
+    parser.add_argument('--verbose', action='store_true', help='Log the progress of each stage')
+    arguments = parser.parse_args()
+
+    log_level = logging.INFO if arguments.verbose else logging.WARNING
+    configureLogging(log_level)
+    # The result of each report is logged whatever the level of the other logs
+    logger.setLevel(logging.INFO)
+    if arguments.api_url is not None:
+        client.setClient(arguments.api_url)
+
+    # Credentials are read from the environment rather than the command line, so they are not kept in shell history
+    username, password = os.environ.get('LPP_USERNAME'), os.environ.get('LPP_PASSWORD')
+    if not username or not password:
+        parser.error('set the LPP_USERNAME and LPP_PASSWORD environment variables')
+    api_key = inputs.apiKey(username=username, password=password)
+
+    all_types = inputs.getInstrumentTypes(api_key=api_key)
+    unknown_types = sorted(set(arguments.types) - set(all_types))
+    if unknown_types:
+        parser.error('unknown instrument types ' + ', '.join(unknown_types))
+    subtype_dict = inputs.getInstrumentSubTypes(type_list=arguments.types, api_key=api_key)
+
+    jobs = batchJobs(report_periods=[tuple(period) for period in arguments.period or [defaultReportPeriod()]], contracts=arguments.contracts)
+    results = runBatch(
+        jobs=jobs,
+        settings={
+            'subtype_dict': subtype_dict,
+            'imc_cc_selection': arguments.imc_cc,
+            'inclinometer_types': [instr_type for instr_type in arguments.inclinometer_types if instr_type in all_types],
+            'buffer_start': arguments.buffer_start,
+            'period_exceedances': not arguments.all_exceedances,
+            'imc_maxdatediff': arguments.imc_maxdatediff,
+            'api_key': api_key,
+            'api_url': arguments.api_url,
+            'download_workers': arguments.download_workers,
+            'instruments_per_chunk': arguments.instruments_per_chunk,
+            'days_per_chunk': arguments.days_per_chunk,
+            'use_cache': not arguments.no_cache,
+            'export_formats': arguments.formats,
+            'output_dir': arguments.output_dir
+        },
+        max_processes=arguments.processes,
+        log_level=log_level
+    )
+    sys.exit(1 if any('error' in result for result in results.values()) else 0)
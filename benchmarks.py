@@ -0,0 +1,768 @@
+import pandas as pd
+import numpy as np
+import argparse
+import datetime
+import logging
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+import warnings
+import download
+import mockapi
+import status
+
+
+def syntheticReadingsPayload(
+        num_readings: int = 1000000,
+        num_instruments: int = 100,
+        num_fields: int = 3,
+        seed: int = 0
+    ) -> dict:
+    """
+    **syntheticReadingsPayload** Builds a decoded /api/get_instrument_data response with num_readings readings in total
+
+    Roughly one value in ten is blank and one reading in fifty is blank in every field, to exercise the coercion and
+    empty-reading filter.
+    """
+    rng = np.random.default_rng(seed)
+    readings_per_instrument = max(num_readings // num_instruments, 1)
+    timestamps = pd.date_range('2024-01-01', periods=readings_per_instrument, freq='15min').strftime('%Y-%m-%d %H:%M:%S').tolist()
+    field_names = ['field_{}'.format(index) for index in range(num_fields)]
+
+    payload = {}
+    for instrument_index in range(num_instruments):
+        values = np.round(rng.normal(size=(readings_per_instrument, num_fields)), 3).astype(str)
+        values[rng.random(size=values.shape) < 0.1] = ''
+        values[rng.random(size=readings_per_instrument) < 0.02] = ''
+        payload['1201/TCA/GSM/{:05d}'.format(instrument_index)] = {
+            timestamp: dict(zip(field_names, row), Easting='811768.87', Northing='816511.63')
+            for timestamp, row in zip(timestamps, values.tolist())
+        }
+    payload['comment'] = 'Synthetic payload'
+
+    return payload
+
+
+def legacyParseReadings(readings_dict: dict) -> dict:
+    # The per-reading normalisation loop which parseReadings replaced, kept as the baseline to compare against
+    readings = {}
+    for name, data_dict in readings_dict.items():
+        if name == 'comment':
+            continue
+        dataframe_dict = {}
+        for index, (timestamp, reading_data) in enumerate(data_dict.items()):
+            data_fields = [reading_data[key] for key in reading_data if key not in ['Easting', 'Northing']]
+            if all(value == '' for value in data_fields):
+                continue
+            dataframe_dict[index] = {'Timestamp': datetime.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')}
+            dataframe_dict[index].update(reading_data)
+            for key, value in dataframe_dict[index].items():
+                if key != 'Timestamp':
+                    try:
+                        dataframe_dict[index][key] = float(value)
+                    except:
+                        dataframe_dict[index][key] = None
+        data_df = pd.DataFrame.from_dict(dataframe_dict, 'index')
+        if not data_df.empty:
+            readings[name] = data_df
+    return readings
+
+
+def benchmarkNormalisation(num_readings: int = 1000000, repeats: int = 1) -> dict:
+    payload = syntheticReadingsPayload(num_readings=num_readings)
+
+    timings = {}
+    for label, parse in [('legacy', legacyParseReadings), ('vectorised', download.parseReadings)]:
+        started = time.perf_counter()
+        for _ in range(repeats):
+            readings = parse(payload)
+        timings[label] = (time.perf_counter() - started) / repeats
+        timings[label + '_readings'] = sum(len(data_df) for data_df in readings.values())
+
+    timings['speed_up'] = timings['legacy'] / timings['vectorised']
+    print('Normalised {:,} readings: legacy {:.2f} s, vectorised {:.2f} s, {:.1f}x faster'.format(
+        timings['vectorised_readings'], timings['legacy'], timings['vectorised'], timings['speed_up']))
+
+    return timings
+
+
+def syntheticInstruments(
+        num_instruments: int = 10000,
+        readings_per_instrument: int = 48,
+        num_fields: int = 3,
+        seed: int = 0
+    ) -> dict:
+    # Instruments with readings already parsed, for benchmarking the processing stages without downloading
+    import classes
+    payload = syntheticReadingsPayload(
+        num_readings=num_instruments * readings_per_instrument,
+        num_instruments=num_instruments,
+        num_fields=num_fields,
+        seed=seed
+    )
+    instruments = {}
+    for instr_id, data_df in download.parseReadings(payload).items():
+        instruments[instr_id] = classes.instrument(id=instr_id)
+        instruments[instr_id].readings = data_df
+    return instruments
+
+
+def legacySummaryOutput(instruments: dict, report_period: tuple) -> dict:
+    # The per-instrument loop which summariseReadings replaced, kept as the baseline to compare against. It returns the
+    # Series it used to set on each instrument, as instruments no longer hold them.
+    summaries = {}
+    for instrument in instruments.values():
+        if instrument.readings is not None:
+            if not instrument.readings.drop(columns='Timestamp').isnull().all(axis=None):
+                readings = instrument.readings.loc[~instrument.readings.drop(columns='Timestamp').isnull().all(axis=1)].reset_index(drop=True)
+                if not readings.empty:
+                    summary = summaries[instrument.id] = {'end_reading': readings.iloc[readings['Timestamp'].idxmax()]}
+                    if not readings.loc[readings['Timestamp'] <= pd.to_datetime(report_period[0] + datetime.timedelta(days=1))].empty:
+                        summary['start_reading'] = readings.iloc[readings['Timestamp'].loc[readings['Timestamp'] <= pd.to_datetime(report_period[0] + datetime.timedelta(days=1))].idxmax()]
+                        summary['change'] = summary['end_reading'] - summary['start_reading']
+                    if not readings.loc[(readings['Timestamp'] >= pd.to_datetime(report_period[0]))].empty:
+                        summary['max_in_period'] = readings.loc[readings['Timestamp'] >= pd.to_datetime(report_period[0])].max(axis=0)
+                        summary['min_in_period'] = readings.loc[readings['Timestamp'] >= pd.to_datetime(report_period[0])].min(axis=0)
+    return summaries
+
+
+def benchmarkSummary(num_instruments: int = 10000, readings_per_instrument: int = 48) -> dict:
+    import processes
+    instruments = syntheticInstruments(num_instruments=num_instruments, readings_per_instrument=readings_per_instrument)
+    report_period = (datetime.date(2024, 1, 1), datetime.date(2024, 1, 1) + datetime.timedelta(days=readings_per_instrument // 96))
+
+    timings = {}
+    started = time.perf_counter()
+    legacySummaryOutput(instruments, report_period)
+    timings['legacy'] = time.perf_counter() - started
+    started = time.perf_counter()
+    store = processes.buildReadingsStore(instruments)
+    timings['store'] = time.perf_counter() - started
+    started = time.perf_counter()
+    processes.summariseReadings(store, report_period)
+    timings['vectorised'] = time.perf_counter() - started
+
+    timings['speed_up'] = timings['legacy'] / timings['vectorised']
+    print('Summarised {:,} instruments: legacy {:.2f} s, vectorised {:.3f} s ({:.0f}x faster), building the store {:.2f} s'.format(
+        num_instruments, timings['legacy'], timings['vectorised'], timings['speed_up'], timings['store']))
+
+    return timings
+
+
+def syntheticIMCPairs(
+        num_pairs: int = 1000,
+        readings_per_instrument: int = 48,
+        num_fields: int = 3,
+        seed: int = 0
+    ) -> dict:
+    # Contractor instruments each paired with an IMC instrument reading the same fields at its own irregular times
+    import classes
+    rng = np.random.default_rng(seed)
+    field_names = ['field_{}'.format(index) for index in range(num_fields)]
+    start = np.datetime64('2024-01-01T00:00:00', 's')
+    instruments = {}
+    for pair_index in range(num_pairs):
+        contractor_id = '1201/TCA/GSM/{:05d}'.format(pair_index)
+        for instr_id, is_imc in [(contractor_id, False), (contractor_id + '_I', True)]:
+            seconds = np.sort(rng.integers(0, 14 * 86400 // 60, size=readings_per_instrument)) * 60
+            values = np.round(rng.normal(size=(readings_per_instrument, num_fields)), 3)
+            values[rng.random(size=values.shape) < 0.1] = np.nan
+            readings = pd.DataFrame(values, columns=field_names)
+            readings.insert(0, 'Timestamp', pd.to_datetime(start + seconds.astype('timedelta64[s]')))
+            instruments[instr_id] = classes.instrument(id=instr_id)
+            instruments[instr_id].readings = readings.drop_duplicates('Timestamp').reset_index(drop=True)
+            instruments[instr_id].is_imc = is_imc
+            instruments[instr_id].imc_id = contractor_id + '_I' if not is_imc else contractor_id
+    return instruments
+
+
+def legacyCompareIMCWithContractor(instruments: dict, report_period: tuple, imc_maxdatediff: int) -> dict:
+    # The per-pair date-difference matrix which compareIMCReadings replaced, kept as the baseline to compare against
+    for instrument in instruments.values():
+        if instrument.is_imc or instrument.imc_id is None:
+            continue
+        if instrument.readings is not None and instruments[instrument.imc_id].readings is not None:
+            readings = instrument.readings.loc[(instrument.readings['Timestamp'] >= pd.to_datetime(report_period[0])) & (instrument.readings['Timestamp'] <= pd.to_datetime(report_period[1] + datetime.timedelta(days=1)))]
+            readings_imc = instruments[instrument.imc_id].readings.loc[(instruments[instrument.imc_id].readings['Timestamp'] >= pd.to_datetime(report_period[0])) & (instruments[instrument.imc_id].readings['Timestamp'] <= pd.to_datetime(report_period[1] + datetime.timedelta(days=1)))]
+            if not readings.drop(columns='Timestamp').isnull().all(axis=None) and not readings_imc.drop(columns='Timestamp').isnull().all(axis=None):
+                readings = readings.loc[~readings.drop(columns='Timestamp').isnull().all(axis=1)].reset_index(drop=True)
+                readings_imc = readings_imc.loc[~readings_imc.drop(columns='Timestamp').isnull().all(axis=1)].reset_index(drop=True)
+                date_diffs = pd.DataFrame(abs(readings['Timestamp'].values - readings_imc['Timestamp'].values[:, None]))
+                index_imc, index = date_diffs.stack().idxmin()
+                if date_diffs.iloc[(index_imc, index)] / datetime.timedelta(days=1) <= imc_maxdatediff:
+                    instrument.imc_compare_reading = readings.iloc[index]
+                    instruments[instrument.imc_id].imc_compare_reading = readings_imc.iloc[index_imc]
+                    instrument.end_imc_diff = readings.iloc[index] - readings_imc.iloc[index_imc]
+                    instruments[instrument.imc_id].end_imc_diff = readings_imc.iloc[index_imc] - readings.iloc[index]
+    return instruments
+
+
+def benchmarkIMCComparison(num_pairs: int = 1000, readings_per_instrument: int = 48, long_readings: int = 100000) -> dict:
+    import processes
+    report_period = (datetime.date(2024, 1, 3), datetime.date(2024, 1, 12))
+
+    timings = {}
+    instruments = syntheticIMCPairs(num_pairs=num_pairs, readings_per_instrument=readings_per_instrument)
+    started = time.perf_counter()
+    legacyCompareIMCWithContractor(instruments, report_period, imc_maxdatediff=1)
+    timings['legacy'] = time.perf_counter() - started
+    store = processes.buildReadingsStore(instruments)
+    started = time.perf_counter()
+    processes.compareIMCReadings(store, instruments, report_period, imc_maxdatediff=1)
+    timings['vectorised'] = time.perf_counter() - started
+    timings['speed_up'] = timings['legacy'] / timings['vectorised']
+    print('Compared {:,} IMC and Contractor pairs: legacy {:.2f} s, vectorised {:.3f} s ({:.0f}x faster)'.format(
+        num_pairs, timings['legacy'], timings['vectorised'], timings['speed_up']))
+
+    # A single pair of high-frequency instruments, for which the legacy date-difference matrix would not fit in memory
+    instruments = syntheticIMCPairs(num_pairs=1, readings_per_instrument=long_readings)
+    store = processes.buildReadingsStore(instruments)
+    started = time.perf_counter()
+    processes.compareIMCReadings(store, instruments, report_period, imc_maxdatediff=1)
+    timings['long_pair'] = time.perf_counter() - started
+    print('Compared one pair of up to {:,} readings each: vectorised {:.3f} s, where the legacy matrix would hold {:,.0f} GB'.format(
+        long_readings, timings['long_pair'], long_readings ** 2 * 8 / 1e9))
+
+    return timings
+
+
+def syntheticReviewLevels(instruments: dict, missing_ratio: float = 0.1, seed: int = 0) -> pd.DataFrame:
+    # Upper and lower alert, alarm and action levels for every field of every instrument, with a few levels missing
+    rng = np.random.default_rng(seed)
+    records = []
+    for instr_id, instrument in instruments.items():
+        for field_name in instrument.readings.columns.drop('Timestamp'):
+            for direction, sign in [('upper', 1), ('lower', -1)]:
+                for level, value in zip(['alert', 'alarm', 'action'], np.sort(rng.uniform(1, 3, size=3))):
+                    if rng.random() >= missing_ratio:
+                        records.append((instr_id, field_name, direction, level, sign * value))
+    return pd.DataFrame.from_records(records, columns=['instrument', 'field', 'direction', 'level', 'value'])
+
+
+def benchmarkExceedance(num_instruments: int = 10000, readings_per_instrument: int = 48) -> dict:
+    import inputs
+    import processes
+    instruments = syntheticInstruments(num_instruments=num_instruments, readings_per_instrument=readings_per_instrument)
+    reviewlevels_df = inputs.buildReviewLevelTable(syntheticReviewLevels(instruments).itertuples(index=False, name=None))
+    report_period = (datetime.date(2024, 1, 1), datetime.date(2024, 1, 1) + datetime.timedelta(days=readings_per_instrument // 96))
+    store = processes.buildReadingsStore(instruments)
+    summary_df = processes.summariseReadings(store, report_period)
+
+    timings = {}
+    started = time.perf_counter()
+    processes.classifyExceedances(
+        store=store,
+        reviewlevels_df=reviewlevels_df,
+        start_dates=processes.summaryStartDates(summary_df),
+        report_period=report_period,
+        period_exceedances=True
+    )
+    timings['exceedance'] = time.perf_counter() - started
+    print('Classified exceedances of {:,} instruments in {:.3f} s'.format(num_instruments, timings['exceedance']))
+
+    return timings
+
+
+def legacySummaries(summary_df: pd.DataFrame) -> dict:
+    # The per-instrument summary Series which the list comprehension in legacyCollatePlotData reads
+    summaries = {}
+    for instr_id, instr_summary in summary_df.groupby('instrument_id', observed=True, sort=False):
+        summary = summaries[instr_id] = {}
+        index = ['Timestamp'] + instr_summary['field'].astype(str).tolist()
+        end_date, start_date = instr_summary['end_date'].iloc[0], instr_summary['start_date'].iloc[0]
+        summary['end_reading'] = pd.Series([end_date] + instr_summary['end_value'].tolist(), index=index)
+        if not pd.isnull(start_date):
+            summary['start_reading'] = pd.Series([start_date] + instr_summary['start_value'].tolist(), index=index)
+            summary['change'] = summary['end_reading'] - summary['start_reading']
+        if instr_summary['max_in_period_value'].notnull().any():
+            summary['max_in_period'] = pd.Series(instr_summary['max_in_period_value'].tolist(), index=index[1:])
+            summary['min_in_period'] = pd.Series(instr_summary['min_in_period_value'].tolist(), index=index[1:])
+    return summaries
+
+
+def legacyCollatePlotData(instruments: dict, summaries: dict) -> pd.DataFrame:
+    # The per-row list comprehension which the joins in collatePlotData replaced, kept as the baseline to compare against.
+    # summaries holds the Series from legacySummaries in place of the summary attributes instruments used to have.
+    plotdata_list = [[
+        instrument.id,
+        field_name,
+        instrument.easting,
+        instrument.northing,
+        instrument.date_installed,
+        summary['start_reading'][field_name] if 'start_reading' in summary else None,
+        field_value,
+        summary['change'][field_name] if 'change' in summary else None,
+        abs(summary['change'][field_name]) if 'change' in summary else None,
+        1/math.tan(math.radians(abs(summary['change'][field_name]))) if 'change' in summary and summary['change'][field_name] != 0 and all(x in str(field_name).lower() for x in ['deg', 'change']) else None,
+        1/abs(summary['change'][field_name]) if 'change' in summary and summary['change'][field_name] != 0 and any(x in str(field_name).lower() for x in ['tilt', 'ratio', 'gradient']) and 'change' in str(field_name).lower() else None,
+        summary['max_in_period'][field_name] if 'max_in_period' in summary else None,
+        summary['min_in_period'][field_name] if 'min_in_period' in summary else None,
+        summary['max_in_period'][field_name] - summary['min_in_period'][field_name] if 'max_in_period' in summary and 'min_in_period' in summary and summary['max_in_period'][field_name] is not None and summary['min_in_period'][field_name] is not None else None,
+        summary['start_reading']['Timestamp'] if 'start_reading' in summary else None,
+        summary['end_reading']['Timestamp'],
+        summary['change']['Timestamp'] if 'change' in summary else None,
+        instrument.is_imc,
+        instrument.imc_id,
+        instrument.imc_compare_reading[field_name] if instrument.end_imc_diff is not None else None,
+        instrument.imc_compare_reading['Timestamp'] if instrument.end_imc_diff is not None else None,
+        instrument.end_imc_diff[field_name] if instrument.end_imc_diff is not None else None,
+        instrument.end_imc_diff['Timestamp'] if instrument.end_imc_diff is not None else None,
+        instrument.maxexceedance[field_name]['lower']['level'] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'lower' in instrument.maxexceedance[field_name].keys() else None,
+        instrument.maxexceedance[field_name]['lower']['maxabs_reading'][field_name] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'lower' in instrument.maxexceedance[field_name].keys() else None,
+        instrument.maxexceedance[field_name]['lower']['maxabs_reading']['Timestamp'] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'lower' in instrument.maxexceedance[field_name].keys() else None,
+        instrument.maxexceedance[field_name]['upper']['level'] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'upper' in instrument.maxexceedance[field_name].keys() else None,
+        instrument.maxexceedance[field_name]['upper']['maxabs_reading'][field_name] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'upper' in instrument.maxexceedance[field_name].keys() else None,
+        instrument.maxexceedance[field_name]['upper']['maxabs_reading']['Timestamp'] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'upper' in instrument.maxexceedance[field_name].keys() else None,
+        instrument.review_levels[field_name]['lower']['alert'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'lower' in instrument.review_levels[field_name].keys() else None,
+        instrument.review_levels[field_name]['lower']['alarm'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'lower' in instrument.review_levels[field_name].keys() else None,
+        instrument.review_levels[field_name]['lower']['action'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'lower' in instrument.review_levels[field_name].keys() else None,
+        instrument.review_levels[field_name]['upper']['alert'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'upper' in instrument.review_levels[field_name].keys() else None,
+        instrument.review_levels[field_name]['upper']['alarm'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'upper' in instrument.review_levels[field_name].keys() else None,
+        instrument.review_levels[field_name]['upper']['action'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'upper' in instrument.review_levels[field_name].keys() else None,
+        instrument.contract,
+        instrument.site,
+        instrument.type,
+        instrument.subtype
+    ] for instrument in instruments.values() if instrument.id in summaries for summary in [summaries[instrument.id]] for field_name, field_value in summary['end_reading'].items() if field_name != 'Timestamp']
+    plotdata_df = pd.DataFrame(
+        data=plotdata_list,
+        columns=[
+            'id',
+            'field_name',
+            'easting',
+            'northing',
+            'installation_date',
+            'start_value',
+            'end_value',
+            'change_value',
+            'abs_change',
+            'gradient_from_degrees',
+            'gradient_from_ratio',
+            'max_in_period_value',
+            'min_in_period_value',
+            'range_in_period',
+            'start_date',
+            'end_date',
+            'change_period',
+            'is_imc',
+            'corresponding_imc_id',
+            'imc_compare_reading',
+            'imc_compare_date',
+            'end_diff_with_imc',
+            'date_diff_with_imc',
+            'lower_review_level',
+            'lower_max_exceedance_value',
+            'lower_max_exceedance_date',
+            'upper_review_level',
+            'upper_max_exceedance_value',
+            'upper_max_exceedance_date',
+            'lower_alert',
+            'lower_alarm',
+            'lower_action',
+            'upper_alert',
+            'upper_alarm',
+            'upper_action',
+            'contract',
+            'site',
+            'type',
+            'sub-type'
+        ]
+    )
+
+    return plotdata_df
+
+
+def benchmarkPlotData(num_instruments: int = 10000, num_fields: int = 20, readings_per_instrument: int = 48) -> dict:
+    import tracemalloc
+    import inputs
+    import processes
+    instruments = syntheticIMCPairs(num_pairs=num_instruments // 2, readings_per_instrument=readings_per_instrument, num_fields=num_fields)
+    # The legacy table raises KeyError on a missing level, so give every field all its levels
+    reviewlevels_df = inputs.buildReviewLevelTable(syntheticReviewLevels(instruments, missing_ratio=0).itertuples(index=False, name=None))
+    instruments = inputs.applyReviewLevels(instruments, reviewlevels_df)
+    report_period = (datetime.date(2024, 1, 3), datetime.date(2024, 1, 12))
+    store = processes.buildReadingsStore(instruments)
+    summary_df = processes.summariseReadings(store, report_period)
+    tables = {
+        'summary_df': summary_df,
+        'imc_df': processes.compareIMCReadings(store, instruments, report_period, imc_maxdatediff=1),
+        'exceedance_df': processes.classifyExceedances(store, reviewlevels_df, processes.summaryStartDates(summary_df), report_period, period_exceedances=True),
+        'reviewlevels_df': reviewlevels_df
+    }
+    instruments = processes.applyIMCComparison(instruments, tables['imc_df'])
+    instruments = processes.applyExceedances(instruments, tables['exceedance_df'])
+    summaries = legacySummaries(summary_df)
+
+    timings = {}
+    for label, collate, kwargs in [('legacy', legacyCollatePlotData, {'summaries': summaries}), ('joined', processes.collatePlotData, tables)]:
+        started = time.perf_counter()
+        plotdata_df = collate(instruments=instruments, **kwargs)
+        timings[label] = time.perf_counter() - started
+        # Tracing slows allocation down, so the peak memory comes from a second, untimed run
+        tracemalloc.start()
+        collate(instruments=instruments, **kwargs)
+        timings[label + '_peak_mib'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    timings['speed_up'] = timings['legacy'] / timings['joined']
+    print('Collated {:,} plot rows: legacy {:.2f} s peaking at {:,.0f} MiB, joined {:.2f} s peaking at {:,.0f} MiB ({:.0f}x faster)'.format(
+        len(plotdata_df), timings['legacy'], timings['legacy_peak_mib'], timings['joined'], timings['joined_peak_mib'], timings['speed_up']))
+
+    return timings
+
+
+def benchmarkAppendices(num_instruments: int = 10000, num_fields: int = 20, readings_per_instrument: int = 48) -> dict:
+    import inputs
+    import processes
+    instruments = syntheticIMCPairs(num_pairs=num_instruments // 2, readings_per_instrument=readings_per_instrument, num_fields=num_fields)
+    reviewlevels_df = inputs.buildReviewLevelTable(syntheticReviewLevels(instruments).itertuples(index=False, name=None))
+    report_period = (datetime.date(2024, 1, 3), datetime.date(2024, 1, 12))
+    store = processes.buildReadingsStore(instruments)
+    summary_df = processes.summariseReadings(store, report_period)
+    plotdata_df = processes.collatePlotData(
+        instruments=instruments,
+        summary_df=summary_df,
+        imc_df=processes.compareIMCReadings(store, instruments, report_period, imc_maxdatediff=1),
+        exceedance_df=processes.classifyExceedances(store, reviewlevels_df, processes.summaryStartDates(summary_df), report_period, period_exceedances=True),
+        reviewlevels_df=reviewlevels_df
+    )
+
+    timings = {}
+    for label, collate in [('appendix_f', processes.collateAppendixF), ('appendix_g', processes.collateAppendixG)]:
+        started = time.perf_counter()
+        collate(all_data=plotdata_df)
+        timings[label] = time.perf_counter() - started
+    print('Collated appendices from {:,} plot rows: Appendix F {:.3f} s, Appendix G {:.3f} s'.format(
+        len(plotdata_df), timings['appendix_f'], timings['appendix_g']))
+
+    return timings
+
+
+def benchmarkCoordinates(num_instruments: int = 10000, num_fields: int = 20) -> dict:
+    import processes
+    rng = np.random.default_rng(0)
+    instrument_index = np.repeat(np.arange(num_instruments), num_fields)
+    eastings = 816500 + rng.uniform(-5000, 5000, size=num_instruments)
+    northings = 811700 + rng.uniform(-5000, 5000, size=num_instruments)
+    plotdata_df = pd.DataFrame({'easting': eastings[instrument_index], 'northing': northings[instrument_index]})
+
+    # The second run finds every coordinate already converted
+    timings = {}
+    for label in ['batched', 'memoised']:
+        started = time.perf_counter()
+        processes.hk1980_to_latlong(plotdata_df.copy())
+        timings[label] = time.perf_counter() - started
+    print('Converted {:,} plot rows of {:,} instruments: batched {:.3f} s, memoised rerun {:.3f} s'.format(
+        len(plotdata_df), num_instruments, timings['batched'], timings['memoised']))
+
+    return timings
+
+
+def syntheticPlotValues(num_instruments: int = 10000, num_fields: int = 20, missing_ratio: float = 0.05, seed: int = 0) -> pd.DataFrame:
+    # Plot table values only, with some fields entirely negative or positive so that both sequential scales are used
+    rng = np.random.default_rng(seed)
+    num_rows = num_instruments * num_fields
+    field_index = np.tile(np.arange(num_fields), num_instruments)
+    plotdata_df = pd.DataFrame({'field_name': ['Field {}'.format(index) for index in field_index]})
+    for summary_name in ['start', 'end', 'change', 'max_in_period', 'min_in_period']:
+        values = rng.normal(field_index % 3 - 1, 1, size=num_rows) * 10 ** (field_index % 4)
+        values[rng.random(size=num_rows) < missing_ratio] = np.nan
+        plotdata_df[summary_name + '_value'] = values
+    return plotdata_df
+
+
+def legacyAssignColourScales(plotdata_df: pd.DataFrame, field_names: list) -> pd.DataFrame:
+    # The per-value matplotlib colouring which the lookup tables in assignColourScales replaced, kept as the baseline to compare against
+    import classes
+    for summary_name in ['start', 'end', 'change', 'max_in_period', 'min_in_period']:
+        plotdata_df[summary_name + '_colour'] = [(None, None, None)] * len(plotdata_df)
+        for field_name in field_names:
+            plot_values = plotdata_df.loc[plotdata_df['field_name'] == field_name][summary_name + '_value']
+            min_value = plot_values.min()
+            max_value = plot_values.max()
+            maxabs_value = max(abs(max_value), abs(min_value))
+            if summary_name == 'change':
+                get_colour = classes.MPLColorHelper(cmap_name='PiYG', start_val=-maxabs_value, stop_val=maxabs_value)
+            else:
+                get_colour = classes.MPLColorHelper(cmap_name='OrRd' if abs(max_value) == maxabs_value else 'OrRd_r', start_val=min_value, stop_val=max_value)
+            for index, value in plot_values.dropna().items():
+                plotdata_df.at[index, summary_name + '_colour'] = tuple([int(colour_value * 255 + 0.5) for colour_value in get_colour.get_rgb(val=value)[0:3]])
+
+    return plotdata_df
+
+
+def benchmarkColourScales(num_instruments: int = 10000, num_fields: int = 20) -> dict:
+    import outputs
+    plotdata_df = syntheticPlotValues(num_instruments=num_instruments, num_fields=num_fields)
+    field_names = plotdata_df['field_name'].unique().tolist()
+
+    timings = {}
+    for label, assign in [('legacy', legacyAssignColourScales), ('lookup', outputs.assignColourScales)]:
+        started = time.perf_counter()
+        assign(plotdata_df.copy(), field_names)
+        timings[label] = time.perf_counter() - started
+
+    timings['speed_up'] = timings['legacy'] / timings['lookup']
+    print('Coloured {:,} plot rows: legacy {:.2f} s, lookup tables {:.3f} s ({:.0f}x faster)'.format(
+        len(plotdata_df), timings['legacy'], timings['lookup'], timings['speed_up']))
+
+    return timings
+
+
+def legacyPlotDecks(plotdata_df: pd.DataFrame, field_name: str) -> list:
+    # The five decks, one per tab, which plotChartTabs used to build from slices of the plot table, kept as the baseline to compare against
+    import pydeck
+    decks = []
+    for summary_name in ['start', 'end', 'change', 'max_in_period', 'min_in_period']:
+        decks.append(pydeck.Deck(
+            map_style='light',
+            initial_view_state=pydeck.ViewState(latitude=22.2981, longitude=113.9681, zoom=13, pitch=20),
+            tooltip={'html': '{id}<br>{field_name}: <b>{' + summary_name + '_value}</b>'},
+            layers=[pydeck.Layer(
+                type='ScatterplotLayer',
+                data=plotdata_df.loc[plotdata_df['field_name'] == field_name].dropna(subset=[summary_name + '_value']),
+                get_position='coordinates',
+                get_fill_color=summary_name + '_colour',
+                get_line_color=[0, 0, 0],
+                pickable=True,
+                opacity=0.8,
+                stroked=True,
+                filled=True,
+                get_radius=5
+            )]
+        ))
+    return decks
+
+
+def benchmarkPlotPayloads(num_instruments: int = 10000, num_fields: int = 5, readings_per_instrument: int = 48) -> dict:
+    import inputs
+    import processes
+    import outputs
+    from unittest import mock
+    instruments = syntheticIMCPairs(num_pairs=num_instruments // 2, readings_per_instrument=readings_per_instrument, num_fields=num_fields)
+    rng = np.random.default_rng(0)
+    for instrument in instruments.values():
+        instrument.easting, instrument.northing = 816500 + rng.uniform(-2000, 2000), 811700 + rng.uniform(-3000, 3000)
+    reviewlevels_df = inputs.buildReviewLevelTable(syntheticReviewLevels(instruments).itertuples(index=False, name=None))
+    report_period = (datetime.date(2024, 1, 3), datetime.date(2024, 1, 12))
+    store = processes.buildReadingsStore(instruments)
+    summary_df = processes.summariseReadings(store, report_period)
+    plotdata_df = processes.collatePlotData(
+        instruments=instruments,
+        summary_df=summary_df,
+        imc_df=processes.compareIMCReadings(store, instruments, report_period, imc_maxdatediff=1),
+        exceedance_df=processes.classifyExceedances(store, reviewlevels_df, processes.summaryStartDates(summary_df), report_period, period_exceedances=True),
+        reviewlevels_df=reviewlevels_df
+    )
+    field_names = plotdata_df['field_name'].unique().tolist()
+    plotdata_df = outputs.assignColourScales(processes.hk1980_to_latlong(plotdata_df), field_names)
+    legacy_df = plotdata_df.assign(**{summary_name + '_colour': list(zip(*[plotdata_df[summary_name + '_colour_' + channel] for channel in outputs.COLOUR_CHANNELS]))
+                                      for summary_name in outputs.SUMMARY_NAMES})
+
+    timings = {'legacy_bytes': 0, 'partitioned_bytes': 0}
+    started = time.perf_counter()
+    for field_name in field_names:
+        timings['legacy_bytes'] += sum(len(deck.to_json()) for deck in legacyPlotDecks(legacy_df, field_name))
+    timings['legacy'] = time.perf_counter() - started
+
+    # Render the decks without a Streamlit session, capturing the JSON sent to the browser on a first draw and a rerun
+    started = time.perf_counter()
+    payloads = outputs.partitionPlotData(plotdata_df, field_names)
+    timings['partition'] = time.perf_counter() - started
+    with mock.patch.object(outputs.st, 'pydeck_chart', side_effect=lambda deck: timings.__setitem__('partitioned_bytes', timings['partitioned_bytes'] + len(deck.to_json()))), \
+            mock.patch.object(outputs.st, 'caption'), mock.patch.object(outputs.st, 'markdown'):
+        for label in ['partitioned', 'rerun']:
+            timings['partitioned_bytes'] = 0
+            started = time.perf_counter()
+            for field_name, plot_payload in payloads.items():
+                outputs.plotChart(plot_payload, field_name, summary_index=0)
+            timings[label] = time.perf_counter() - started
+
+    timings['partitioned_points'] = sum(len(plot_payload['layers'][0]['data']) for plot_payload in payloads.values())
+    print('Serialised maps of {:,} fields of {:,} instruments: legacy {:.2f} s and {:,.1f} MB, partitioned {:.2f} s and {:,.1f} MB ({:.0f} bytes per point) after partitioning once in {:.2f} s, rerun {:.3f} s'.format(
+        len(field_names), num_instruments, timings['legacy'], timings['legacy_bytes'] / 1e6, timings['partitioned'], timings['partitioned_bytes'] / 1e6,
+        timings['partitioned_bytes'] / timings['partitioned_points'], timings['partition'], timings['rerun']))
+
+    return timings
+
+
+def syntheticInclinometers(
+        num_strings: int = 100,
+        sensors_per_string: int = 200,
+        readings_per_instrument: int = 48,
+        seed: int = 0
+    ) -> dict:
+    # Inclinometer strings, each a parent with a bearing and children reading cumulative A and B displacements
+    import classes
+    import processes
+    rng = np.random.default_rng(seed)
+    timestamps = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.arange(readings_per_instrument) * 15, unit='min')
+    instruments = {}
+    for string_index in range(num_strings):
+        parent_id = '1201/A/IW/{:04d}'.format(string_index)
+        instruments[parent_id] = classes.instrument(id=parent_id)
+        instruments[parent_id].type = 'IW'
+        instruments[parent_id].bearing = rng.uniform(0, 360)
+        easting, northing = 816500 + rng.uniform(-2000, 2000), 811700 + rng.uniform(-3000, 3000)
+        for sensor_index in range(sensors_per_string):
+            child_id = '{}/{:03d}'.format(parent_id, sensor_index)
+            child = instruments[child_id] = classes.instrument(id=child_id)
+            child.type, child.parents, child.contract, child.site = 'IW', [parent_id], '1201', 'A'
+            child.easting, child.northing, child.instrument_level = easting, northing, 5 - 0.5 * sensor_index
+            displacements = np.cumsum(rng.normal(0, 0.1, size=(readings_per_instrument, 2)), axis=0)
+            displacements[rng.random(size=displacements.shape) < 0.02] = np.nan
+            child.readings = pd.DataFrame({
+                'Timestamp': timestamps,
+                processes.INCLINOMETER_DISPLACEMENT_FIELDS['A']: displacements[:, 0],
+                processes.INCLINOMETER_DISPLACEMENT_FIELDS['B']: displacements[:, 1]
+            })
+    return instruments
+
+
+def benchmarkInclinometers(num_strings: int = 100, sensors_per_string: int = 200, readings_per_instrument: int = 48) -> dict:
+    import processes
+    instruments = syntheticInclinometers(num_strings=num_strings, sensors_per_string=sensors_per_string, readings_per_instrument=readings_per_instrument)
+    report_period = (datetime.date(2024, 1, 1), datetime.date(2024, 1, 1))
+    store = processes.buildReadingsStore(instruments)
+
+    timings = {}
+    started = time.perf_counter()
+    ne_store = processes.rotateABToNE(store, instruments, ['IW'])
+    processes.collateInclinometerVectors(instruments, processes.summaryTable(ne_store, report_period))
+    timings['vectors'] = time.perf_counter() - started
+    print('Built vectors of {:,} inclinometer sensors in {:.3f} s'.format(num_strings * sensors_per_string, timings['vectors']))
+
+    return timings
+
+
+def runPipeline(
+        scale: float,
+        latency: float = 0,
+        max_url_length: int = None,
+        readings_per_instrument: int = mockapi.PROJECT_READINGS_PER_INSTRUMENT
+    ) -> dict:
+    """
+    **runPipeline** Runs the whole download and analysis pipeline against a mock API serving a scaled synthetic project
+
+    Returns the wall time of each stage, the total and the peak resident memory. Run it in a fresh process, as
+    benchmarkPipeline does, so that the peak memory belongs to this scale alone.
+    """
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+    import client
+    import inputs
+    import processes
+    warnings.simplefilter('ignore', category=pd.errors.SettingWithCopyWarning)
+
+    project = mockapi.SyntheticProject(
+        num_instruments=int(mockapi.PROJECT_INSTRUMENTS * scale),
+        readings_per_instrument=readings_per_instrument
+    )
+    server, url = mockapi.startMockServer(project=project, latency=latency, max_url_length=max_url_length)
+    client.setClient(url)
+    report_period = ((project.end_date - datetime.timedelta(days=7)).date(), (project.end_date - datetime.timedelta(days=1)).date())
+
+    timings = {}
+    started = time.perf_counter()
+
+    def stage(name: str, function, **kwargs):
+        stage_started = time.perf_counter()
+        result = function(**kwargs)
+        timings[name] = time.perf_counter() - stage_started
+        return result
+
+    api_key = stage('login', inputs.apiKey, username='benchmark', password='benchmark')
+    types = stage('types', inputs.getInstrumentTypes, api_key=api_key)
+    subtypes = stage('subtypes', inputs.getInstrumentSubTypes, type_list=types, api_key=api_key)
+    instruments = stage('setup', inputs.getInstrumentSetup, subtype_list=subtypes, imc_cc_selection=['IMC', 'Contractor'], api_key=api_key)
+    instruments = stage('parent_child', inputs.getParentChildRelationships, instruments=instruments, api_key=api_key)
+    instruments = stage('imc_pairing', inputs.identifyIMCPairing, instruments=instruments)
+    instruments = stage('download_readings', inputs.getInstrumentReadings, instruments=instruments, report_period=report_period, buffer_start=3, api_key=api_key, use_cache=False)
+    reviewlevels_df = stage('review_levels', inputs.getReviewLevelTable, instruments=instruments, api_key=api_key)
+    store = stage('readings_store', processes.buildReadingsStore, instruments=instruments)
+    summary_df = stage('summary', processes.summariseReadings, store=store, report_period=report_period)
+    exceedance_df = stage('exceedance', processes.classifyExceedances, store=store, reviewlevels_df=reviewlevels_df, start_dates=processes.summaryStartDates(summary_df), report_period=report_period, period_exceedances=True)
+    imc_df = stage('imc_comparison', processes.compareIMCReadings, store=store, instruments=instruments, report_period=report_period, imc_maxdatediff=3)
+    plotdata_df = stage('plot_data', processes.collatePlotData, instruments=instruments, summary_df=summary_df, imc_df=imc_df, exceedance_df=exceedance_df, reviewlevels_df=reviewlevels_df)
+    stage('appendix_f', processes.collateAppendixF, all_data=plotdata_df)
+    stage('appendix_g', processes.collateAppendixG, all_data=plotdata_df)
+
+    timings['total'] = time.perf_counter() - started
+    timings['instruments'] = len(instruments)
+    timings['readings'] = sum(len(instrument.readings) for instrument in instruments.values() if instrument.readings is not None)
+    timings['requests'] = server.request_count
+    timings['peak_memory_mib'] = status.peakMemory()
+    mockapi.stopMockServer(server)
+
+    return timings
+
+
+def benchmarkPipeline(
+        scales: list = [1, 10, 100],
+        latency: float = 0,
+        max_url_length: int = None,
+        readings_per_instrument: int = mockapi.PROJECT_READINGS_PER_INSTRUMENT
+    ) -> dict:
+    # Each scale runs in its own process with its own cache directory, so neither memory nor cached data carry over
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for scale in scales:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            os.environ['LPP_CACHE_DIR'] = cache_dir
+            with context.Pool(processes=1) as pool:
+                results[scale] = pool.apply(runPipeline, (scale, latency, max_url_length, readings_per_instrument))
+        print('{}x: {:,} instruments, {:,} readings, {:,} requests in {:.1f} s, peak memory {:,.0f} MiB ({})'.format(
+            scale,
+            results[scale]['instruments'],
+            results[scale]['readings'],
+            results[scale]['requests'],
+            results[scale]['total'],
+            results[scale]['peak_memory_mib'],
+            ', '.join('{} {:.2f} s'.format(name, seconds) for name, seconds in results[scale].items()
+                      if name not in ['total', 'instruments', 'readings', 'requests', 'peak_memory_mib'])
+        ))
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the LPP reporting pipeline')
+    parser.add_argument('benchmark', nargs='?', choices=['normalisation', 'summary', 'imc', 'exceedance', 'plotdata', 'appendices', 'coordinates', 'colours', 'maps', 'inclinometers', 'pipeline'], default='normalisation')
+    parser.add_argument('--readings', type=int, default=1000000, help='Number of readings in the synthetic normalisation payload')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--instruments', type=int, default=10000, help='Number of instruments in the synthetic processing benchmarks')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100], help='Multiples of the current project size to run the pipeline at')
+    parser.add_argument('--readings-per-instrument', type=int, default=mockapi.PROJECT_READINGS_PER_INSTRUMENT)
+    parser.add_argument('--latency', type=float, default=0, help='Seconds the mock API waits before each response')
+    parser.add_argument('--max-url-length', type=int, default=None, help='Mock API answers HTTP 414 to longer requests')
+    arguments = parser.parse_args()
+
+    match arguments.benchmark:
+        case 'normalisation':
+            benchmarkNormalisation(num_readings=arguments.readings, repeats=arguments.repeats)
+        case 'summary':
+            benchmarkSummary(num_instruments=arguments.instruments)
+        case 'exceedance':
+            benchmarkExceedance(num_instruments=arguments.instruments)
+        case 'plotdata':
+            benchmarkPlotData(num_instruments=arguments.instruments)
+        case 'appendices':
+            benchmarkAppendices(num_instruments=arguments.instruments)
+        case 'coordinates':
+            benchmarkCoordinates(num_instruments=arguments.instruments)
+        case 'colours':
+            benchmarkColourScales(num_instruments=arguments.instruments)
+        case 'maps':
+            benchmarkPlotPayloads(num_instruments=arguments.instruments)
+        case 'inclinometers':
+            benchmarkInclinometers(num_strings=max(arguments.instruments // 200, 1))
+        case 'imc':
+            benchmarkIMCComparison(num_pairs=arguments.instruments // 2)
+        case 'pipeline':
+            benchmarkPipeline(
+                scales=arguments.scales,
+                latency=arguments.latency,
+                max_url_length=arguments.max_url_length,
+                readings_per_instrument=arguments.readings_per_instrument
+            )
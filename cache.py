@@ -0,0 +1,324 @@
+import pandas as pd
+import numpy as np
+import requests as rq
+import sqlite3
+import collections
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from client import LppApiClient
+
+# Local store for readings already downloaded from the API. Override the location with the LPP_CACHE_DIR environment variable.
+CACHE_DIR = os.environ.get('LPP_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache'))
+READINGS_CACHE_PATH = os.path.join(CACHE_DIR, 'readings.sqlite')
+METADATA_CACHE_PATH = os.path.join(CACHE_DIR, 'metadata.sqlite')
+# Seconds for which instrument types, sub-types and set-up are used without asking the API whether they have changed
+METADATA_TTL = 12 * 60 * 60
+# Review levels are revalidated on every Get data, so that a trigger level changed on the server is reported at once
+REVIEW_LEVELS_TTL = 0
+# Readings for the most recent days may still be uploaded, so they are never marked as covered
+COVERAGE_LAG = datetime.timedelta(days=1)
+# Instrument IDs bound to one query, well under SQLite's limit on variables per statement
+INSTRUMENTS_PER_QUERY = 500
+
+
+def openCache(path: str = READINGS_CACHE_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=60)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript('''
+        CREATE TABLE IF NOT EXISTS readings (
+            instrument_id TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            field TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (instrument_id, timestamp, field)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS readings_timestamp ON readings (timestamp);
+        CREATE TABLE IF NOT EXISTS coverage (
+            instrument_id TEXT NOT NULL,
+            from_timestamp INTEGER NOT NULL,
+            to_timestamp INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS coverage_instrument ON coverage (instrument_id);
+    ''')
+    return connection
+
+
+def toEpoch(date: datetime.datetime) -> int:
+    return int((date - datetime.datetime(1970, 1, 1)).total_seconds())
+
+
+def fromEpoch(seconds: int) -> datetime.datetime:
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=int(seconds))
+
+
+def queryInstruments(connection: sqlite3.Connection, query: str, instrument_ids: list, params: tuple = ()) -> pd.DataFrame:
+    """
+    **queryInstruments** Runs a query for the given instruments only, in chunks of INSTRUMENTS_PER_QUERY instruments
+
+    The query has one {} placeholder, which is filled with the variables of an IN (...) list of instrument IDs bound
+    ahead of params, so that SQLite looks up only the selected instruments on its instrument index.
+    """
+    instrument_ids = list(dict.fromkeys(instrument_ids))
+    chunks = [instrument_ids[index:index + INSTRUMENTS_PER_QUERY] for index in range(0, len(instrument_ids), INSTRUMENTS_PER_QUERY)] or [[]]
+    return pd.concat([
+        pd.read_sql_query(query.format(', '.join(['?'] * len(chunk))), connection, params=tuple(chunk) + tuple(params))
+        for chunk in chunks
+    ], ignore_index=True)
+
+
+def readCoverage(connection: sqlite3.Connection, instrument_ids: list) -> dict:
+    coverage_df = queryInstruments(
+        connection,
+        'SELECT instrument_id, from_timestamp, to_timestamp FROM coverage WHERE instrument_id IN ({})',
+        instrument_ids
+    )
+    coverage = {instrument_id: [] for instrument_id in instrument_ids}
+    for instrument_id, from_timestamp, to_timestamp in coverage_df.itertuples(index=False):
+        coverage[instrument_id].append((from_timestamp, to_timestamp))
+    return coverage
+
+
+def mergeIntervals(intervals: list) -> list:
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def findMissingRanges(
+        connection: sqlite3.Connection,
+        instrument_ids: list,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime
+    ) -> list:
+    """
+    **findMissingRanges** Finds the date ranges not yet held in the cache, grouping instruments which miss the same ranges
+
+    Returns a list of (instrument IDs, start date, end date) tuples ready to pass to download.downloadReadingRanges.
+    """
+    start, end = toEpoch(start_date), toEpoch(end_date)
+    groups = {}
+    for instrument_id, intervals in readCoverage(connection, instrument_ids).items():
+        gaps = []
+        cursor = start
+        for interval_start, interval_end in mergeIntervals(intervals):
+            if interval_end <= cursor or interval_start >= end:
+                continue
+            if interval_start > cursor:
+                gaps.append((cursor, interval_start))
+            cursor = max(cursor, interval_end)
+        if cursor < end:
+            gaps.append((cursor, end))
+        for gap in gaps:
+            groups.setdefault(gap, []).append(instrument_id)
+
+    return [(ids, fromEpoch(gap_start), fromEpoch(gap_end)) for (gap_start, gap_end), ids in sorted(groups.items())]
+
+
+def storeReadings(
+        connection: sqlite3.Connection,
+        readings: dict,
+        ranges: list
+    ):
+    """
+    **storeReadings** Writes downloaded readings to the cache and records the ranges they cover
+
+    :param readings: Readings dataframes keyed by instrument ID
+    :type dict:
+    :param ranges: The (instrument IDs, start date, end date) ranges which were downloaded, including instruments without readings
+    :type list:
+    """
+    rows = []
+    for instrument_id, data_df in readings.items():
+        long_df = data_df.melt(id_vars='Timestamp', var_name='field', value_name='value')
+        long_df['value'] = long_df['value'].astype(float).replace({np.nan: None})
+        timestamps = long_df['Timestamp'].values.astype('datetime64[s]').astype(np.int64)
+        rows.extend(zip([instrument_id] * len(long_df), timestamps.tolist(), long_df['field'], long_df['value']))
+
+    covered_until = toEpoch(datetime.datetime.now() - COVERAGE_LAG)
+    with connection:
+        connection.executemany('INSERT OR REPLACE INTO readings VALUES (?, ?, ?, ?)', rows)
+        for instrument_ids, start_date, end_date in ranges:
+            start, end = toEpoch(start_date), min(toEpoch(end_date), covered_until)
+            if end <= start:
+                continue
+            connection.executemany('INSERT INTO coverage VALUES (?, ?, ?)', [(instrument_id, start, end) for instrument_id in instrument_ids])
+
+        # Keep one row per contiguous covered interval
+        coverage = readCoverage(connection, list({instrument_id for instrument_ids, _, _ in ranges for instrument_id in instrument_ids}))
+        for instrument_id, intervals in coverage.items():
+            connection.execute('DELETE FROM coverage WHERE instrument_id = ?', (instrument_id,))
+            connection.executemany('INSERT INTO coverage VALUES (?, ?, ?)', [(instrument_id, start, end) for start, end in mergeIntervals(intervals)])
+
+
+def loadReadings(
+        connection: sqlite3.Connection,
+        instrument_ids: list,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime
+    ) -> dict:
+    """
+    **loadReadings** Reads cached readings for the given instruments and period into one dataframe per instrument
+    """
+    long_df = queryInstruments(
+        connection,
+        'SELECT instrument_id, timestamp, field, value FROM readings WHERE instrument_id IN ({}) AND timestamp >= ? AND timestamp <= ?',
+        instrument_ids,
+        params=(toEpoch(start_date), toEpoch(end_date))
+    )
+    # A chunk whose values are all null comes back as objects
+    long_df['value'] = long_df['value'].astype(float)
+    long_df['timestamp'] = pd.to_datetime(long_df['timestamp'], unit='s')
+
+    readings = {}
+    for instrument_id, instrument_df in long_df.groupby('instrument_id', sort=False):
+        data_df = instrument_df.pivot(index='timestamp', columns='field', values='value')
+        data_df.columns.name = None
+        readings[instrument_id] = data_df.rename_axis('Timestamp').reset_index()
+
+    return readings
+
+
+# Metadata responses held in memory are shared by every session in the server process. The least recently used are
+# dropped beyond METADATA_ENTRIES, to be read back from disk if needed again, and a key's lock lives only while a
+# request for it is in flight.
+METADATA_ENTRIES = 256
+_metadata = collections.OrderedDict()
+_metadata_locks = {}
+_metadata_lock = threading.Lock()
+
+
+def openMetadataCache(path: str = METADATA_CACHE_PATH) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=60)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('''
+        CREATE TABLE IF NOT EXISTS metadata (
+            key TEXT PRIMARY KEY,
+            body BLOB NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+    return connection
+
+
+def metadataKey(url: str, method: str, endpoint: str, params: dict = None, data: dict = None) -> str:
+    # The key is built from the server and request content only, so that it is the same whichever token makes the request
+    content = json.dumps([url, method.upper(), endpoint, params, data], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def cachedResponse(body: bytes) -> rq.Response:
+    response = rq.Response()
+    response.status_code = 200
+    response._content = body
+    response.encoding = 'utf-8'
+    return response
+
+
+def cachedRequest(
+        client: LppApiClient,
+        method: str,
+        endpoint: str,
+        api_key: str = None,
+        ttl: float = METADATA_TTL,
+        **kwargs
+    ) -> rq.Response:
+    """
+    **cachedRequest** Sends a metadata request through a TTL cache shared by all sessions and persisted to disk
+
+    A fresh entry is returned without contacting the API. A stale entry is revalidated with If-None-Match and
+    If-Modified-Since, and kept if the API answers 304. Only one request per key is in flight at a time, so
+    simultaneous sessions wait for the same fetch. Responses other than 200 and 304 are returned uncached.
+    """
+    if not api_key:
+        return client.request(method, endpoint, api_key=api_key, **kwargs)
+
+    key = metadataKey(client.url, method, endpoint, kwargs.get('params'), kwargs.get('data'))
+    with _metadata_lock:
+        key_lock = _metadata_locks.setdefault(key, {'lock': threading.Lock(), 'users': 0})
+        key_lock['users'] += 1
+
+    try:
+        with key_lock['lock']:
+            return revalidatedRequest(client, method, endpoint, api_key, ttl, key, **kwargs)
+    finally:
+        with _metadata_lock:
+            key_lock['users'] -= 1
+            if key_lock['users'] == 0:
+                del _metadata_locks[key]
+
+
+def memoryEntry(key: str, entry: dict = None) -> dict:
+    # Look up, or with entry store, a metadata entry in memory, evicting the least recently used beyond METADATA_ENTRIES
+    with _metadata_lock:
+        if entry is None:
+            entry = _metadata.get(key)
+            if entry is not None:
+                _metadata.move_to_end(key)
+            return entry
+        _metadata[key] = entry
+        _metadata.move_to_end(key)
+        while len(_metadata) > METADATA_ENTRIES:
+            _metadata.popitem(last=False)
+        return entry
+
+
+def revalidatedRequest(
+        client: LppApiClient,
+        method: str,
+        endpoint: str,
+        api_key: str,
+        ttl: float,
+        key: str,
+        **kwargs
+    ) -> rq.Response:
+    # The body of cachedRequest, run while holding the lock of key
+    entry = memoryEntry(key)
+    if entry is None:
+        connection = openMetadataCache()
+        row = connection.execute('SELECT body, etag, last_modified, fetched_at FROM metadata WHERE key = ?', (key,)).fetchone()
+        connection.close()
+        if row is not None:
+            entry = memoryEntry(key, {'body': row[0], 'etag': row[1], 'last_modified': row[2], 'fetched_at': row[3]})
+
+    if entry is not None and time.time() - entry['fetched_at'] < ttl:
+        return cachedResponse(entry['body'])
+
+    headers = kwargs.pop('headers', {})
+    if entry is not None:
+        if entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+    response = client.request(method, endpoint, api_key=api_key, headers=headers, **kwargs)
+
+    if response.status_code == 304 and entry is not None:
+        entry = memoryEntry(key, dict(entry, fetched_at=time.time()))
+    elif response.status_code == 200:
+        entry = memoryEntry(key, {
+            'body': response.content,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time()
+        })
+    else:
+        return response
+
+    connection = openMetadataCache()
+    with connection:
+        connection.execute('INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?, ?)',
+                           (key, entry['body'], entry['etag'], entry['last_modified'], entry['fetched_at']))
+    connection.close()
+
+    return cachedResponse(entry['body'])
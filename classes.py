@@ -1,6 +1,8 @@
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib import cm
+import numpy as np
+import pandas as pd
 
 
 class instrument:
@@ -23,11 +25,6 @@ class instrument:
         self.children = None
         self.date_installed = None
         self.parent_gr_level = None
-        self.end_reading = None
-        self.start_reading = None
-        self.change = None
-        self.max_in_period = None
-        self.min_in_period = None
         self.is_imc = None
         self.imc_id = None
         self.imc_compare_reading = None
@@ -38,6 +35,59 @@ class instrument:
         self.bearing = None
 
 
+class ReadingsStore:
+    """
+    **ReadingsStore** Long-format store of the readings of every instrument in one table
+
+    readings has one row per non-null value with columns instrument_id (categorical), field (categorical),
+    timestamp (int64 nanoseconds) and value (float64), sorted by instrument, timestamp and field. offsets holds the
+    [start, stop) range of rows belonging to each instrument, and fields lists the fields each instrument reports,
+    including fields without any values.
+    """
+    def __init__(self, readings: pd.DataFrame, fields: pd.DataFrame) -> None:
+        self.readings = readings
+        self.fields = fields
+        codes = readings['instrument_id'].cat.codes.to_numpy()
+        categories = np.arange(len(readings['instrument_id'].cat.categories))
+        self.offsets = pd.DataFrame({
+            'start': np.searchsorted(codes, categories, side='left'),
+            'stop': np.searchsorted(codes, categories, side='right')
+        }, index=readings['instrument_id'].cat.categories)
+
+    def instrumentReadings(self, instrument_id: str) -> pd.DataFrame:
+        start, stop = self.offsets.loc[instrument_id]
+        return self.readings.iloc[start:stop]
+
+    def window(self, start=None, end=None) -> pd.DataFrame:
+        # Readings of all instruments with start <= timestamp <= end
+        mask = np.ones(len(self.readings), dtype=bool)
+        if start is not None:
+            mask &= self.readings['timestamp'].to_numpy() >= pd.Timestamp(start).value
+        if end is not None:
+            mask &= self.readings['timestamp'].to_numpy() <= pd.Timestamp(end).value
+        return self.readings.loc[mask]
+
+    def between(self, start=None, end=None) -> 'ReadingsStore':
+        # A store holding only the readings with start <= timestamp <= end, sharing this store's fields. When the window
+        # holds every reading, this store is returned itself rather than a copy.
+        readings = self.window(start, end)
+        if len(readings) == len(self.readings):
+            return self
+        return ReadingsStore(readings=readings.reset_index(drop=True), fields=self.fields)
+
+    def wide(self, instrument_id: str) -> pd.DataFrame:
+        # Rebuild an instrument's readings in the per-instrument layout, with a Timestamp column and a column per field
+        instrument_df = self.instrumentReadings(instrument_id)
+        wide_df = instrument_df.pivot(index='timestamp', columns='field', values='value')
+        wide_df = wide_df.reindex(columns=self.fields.loc[self.fields['instrument_id'] == instrument_id, 'field'].astype(str))
+        wide_df.columns.name = None
+        wide_df.index = pd.to_datetime(wide_df.index)
+        return wide_df.rename_axis('Timestamp').reset_index()
+
+    def memoryUsage(self) -> int:
+        return int(self.readings.memory_usage(deep=True).sum() + self.fields.memory_usage(deep=True).sum())
+
+
 class MPLColorHelper:
   def __init__(self, cmap_name, start_val, stop_val):
     self.cmap_name = cmap_name
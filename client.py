@@ -0,0 +1,119 @@
+import requests as rq
+from requests.adapters import HTTPAdapter
+import os
+import random
+import threading
+import time
+
+# Override the API location with the LPP_API_URL environment variable, e.g. to point at a local stand-in
+API_URL = os.environ.get('LPP_API_URL', 'http://lpp_api.maxwellgeosystems.com')
+POOL_SIZE = 32
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 300
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 30
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+# Methods which can be sent again without changing anything on the server
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS']
+
+
+class LppApiClient:
+    """
+    **LppApiClient** Sends all requests to the LPP API through one pooled, keep-alive session
+
+    Connection and server errors are retried with jittered exponential back-off, for idempotent methods only unless a
+    request says otherwise. Latency, error and byte counters are kept per endpoint and can be read with stats().
+    """
+    def __init__(self, url: str = API_URL, pool_size: int = POOL_SIZE) -> None:
+        self.url = url.rstrip('/')
+        self.session = rq.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+        self.timeout = (CONNECT_TIMEOUT, READ_TIMEOUT)
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, endpoint: str, api_key: str = None, retry: bool = None, **kwargs) -> rq.Response:
+        """
+        **request** Sends a request to an API endpoint, retrying connection and server errors if it may be sent again
+
+        :param retry: Whether to retry the request, by default only if its method is idempotent. Pass True for queries
+        the API takes by POST but which change nothing, and False where the caller retries the request itself.
+        :type bool:
+        """
+        headers = kwargs.pop('headers', {})
+        if api_key:
+            headers['Authorization'] = 'Bearer ' + api_key
+        kwargs.setdefault('timeout', self.timeout)
+        max_attempts = MAX_ATTEMPTS if (method.upper() in IDEMPOTENT_METHODS if retry is None else retry) else 1
+
+        for attempt in range(max_attempts):
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, '{}/{}'.format(self.url, endpoint), headers=headers, **kwargs)
+            except (rq.ConnectionError, rq.Timeout):
+                self._count(endpoint, time.perf_counter() - started, 0, error=True)
+                if attempt == max_attempts - 1:
+                    raise
+            else:
+                retry_status = response.status_code in RETRY_STATUS_CODES
+                # Reading the content of a streamed response here would defeat the streaming, so rely on its header
+                num_bytes = int(response.headers.get('Content-Length', 0)) if kwargs.get('stream') else len(response.content)
+                self._count(endpoint, time.perf_counter() - started, num_bytes, error=retry_status)
+                if not retry_status or attempt == max_attempts - 1:
+                    return response
+                response.close()
+            # Full jitter: sleep for a random time up to the exponential back-off
+            time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+
+    def get(self, endpoint: str, api_key: str = None, retry: bool = None, **kwargs) -> rq.Response:
+        return self.request('GET', endpoint, api_key=api_key, retry=retry, **kwargs)
+
+    def post(self, endpoint: str, api_key: str = None, retry: bool = None, **kwargs) -> rq.Response:
+        return self.request('POST', endpoint, api_key=api_key, retry=retry, **kwargs)
+
+    def _count(self, endpoint: str, seconds: float, num_bytes: int, error: bool) -> None:
+        with self._lock:
+            counter = self._counters.setdefault(endpoint, {
+                'requests': 0,
+                'errors': 0,
+                'seconds': 0.0,
+                'max_seconds': 0.0,
+                'bytes': 0
+            })
+            counter['requests'] += 1
+            counter['errors'] += int(error)
+            counter['seconds'] += seconds
+            counter['max_seconds'] = max(counter['max_seconds'], seconds)
+            counter['bytes'] += num_bytes
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {endpoint: dict(counter) for endpoint, counter in self._counters.items()}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def getClient() -> LppApiClient:
+    # One client per server process, so that all sessions and threads share its connection pool
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LppApiClient()
+        return _client
+
+
+def setClient(url: str = API_URL) -> LppApiClient:
+    # Point every subsequent API call in this process at another server, e.g. mockapi for benchmarks
+    global _client
+    with _client_lock:
+        _client = LppApiClient(url=url)
+        return _client
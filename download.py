@@ -0,0 +1,450 @@
+import pandas as pd
+import numpy as np
+import json
+import requests as rq
+import datetime
+import time
+import codecs
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from urllib.parse import quote_plus
+from client import LppApiClient
+import cache
+
+# Defaults for the readings download engine. All of them can be overridden per call.
+MAX_WORKERS = 8
+INSTRUMENTS_PER_CHUNK = 50
+DAYS_PER_CHUNK = 7
+MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+# Longest request URL, in characters, to plan query chunks for. Servers commonly reject anything over 8 KiB with a 414.
+MAX_URL_LENGTH = 8000
+# Bytes read from a streamed response at a time
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+def iterJSONObject(byte_chunks, encoding: str = 'utf-8'):
+    """
+    **iterJSONObject** Yields the (key, value) pairs of a streamed top-level JSON object one at a time
+
+    Only the text of the value being decoded is held in memory, so a large response can be consumed while it arrives.
+    A response which is not a JSON object is decoded whole and yields nothing unless it turns out to be a dictionary.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    byte_chunks = iter(byte_chunks)
+    buffer = ''
+    position = 0
+    pending = []
+    exhausted = False
+
+    def fill() -> bool:
+        # Queue the text of the next chunk, which is only joined onto the buffer when it is needed
+        nonlocal exhausted
+        for byte_chunk in byte_chunks:
+            if byte_chunk:
+                pending.append(text_decoder.decode(byte_chunk))
+                return True
+        pending.append(text_decoder.decode(b'', final=True))
+        exhausted = True
+        return False
+
+    def join() -> None:
+        # Drop text which has already been consumed and append the queued text, in one copy
+        nonlocal buffer, position
+        if pending:
+            buffer = ''.join([buffer[position:]] + pending)
+            pending.clear()
+            position = 0
+
+    def skipWhitespace() -> str:
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if exhausted and not pending:
+                return ''
+            if not exhausted:
+                fill()
+            join()
+
+    def decodeNext():
+        nonlocal position
+        while True:
+            available = len(buffer) - position
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(buffer) or exhausted:
+                    position = end
+                    return value
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            # Queue at least as much text again as is waiting before joining and trying again. The text of a long
+            # value then doubles with each attempt, so it is joined and scanned a logarithmic number of times and
+            # the copying adds up to a small multiple of its length.
+            queued = 0
+            while queued < max(available, 1) and fill():
+                queued += len(pending[-1])
+            join()
+
+    if skipWhitespace() != '{':
+        while fill():
+            pass
+        join()
+        remainder = json.loads(buffer[position:]) if buffer[position:].strip() else None
+        if isinstance(remainder, dict):
+            yield from remainder.items()
+        return
+
+    position += 1
+    while True:
+        character = skipWhitespace()
+        if character == ',':
+            position += 1
+            continue
+        if character in ['}', '']:
+            return
+        key = decodeNext()
+        if skipWhitespace() != ':':
+            raise ValueError('Expected ":" after key {} in JSON object'.format(key))
+        position += 1
+        skipWhitespace()
+        yield key, decodeNext()
+
+
+def toFloat(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def toFloatColumn(values: np.ndarray) -> np.ndarray:
+    # Blank and null values become NaN. Anything else float() cannot read is coerced to NaN as well, more slowly.
+    values = values.copy()
+    values[values == ''] = None
+    try:
+        return values.astype(np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter(map(toFloat, values), dtype=np.float64, count=len(values))
+
+
+def toTimestampColumn(timestamps: list) -> np.ndarray:
+    # Timestamps are returned in the fixed ISO format %Y-%m-%d %H:%M:%S, which NumPy parses directly
+    try:
+        return np.array(timestamps, dtype='datetime64[s]').astype('datetime64[ns]')
+    except ValueError:
+        return pd.to_datetime(timestamps, format='%Y-%m-%d %H:%M:%S').to_numpy(dtype='datetime64[ns]')
+
+
+def columnariseReadings(data_dict: dict) -> pd.DataFrame:
+    """
+    **columnariseReadings** Converts one instrument's readings, keyed by timestamp, into a dataframe
+
+    Readings are normalised a column at a time into typed buffers, which the dataframe then uses without copying:
+    one fixed-format conversion of all timestamps and one numeric coercion per field. Readings in which every field
+    given, other than Easting and Northing, is blank are skipped. Fields given as null count as values, as they
+    always have, so such readings are kept with NaN values. Fields missing from a reading are NaN.
+    """
+    readings = list(data_dict.values())
+    field_names = list(dict.fromkeys(field_name for reading in readings for field_name in reading))
+    # Missing fields are read as blank, which neither keeps a reading nor is a number
+    columns = {field_name: np.array([reading.get(field_name, '') for reading in readings], dtype=object) for field_name in field_names}
+    keep = np.zeros(len(readings), dtype=bool)
+    for field_name, values in columns.items():
+        if field_name not in ['Easting', 'Northing']:
+            keep |= values != ''
+    if not keep.any():
+        return pd.DataFrame()
+
+    # Fields in the order they first appear in the readings kept
+    data = {'Timestamp': toTimestampColumn(list(data_dict.keys()))[keep]}
+    for field_name in dict.fromkeys(field_name for reading, kept in zip(readings, keep.tolist()) if kept for field_name in reading):
+        data[field_name] = toFloatColumn(columns[field_name][keep])
+
+    return pd.DataFrame(data, copy=False)
+
+
+def parseReadings(readings_items) -> dict:
+    """
+    **parseReadings** Converts a response from /api/get_instrument_data into one readings dataframe per instrument
+
+    :param readings_items: Decoded JSON response, keyed by instrument ID then timestamp, or an iterable of its items
+    :type dict:
+    """
+    if isinstance(readings_items, dict):
+        readings_items = readings_items.items()
+    elif not hasattr(readings_items, '__iter__') or isinstance(readings_items, (str, list)):
+        return {}
+
+    readings = {}
+    for name, data_dict in readings_items:
+        if name == 'comment' or not isinstance(data_dict, dict):
+            continue
+        data_df = columnariseReadings(data_dict)
+        if not data_df.empty:
+            readings[name] = data_df
+
+    return readings
+
+
+def planReadingChunks(
+        instrument_ids: list,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+        instruments_per_chunk: int = INSTRUMENTS_PER_CHUNK,
+        days_per_chunk: int = DAYS_PER_CHUNK
+    ) -> list:
+    """
+    **planReadingChunks** Splits a readings download into pieces of at most instruments_per_chunk instruments and days_per_chunk days
+
+    Date windows abut, so a reading stamped exactly on a boundary may be returned by both neighbouring pieces. The
+    duplicate is dropped when the pieces are merged.
+    """
+    instrument_batches = [instrument_ids[i:i + instruments_per_chunk] for i in range(0, len(instrument_ids), max(instruments_per_chunk, 1))]
+
+    date_windows = []
+    window_start = start_date
+    while window_start < end_date:
+        window_end = min(window_start + datetime.timedelta(days=max(days_per_chunk, 1)), end_date)
+        date_windows.append((window_start, window_end))
+        window_start = window_end
+
+    return [(batch, window_start, window_end) for batch in instrument_batches for window_start, window_end in date_windows]
+
+
+def fetchReadingChunk(
+        client: LppApiClient,
+        api_key: str,
+        chunk: tuple
+    ) -> tuple:
+    batch, window_start, window_end = chunk
+    # downloadReadingRanges retries failed chunks in rounds, so the client sends each attempt once
+    response = client.post('api/get_instrument_data',
+                           api_key=api_key,
+                           retry=False,
+                           stream=True,
+                           data={'instruments': ','.join(batch),
+                                 'from_date': window_start.strftime('%Y-%m-%d %H:%M:%S'),
+                                 'to_date': window_end.strftime('%Y-%m-%d %H:%M:%S')
+                           })
+    with response:
+        response.raise_for_status()
+        num_bytes = 0
+
+        def countBytes(byte_chunks):
+            nonlocal num_bytes
+            for byte_chunk in byte_chunks:
+                num_bytes += len(byte_chunk)
+                yield byte_chunk
+
+        # Parse each instrument as soon as its readings have arrived, rather than holding the whole response
+        readings = parseReadings(iterJSONObject(
+            countBytes(response.iter_content(chunk_size=STREAM_CHUNK_SIZE)),
+            encoding=response.encoding or 'utf-8'
+        ))
+
+    return readings, num_bytes
+
+
+def mergeReadings(partial_readings: list) -> dict:
+    # Gather the pieces belonging to each instrument, then stitch them together in time order
+    pieces = {}
+    for readings in partial_readings:
+        for name, data_df in readings.items():
+            pieces.setdefault(name, []).append(data_df)
+
+    merged = {}
+    for name, data_dfs in pieces.items():
+        if len(data_dfs) == 1:
+            merged[name] = data_dfs[0]
+            continue
+        merged[name] = pd.concat(data_dfs, ignore_index=True) \
+            .drop_duplicates(subset='Timestamp', keep='last') \
+            .sort_values(by='Timestamp', kind='stable') \
+            .reset_index(drop=True)
+
+    return merged
+
+
+def downloadReadings(
+        instrument_ids: list,
+        start_date: datetime.datetime,
+        end_date: datetime.datetime,
+        client: LppApiClient,
+        api_key: str,
+        max_workers: int = MAX_WORKERS,
+        instruments_per_chunk: int = INSTRUMENTS_PER_CHUNK,
+        days_per_chunk: int = DAYS_PER_CHUNK,
+        max_retries: int = MAX_RETRIES
+    ) -> tuple:
+    """
+    **downloadReadings** Downloads readings in instrument and date chunks on a bounded thread pool
+
+    Only chunks which fail are retried, for up to max_retries further rounds with an increasing back-off.
+    Returns a dictionary of readings dataframes keyed by instrument ID and a dictionary of throughput statistics.
+    """
+    return downloadReadingRanges(
+        ranges=[(instrument_ids, start_date, end_date)],
+        client=client,
+        api_key=api_key,
+        max_workers=max_workers,
+        instruments_per_chunk=instruments_per_chunk,
+        days_per_chunk=days_per_chunk,
+        max_retries=max_retries
+    )
+
+
+def downloadReadingRanges(
+        ranges: list,
+        client: LppApiClient,
+        api_key: str,
+        max_workers: int = MAX_WORKERS,
+        instruments_per_chunk: int = INSTRUMENTS_PER_CHUNK,
+        days_per_chunk: int = DAYS_PER_CHUNK,
+        max_retries: int = MAX_RETRIES
+    ) -> tuple:
+    """
+    **downloadReadingRanges** Downloads several (instrument IDs, start date, end date) ranges through one thread pool
+    """
+    chunks = [chunk for instrument_ids, start_date, end_date in ranges
+              for chunk in planReadingChunks(
+                  instrument_ids=instrument_ids,
+                  start_date=start_date,
+                  end_date=end_date,
+                  instruments_per_chunk=instruments_per_chunk,
+                  days_per_chunk=days_per_chunk
+              )]
+    stats = {
+        'chunks': len(chunks),
+        'retries': 0,
+        'bytes': 0,
+        'readings': 0,
+        'seconds': 0.0
+    }
+    started = time.perf_counter()
+
+    partial_readings = []
+    pending = chunks
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        for attempt in range(max_retries + 1):
+            if attempt:
+                stats['retries'] += len(pending)
+                time.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+            futures = {executor.submit(fetchReadingChunk, client, api_key, chunk): chunk for chunk in pending}
+            failed = []
+            for future in as_completed(futures):
+                try:
+                    readings, num_bytes = future.result()
+                except (rq.RequestException, ValueError):
+                    failed.append(futures[future])
+                    continue
+                partial_readings.append(readings)
+                stats['bytes'] += num_bytes
+            pending = failed
+            if not pending:
+                break
+
+    if pending:
+        raise RuntimeError('{} of {} readings chunks failed after {} retries'.format(len(pending), len(chunks), max_retries))
+
+    readings = mergeReadings(partial_readings)
+    stats['readings'] = sum(len(data_df) for data_df in readings.values())
+    stats['seconds'] = time.perf_counter() - started
+
+    return readings, stats
+
+
+def planQueryChunks(
+        request_url: str,
+        instrument_ids: list,
+        param: str = 'instruments',
+        max_url_length: int = MAX_URL_LENGTH
+    ) -> list:
+    """
+    **planQueryChunks** Packs instrument IDs into as few GET query strings as fit within max_url_length
+
+    :param request_url: Endpoint URL without a query string
+    :type str:
+    :param instrument_ids: IDs to be joined with commas into the query parameter named param
+    :type list:
+    """
+    # Length of "<url>?<param>=" before any IDs are added. Each extra ID costs its encoded length plus an encoded comma.
+    base_length = len(request_url) + len(quote_plus(param)) + 2
+    separator_length = len(quote_plus(','))
+
+    chunks = []
+    chunk = []
+    chunk_length = base_length
+    for instrument_id in instrument_ids:
+        id_length = len(quote_plus(instrument_id)) + (separator_length if chunk else 0)
+        if chunk and chunk_length + id_length > max_url_length:
+            chunks.append(chunk)
+            chunk = []
+            chunk_length = base_length
+            id_length -= separator_length
+        chunk.append(instrument_id)
+        chunk_length += id_length
+    if chunk:
+        chunks.append(chunk)
+
+    return chunks
+
+
+def fetchQueryChunk(
+        client: LppApiClient,
+        endpoint: str,
+        api_key: str,
+        chunk: list,
+        cached: bool = False
+    ) -> rq.Response:
+    if cached:
+        return cache.cachedRequest(client, 'GET', endpoint,
+                                   api_key=api_key,
+                                   params={'instruments': ','.join(chunk)})
+    return client.get(endpoint,
+                      api_key=api_key,
+                      params={'instruments': ','.join(chunk)})
+
+
+def fetchChunked(
+        client: LppApiClient,
+        endpoint: str,
+        api_key: str,
+        instrument_ids: list,
+        max_workers: int = MAX_WORKERS,
+        max_url_length: int = MAX_URL_LENGTH,
+        cached: bool = False
+    ) -> dict:
+    """
+    **fetchChunked** Requests a GET endpoint for a list of instruments in concurrent, URL-length-sized chunks
+
+    A chunk rejected with HTTP 414 is split in two and only its halves are requested again. The decoded JSON
+    objects of all chunks are merged into one dictionary. With cached set, chunks go through the metadata cache.
+    """
+    request_url = '{}/{}'.format(client.url, endpoint)
+    merged = {}
+    if not instrument_ids:
+        return merged
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = {executor.submit(fetchQueryChunk, client, endpoint, api_key, chunk, cached): chunk
+                   for chunk in planQueryChunks(request_url, instrument_ids, max_url_length=max_url_length)}
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk = futures.pop(future)
+                response = future.result()
+                if response.status_code == 414:
+                    if len(chunk) == 1:
+                        raise RuntimeError('{} rejected the request for instrument {} as too long'.format(endpoint, chunk[0]))
+                    for half in [chunk[:len(chunk) // 2], chunk[len(chunk) // 2:]]:
+                        futures[executor.submit(fetchQueryChunk, client, endpoint, api_key, half, cached)] = half
+                    continue
+                response.raise_for_status()
+                merged.update(json.loads(response.text))
+
+    return merged
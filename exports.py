@@ -0,0 +1,107 @@
+import pandas as pd
+import hashlib
+import io
+import json
+
+# MIME type and file extension of each export format
+EXPORT_FORMATS = {
+    'csv': ('text/csv', '.csv'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', '.xlsx')
+}
+EXPORT_FORMAT_LABELS = {
+    'csv': 'CSV',
+    'parquet': 'Parquet',
+    'xlsx': 'Excel workbook'
+}
+# Label, help, file name prefix and sheet names of the tables in each artefact. CSV and Parquet files hold one table
+# each, so an Excel workbook collects every table as a sheet instead.
+TABLE_ARTEFACTS = {
+    'all_data': ('All data', 'Download all data, including start, end & change, IMC-Contractor comparison and review level status', 'lpp_data', {'plotdata': 'All data'}),
+    'appendix_f': ('Appendix F', 'Download details of exceedances', 'lpp_appendixf', {'appendix_f': 'Appendix F'}),
+    'appendix_g': ('Appendix G', 'Download comparison of Contractor and IMC readings', 'lpp_appendixg', {'appendix_g': 'Appendix G'})
+}
+WORKBOOK_ARTEFACTS = {
+    'workbook': ('All tables', 'Download all data and Appendices F and G as sheets of one workbook', 'lpp_report', {'plotdata': 'All data', 'appendix_f': 'Appendix F', 'appendix_g': 'Appendix G'})
+}
+
+
+def exportArtefacts(export_format: str) -> dict:
+    return WORKBOOK_ARTEFACTS if export_format == 'xlsx' else TABLE_ARTEFACTS
+
+
+def dataVersion(*parts) -> str:
+    # Short hash identifying the data being exported, from anything which changes whenever the data does
+    return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def scalarColumns(table: pd.DataFrame) -> pd.DataFrame:
+    # Spreadsheets hold scalars only, so columns of tuples such as coordinates are written as text
+    nested = [column for column in table.columns if table[column].dtype == object
+              and table[column].map(lambda value: isinstance(value, (tuple, list))).any()]
+    return table.assign(**{column: table[column].astype(str) for column in nested})
+
+
+def serialiseTables(tables: dict, export_format: str) -> bytes:
+    """
+    **serialiseTables** Writes tables to the bytes of one file in the export format
+
+    :param tables: Dataframes keyed by sheet name. CSV and Parquet take exactly one table.
+    :type dict:
+    """
+    if export_format == 'xlsx':
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+            for sheet_name, table in tables.items():
+                scalarColumns(table).to_excel(writer, sheet_name=sheet_name, index=False)
+        return buffer.getvalue()
+
+    if len(tables) != 1:
+        raise ValueError('A {} export holds one table, not {}'.format(export_format, len(tables)))
+    table = next(iter(tables.values()))
+    if export_format == 'csv':
+        return table.to_csv(path_or_buf=None, index=False).encode('utf-8')
+    if export_format == 'parquet':
+        return table.to_parquet(path=None, index=False)
+    raise ValueError('Unknown export format {}'.format(export_format))
+
+
+def cachedExport(cache: dict, version: str, artefact: str, export_format: str) -> bytes:
+    # Bytes of an artefact already exported from this version of the data, or None
+    if cache.get('version') != version:
+        return None
+    return cache.get('artefacts', {}).get((artefact, export_format))
+
+
+def exportArtefact(
+        cache: dict,
+        version: str,
+        artefact: str,
+        export_format: str,
+        tables: dict
+    ) -> bytes:
+    """
+    **exportArtefact** Returns the bytes of an export artefact, serialising its tables only if this version has not been exported yet
+
+    :param cache: Dictionary holding the exports of one version of the data, e.g. in session state. Exports of any
+    other version are dropped when this version is first exported.
+    :type dict:
+    :param tables: Dataframes to export, keyed plotdata, appendix_f and appendix_g
+    :type dict:
+    """
+    data = cachedExport(cache, version, artefact, export_format)
+    if data is None:
+        if cache.get('version') != version:
+            cache.clear()
+            cache.update(version=version, artefacts={})
+        _, _, _, sheets = exportArtefacts(export_format)[artefact]
+        data = cache['artefacts'][(artefact, export_format)] = serialiseTables(
+            {sheet_name: tables[table_name] for table_name, sheet_name in sheets.items()},
+            export_format
+        )
+    return data
+
+
+def exportFileName(artefact: str, export_format: str, report_period: tuple) -> str:
+    _, _, prefix, _ = exportArtefacts(export_format)[artefact]
+    return prefix + '_' + report_period[0].strftime('%Y%m%d') + '–' + report_period[1].strftime('%Y%m%d') + EXPORT_FORMATS[export_format][1]
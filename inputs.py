@@ -1,12 +1,19 @@
 from classes import instrument
+import download
+import cache
+from client import getClient
 import pandas as pd
+import numpy as np
 import json
-import requests as rq
 import streamlit as st
+from status import statusContainer
 import datetime
-import numpy as np
 import re
+import os
 from contextlib import suppress
+import logging
+
+logger = logging.getLogger(__name__)
 
 def identifyIMCPairing(instruments: dict) -> dict:
     for instrument in instruments.values():
@@ -33,13 +40,69 @@ def identifyIMCPairing(instruments: dict) -> dict:
     return(instruments)
 
 
-@st.cache_data(show_spinner=False)
-def readInstrumentSetupFromCSV(
-        instruments: dict,
-        filepath: str
-    ) -> dict:
+REVIEWLEVEL_COLUMNS = ['instrument', 'field', 'direction', 'level', 'value']
+
+
+def buildReviewLevelTable(records) -> pd.DataFrame:
     """
-    **readInstrumentSetupFromCSV** Reads instrument coordinates, trigger levels and correspondences between the contractor's and IMC's instruments
+    **buildReviewLevelTable** Builds the columnar review-level table from (instrument, field, direction, level, value) records
+
+    Values which are not numbers are dropped, as are repeats of a level with the same value. A level given with
+    different values is kept in full and logged, since dropping either value could hide exceedances.
+    The table is indexed on (instrument, field), so that the review levels of an instrument field are one hash lookup.
+    """
+    reviewlevels_df = pd.DataFrame.from_records(records, columns=REVIEWLEVEL_COLUMNS)
+    reviewlevels_df['value'] = pd.to_numeric(reviewlevels_df['value'], errors='coerce').astype(float)
+    reviewlevels_df['direction'] = reviewlevels_df['direction'].str.lower()
+    reviewlevels_df['level'] = reviewlevels_df['level'].str.lower()
+    reviewlevels_df = reviewlevels_df.dropna(subset=['field', 'direction', 'level', 'value']).drop_duplicates()
+    conflicts = reviewlevels_df.duplicated(subset=['instrument', 'field', 'direction', 'level'], keep=False)
+    if conflicts.any():
+        logger.warning('{:,} review levels are given more than once with different values, e.g. {}'.format(
+            conflicts.sum(), reviewlevels_df.loc[conflicts].iloc[0].to_dict()))
+    for column in ['instrument', 'field', 'direction', 'level']:
+        reviewlevels_df[column] = reviewlevels_df[column].astype('category')
+
+    return reviewlevels_df.set_index(['instrument', 'field'], drop=False).sort_index()
+
+
+def reviewLevelDirections(setup_data: pd.DataFrame) -> pd.Series:
+    """
+    **reviewLevelDirections** Decides whether each review level read from a csv is an upper or a lower level
+
+    The csv does not state a direction. A level name given more than once for an instrument field, e.g. alerts of +3
+    and -3, has an upper and a lower level, the greater values being upper. A level name given once takes the
+    direction of its field's levels: upper if the action, or failing that the alarm, level is above the alert level,
+    and lower if below. Failing both, a level is upper if positive and lower otherwise.
+
+    :param setup_data: Review levels in columns instr_id, field, review_name and review_value
+    :type pd.DataFrame:
+    """
+    values = setup_data['review_value']
+    given = values.notna()
+    name_groups = values.where(given).groupby([setup_data['instr_id'], setup_data['field'], setup_data['review_name']], sort=False)
+    name_counts = name_groups.transform('count')
+    paired_upper = name_groups.rank(method='first') > name_counts / 2
+
+    # Orientation of each field from its levels given once
+    single_levels = setup_data.loc[given & (name_counts == 1)] \
+        .pivot_table(index=['instr_id', 'field'], columns='review_name', values='review_value', aggfunc='first') \
+        .reindex(columns=['alert', 'alarm', 'action'])
+    onerous = single_levels['action'].fillna(single_levels['alarm'])
+    orientation = pd.Series(np.sign(onerous - single_levels['alert']), index=single_levels.index).rename('orientation')
+    field_orientation = setup_data[['instr_id', 'field']].join(orientation, on=['instr_id', 'field'])['orientation']
+    single_upper = field_orientation.gt(0) | (field_orientation.isna() & values.gt(0))
+
+    return pd.Series(np.where(np.where(name_counts > 1, paired_upper, single_upper), 'upper', 'lower'), index=setup_data.index)
+
+
+@st.cache_data(show_spinner=False, persist='disk')
+def readReviewLevelsFromCSV(
+        filepath: str,
+        modified_time: float = None
+    ) -> pd.DataFrame:
+    """
+    **readReviewLevelsFromCSV** Reads review levels from a csv into the review-level table in one vectorised pass
 
     :param filepath: File path to the csv containing the data in the following columns:
     1: Instrument ID <str>
@@ -49,50 +112,52 @@ def readInstrumentSetupFromCSV(
     5: Review value aka trigger level value <float>
     6: Review name aka trigger level name i.e. alert, action or alarm <str>
     :type str:
+    :param modified_time: Modification time of the file, so that the cached table is refreshed when the file changes
+    :type float:
     """
-    setup_data = pd.read_csv(filepath)
-    
-    for instr_id in pd.unique(setup_data.instr_id):
-        try:
-            instrument = instruments[instr_id]
-            st.write('instr_id: ', instr_id)
-
-            instr_reviewlevels = setup_data.loc[(setup_data.instr_id == instr_id)].sort_values(
-                by='review_value',
-                axis=0,
-                ascending=True
-            ).drop_duplicates()
-            st.write(instr_reviewlevels)
-
-            if len(instr_reviewlevels) == 6:
-                instrument.review_levels.lower.action,
-                instrument.review_levels.lower.alarm,
-                instrument.review_levels.lower.alert,
-                instrument.review_levels.upper.alert,
-                instrument.review_levels.upper.alarm,
-                instrument.review_levels.upper.action = instr_reviewlevels['review_value']
-            if len(instr_reviewlevels) == 3:
-                if instr_reviewlevels.loc[instr_reviewlevels.review_name == 'Action'] > instr_reviewlevels.loc[instr_reviewlevels.review_name == 'Alert']:
-                    instrument.review_levels.upper.alert,
-                    instrument.review_levels.upper.alarm,
-                    instrument.review_levels.upper.action = instr_reviewlevels['review_value']
-                else:
-                    instrument.review_levels.upper.action,
-                    instrument.review_levels.upper.alarm,
-                    instrument.review_levels.upper.alert = instr_reviewlevels['review_value']
-        except:
-            pass
+    setup_data = pd.read_csv(filepath, encoding='utf-8-sig').drop_duplicates()
+    setup_data['field'] = setup_data['field'].str.strip('"')
+    setup_data['review_name'] = setup_data['review_name'].str.lower()
+
+    setup_data['direction'] = reviewLevelDirections(setup_data)
+
+    return buildReviewLevelTable(setup_data[['instr_id', 'field', 'direction', 'review_name', 'review_value']].itertuples(index=False, name=None))
+
+
+def applyReviewLevels(
+        instruments: dict,
+        reviewlevels_df: pd.DataFrame
+    ) -> dict:
+    # Populate the nested review_levels dictionaries of each instrument from the review-level table
+    for instr_name, field_name, direction, level, value in reviewlevels_df[REVIEWLEVEL_COLUMNS].itertuples(index=False, name=None):
+        if instr_name not in instruments.keys():
+            continue
+        if instruments[instr_name].review_levels is None:
+            instruments[instr_name].review_levels = {}
+        instruments[instr_name].review_levels.setdefault(field_name, {}).setdefault(direction, {})[level] = value
 
     return instruments
 
 
+def readInstrumentSetupFromCSV(
+        instruments: dict,
+        filepath: str
+    ) -> dict:
+    """
+    **readInstrumentSetupFromCSV** Reads trigger levels from a csv, in the format read by readReviewLevelsFromCSV, into the instruments
+    """
+    return applyReviewLevels(
+        instruments=instruments,
+        reviewlevels_df=readReviewLevelsFromCSV(filepath=filepath, modified_time=os.path.getmtime(filepath))
+    )
+
+
 @st.cache_data(show_spinner=False)
 def apiKey(
     username: str,
     password: str
 ) -> str:
-    url = 'http://lpp_api.maxwellgeosystems.com'
-    login = rq.post('{}/login'.format(url), data={
+    login = getClient().post('login', data={
         "username": username,
         "password": password
     })
@@ -100,54 +165,48 @@ def apiKey(
     return api_key
 
 
-@st.cache_data(show_spinner=False)
 def getInstrumentTypes(
     api_key: str
 ) -> list:
-    url = 'http://lpp_api.maxwellgeosystems.com'
-    headers = {'Authorization': "Bearer " + api_key}
-
-    response = rq.get('{}/api/get_instrument_type'.format(url), headers=headers)
+    # Types, sub-types and set-up go through the metadata cache, which is shared by all sessions whatever their token
+    response = cache.cachedRequest(getClient(), 'GET', 'api/get_instrument_type', api_key=api_key)
     type_list = json.loads(response.text)
 
     return type_list
 
 
-@st.cache_data(show_spinner=False)
 def getInstrumentSubTypes(
     type_list: list,
     api_key: str
 ) -> dict:
-    url = 'http://lpp_api.maxwellgeosystems.com'
-    headers = {'Authorization': "Bearer " + api_key}
-
-    response = rq.post('{}/api/get_instrument_sub_type'.format(url),
-                       headers=headers,
-                       data={'types': ','.join(type_list)})
+    # The API takes many read-only queries by POST, which are marked as safe to retry
+    response = cache.cachedRequest(getClient(), 'POST', 'api/get_instrument_sub_type',
+                                   api_key=api_key,
+                                   retry=True,
+                                   data={'types': ','.join(type_list)})
     subtype_dict = json.loads(response.text)
 
     return subtype_dict
 
 
-@st.cache_data(show_spinner=False)
 def getInstrumentSetup(
         subtype_list: list,
         imc_cc_selection: list,
         api_key: str
     ) -> dict:
-    status_container = st.status(
+    status_container = statusContainer(
         label='Downloading set-up data...',
         expanded=False,
         state='running'
     )
 
-    url = 'http://lpp_api.maxwellgeosystems.com'
-    headers = {'Authorization': "Bearer " + api_key}
+    client = getClient()
     
     # Get dictionary and list of instruments
-    response = rq.post('{}/api/get_instruments'.format(url),
-                       headers=headers,
-                       data={'types': json.dumps(subtype_list)})
+    response = cache.cachedRequest(client, 'POST', 'api/get_instruments',
+                                   api_key=api_key,
+                                   retry=True,
+                                   data={'types': json.dumps(subtype_list)})
     instr_dict = json.loads(response.text)
     instr_list = [instr for types in instr_dict.values()
                   for subtypes in types.values()
@@ -159,21 +218,14 @@ def getInstrumentSetup(
     elif 'Contractor' in imc_cc_selection and 'IMC' not in imc_cc_selection:
         instr_list = [instr for instr in instr_list if instr[-2:] != '_I']
     
-    # Initialise a dictionary to store the instrument set-up data
-    setup_dict = {}
-    num_chunks = 1
-    request_success = False
-    while not request_success:
-        for chunk in np.array_split(instr_list, num_chunks):
-            response = rq.get('{}/api/get_instrument_setup'.format(url),
-                            headers=headers,
-                            params={'instruments': ','.join(chunk)})
-            if response.status_code == 414:
-                break
-            else:
-                setup_dict.update(json.loads(response.text))
-        request_success = response.status_code != 414
-        num_chunks += 1
+    # Download set-up data in as few URL-length-limited requests as possible
+    setup_dict = download.fetchChunked(
+        client=client,
+        endpoint='api/get_instrument_setup',
+        api_key=api_key,
+        instrument_ids=instr_list,
+        cached=True
+    )
 
     instruments = {}
     for name, setup_data in setup_dict.items():
@@ -209,6 +261,7 @@ def getInstrumentSetup(
         with suppress(Exception):
             instruments[name].zone = setup_data['zone']
 
+    status_container.record(rows_in=len(instr_list), rows_out=len(instruments))
     status_container.update(
         label='Set-up data downloaded!',
         state='complete',
@@ -223,16 +276,20 @@ def getCalibrationData(
         inclinometer_types: list,
         api_key: str
     ) -> dict:
-    url = 'http://lpp_api.maxwellgeosystems.com'
-    headers = {'Authorization': "Bearer " + api_key}
-    query = {'instruments': ','.join([instrument.id for instrument in instruments.values() if instrument.type in inclinometer_types])}
-
-    response = rq.get(
-        '{}/api/get_calib_data'.format(url),
-        headers=headers,
-        params=query
+    client = getClient()
+
+    status_container = statusContainer(
+        label='Downloading calibration data...',
+        expanded=False,
+        state='running'
+    )
+
+    calib_data = download.fetchChunked(
+        client=client,
+        endpoint='api/get_calib_data',
+        api_key=api_key,
+        instrument_ids=[instrument.id for instrument in instruments.values() if instrument.type in inclinometer_types]
     )
-    calib_data = json.loads(response.text)
     for id, instr_calib in calib_data.items():
         for revision in reversed(instr_calib):
             if 'bearing' in revision.keys():
@@ -242,6 +299,13 @@ def getCalibrationData(
                     instruments[id].bearing = None
                 continue
 
+    status_container.record(rows_out=len(calib_data))
+    status_container.update(
+        label='Calibration data downloaded!',
+        state='complete',
+        expanded=False
+    )
+
     return instruments
 
 
@@ -249,30 +313,21 @@ def getParentChildRelationships(
         instruments: dict,
         api_key: str
     ) -> dict:
-    url = 'http://lpp_api.maxwellgeosystems.com'
-    headers = {'Authorization': "Bearer " + api_key}
+    client = getClient()
 
-    status_container = st.status(
+    status_container = statusContainer(
         label='Reading parent-child relationships...',
         expanded=False,
         state='running'
     )
     
-    # Initialise a dictionary to store parent-child relationships
-    parentchild_dict = {}
-    num_chunks = 1
-    request_success = False
-    while not request_success:
-        for chunk in np.array_split([instrument for instrument in instruments], num_chunks):
-            response = rq.get('{}/api/get_master'.format(url),
-                            headers=headers,
-                            params={'instruments': ','.join(chunk)})
-            if response.status_code == 414:
-                break
-            else:
-                parentchild_dict.update(json.loads(response.text))
-        request_success = response.status_code != 414
-        num_chunks += 1
+    # Download parent-child relationships in as few URL-length-limited requests as possible
+    parentchild_dict = download.fetchChunked(
+        client=client,
+        endpoint='api/get_master',
+        api_key=api_key,
+        instrument_ids=list(instruments.keys())
+    )
 
     if parentchild_dict:
         for child, parents in parentchild_dict.items():
@@ -284,8 +339,9 @@ def getParentChildRelationships(
                     else:
                         instruments[parent].children.append(child)
 
+    status_container.record(rows_in=len(instruments), rows_out=len(parentchild_dict or {}))
     status_container.update(
-        label='Set-up data downloaded!',
+        label='Parent-child relationships read!',
         state='complete',
         expanded=False
     )
@@ -297,56 +353,59 @@ def getInstrumentReadings(
         instruments: dict,
         report_period: tuple,
         buffer_start: int,
-        api_key: str
+        api_key: str,
+        max_workers: int = download.MAX_WORKERS,
+        instruments_per_chunk: int = download.INSTRUMENTS_PER_CHUNK,
+        days_per_chunk: int = download.DAYS_PER_CHUNK,
+        use_cache: bool = True
     ) -> dict:
-    url = 'http://lpp_api.maxwellgeosystems.com'
-    headers = {'Authorization': "Bearer " + api_key}
+    client = getClient()
 
-    status_container = st.status(
+    status_container = statusContainer(
         label='Downloading readings...',
         expanded=False,
         state='running'
     )
     
-    start_date = (report_period[0] - datetime.timedelta(days=buffer_start)).strftime('%Y-%m-%d %H:%M:%S')
-    end_date = (report_period[1] + datetime.timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
-
-    response = rq.post('{}/api/get_instrument_data'.format(url),
-                            headers=headers,
-                            data={'instruments': ','.join([instrument.id for instrument in instruments.values()]),
-                                'from_date': start_date,
-                                'to_date': end_date
-                            })
-    readings_dict = json.loads(response.text)
-    # st.write('readings_dict:')
-    # st.write(readings_dict)
-
-    if isinstance(readings_dict, dict):
-        for name, data_dict in readings_dict.items():
-            if name == 'comment':
-                continue
-            dataframe_dict = {}
-            for index, (timestamp, reading_data) in enumerate(data_dict.items()):
-                data_fields = [reading_data[key] for key in reading_data if key not in ['Easting', 'Northing']]
-                if all(value == '' for value in data_fields):
-                    continue
-                dataframe_dict[index] = {'Timestamp': datetime.datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')}
-                dataframe_dict[index].update(reading_data)
-                for key, value in dataframe_dict[index].items():
-                    if key != 'Timestamp':
-                        try:
-                            dataframe_dict[index][key] = float(value)
-                        except:
-                            dataframe_dict[index][key] = None
-            data_df = pd.DataFrame.from_dict(dataframe_dict, 'index')
-            if not data_df.empty:
-                try:
-                    instruments[name].readings = data_df
-                except:
-                    pass
+    start_date = datetime.datetime.combine(report_period[0], datetime.time()) - datetime.timedelta(days=buffer_start)
+    end_date = datetime.datetime.combine(report_period[1], datetime.time()) + datetime.timedelta(days=1)
+
+    instrument_ids = [instrument.id for instrument in instruments.values()]
+    if use_cache:
+        # Only request the days which are not already held in the local readings cache
+        connection = cache.openCache()
+        ranges = cache.findMissingRanges(connection, instrument_ids, start_date, end_date)
+    else:
+        ranges = [(instrument_ids, start_date, end_date)]
+
+    readings, stats = download.downloadReadingRanges(
+        ranges=ranges,
+        client=client,
+        api_key=api_key,
+        max_workers=max_workers,
+        instruments_per_chunk=instruments_per_chunk,
+        days_per_chunk=days_per_chunk
+    )
+
+    if use_cache:
+        cache.storeReadings(connection, readings, ranges)
+        readings = cache.loadReadings(connection, instrument_ids, start_date, end_date)
+        connection.close()
+
+    for name, data_df in readings.items():
+        if name in instruments.keys():
+            instruments[name].readings = data_df
 
+    status_container.record(rows_in=len(instrument_ids), rows_out=sum(len(data_df) for data_df in readings.values()), bytes=stats['bytes'])
     status_container.update(
-        label='Readings downloaded!',
+        label='Readings downloaded! {:,} readings in {:.1f} s ({:,.0f} readings/s, {} chunks, {} retried, {} ranges not cached)'.format(
+            stats['readings'],
+            stats['seconds'],
+            stats['readings'] / stats['seconds'] if stats['seconds'] else 0,
+            stats['chunks'],
+            stats['retries'],
+            len(ranges)
+        ),
         state='complete',
         expanded=False
     )
@@ -354,25 +413,8 @@ def getInstrumentReadings(
     return(instruments)
 
 
-def getInstrumentReviewLevels(
-        instruments: dict,
-        api_key: str
-    ) -> dict:
-    url = 'http://lpp_api.maxwellgeosystems.com'
-    headers = {'Authorization': "Bearer " + api_key}
-
-    status_container = st.status(
-        label='Downloading review levels...',
-        expanded=False,
-        state='running'
-    )
-
-    response = rq.post('{}/api/get_instrument_setup_review_settings'.format(url),
-                                headers=headers,
-                                data={'instruments': ','.join([instrument.id for instrument in instruments.values()])}
-                            )
-    reviewlevels_dict = json.loads(response.text)
-
+def flattenReviewLevels(reviewlevels_dict: list):
+    # Walk the nested response from /api/get_instrument_setup_review_settings once, yielding one record per review level
     for instr_group in reviewlevels_dict:
         for instr_name in instr_group.values():
             for reviewfield_name, reviewfield_details in instr_name.items():
@@ -382,17 +424,52 @@ def getInstrumentReviewLevels(
                     for review_direction in review_level.values():
                         if review_direction['review_field_label'] is None:
                             continue
-                        if instruments[review_direction['Instrument']].review_levels is None:
-                            instruments[review_direction['Instrument']].review_levels = {}
-                        try:
-                            instruments[review_direction['Instrument']].review_levels.setdefault(review_direction['review_field_label'], {}).setdefault(review_direction['review_direction'].lower(), {})[review_direction['review_level_name'].lower()] = float(review_direction['review_value'])
-                        except:
-                            pass
+                        yield (
+                            review_direction['Instrument'],
+                            review_direction['review_field_label'],
+                            review_direction['review_direction'],
+                            review_direction['review_level_name'],
+                            review_direction['review_value']
+                        )
+
+
+def getReviewLevelTable(
+        instruments: dict,
+        api_key: str
+    ) -> pd.DataFrame:
+    status_container = statusContainer(
+        label='Downloading review levels...',
+        expanded=False,
+        state='running'
+    )
 
+    # Review levels are kept in the metadata cache but always revalidated, so an unchanged table costs only a 304
+    response = cache.cachedRequest(getClient(), 'POST', 'api/get_instrument_setup_review_settings',
+                                   api_key=api_key,
+                                   ttl=cache.REVIEW_LEVELS_TTL,
+                                   retry=True,
+                                   data={'instruments': ','.join([instrument.id for instrument in instruments.values()])}
+                                   )
+    reviewlevels_df = buildReviewLevelTable(flattenReviewLevels(json.loads(response.text)))
+
+    status_container.record(rows_in=len(instruments), rows_out=len(reviewlevels_df), bytes=len(response.content))
     status_container.update(
         label='Review levels downloaded!',
         state='complete',
         expanded=False
     )
 
-    return(instruments)
\ No newline at end of file
+    return reviewlevels_df
+
+
+def getInstrumentReviewLevels(
+        instruments: dict,
+        api_key: str
+    ) -> dict:
+    return applyReviewLevels(
+        instruments=instruments,
+        reviewlevels_df=getReviewLevelTable(
+            instruments=instruments,
+            api_key=api_key
+        )
+    )
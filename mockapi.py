@@ -0,0 +1,256 @@
+import numpy as np
+import datetime
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+# Size of the current project, which the benchmarks scale by 1x, 10x and 100x
+PROJECT_INSTRUMENTS = 1500
+PROJECT_READINGS_PER_INSTRUMENT = 48
+PROJECT_FIELDS = 3
+PROJECT_IMC_RATIO = 0.2
+
+
+class SyntheticProject:
+    """
+    **SyntheticProject** Generates instruments, set-up, review levels and readings resembling the LPP project
+
+    Readings are calculated from the instrument index and reading time rather than stored, so that any window of any
+    instrument can be served without holding the whole project in memory. The same parameters always give the same data.
+    """
+    def __init__(
+            self,
+            num_instruments: int = PROJECT_INSTRUMENTS,
+            readings_per_instrument: int = PROJECT_READINGS_PER_INSTRUMENT,
+            num_fields: int = PROJECT_FIELDS,
+            imc_ratio: float = PROJECT_IMC_RATIO,
+            end_date: datetime.datetime = None,
+            history_days: int = 14,
+            blank_ratio: float = 0.05,
+            seed: int = 0
+        ) -> None:
+        self.readings_per_instrument = readings_per_instrument
+        self.field_names = ['Calculated Settlement'] + ['Field {}'.format(index) for index in range(1, num_fields)]
+        self.blank_ratio = blank_ratio
+        self.seed = seed
+        self.end_date = end_date or datetime.datetime.combine(datetime.date.today(), datetime.time())
+        self.start_date = self.end_date - datetime.timedelta(days=history_days)
+        self.interval = (self.end_date - self.start_date).total_seconds() / max(readings_per_instrument, 1)
+
+        self.type_subtypes = {'GSM': ['Ground Settlement Marker'], 'SMP': ['Settlement Monitoring Point'], 'IW': ['In-place Inclinometer']}
+        rng = np.random.default_rng(seed)
+        self.instruments = {}
+        num_contractor = max(int(round(num_instruments / (1 + imc_ratio))), 1)
+        for index in range(num_contractor):
+            instr_type = list(self.type_subtypes)[index % len(self.type_subtypes)]
+            contract, site = ['1201', '1202', '1203'][index % 3], 'ABCDEFGHJKLMNOP'[index % 15]
+            instr_id = '{}/{}/{}/{:06d}'.format(contract, site, instr_type, index)
+            self.instruments[instr_id] = {
+                'index': index,
+                'type': instr_type,
+                'subtype': self.type_subtypes[instr_type][0],
+                'contract': contract,
+                'site': site,
+                # The API returns northings as eastings and vice versa
+                'easting': 816500 + rng.uniform(-2000, 2000),
+                'northing': 811700 + rng.uniform(-3000, 3000),
+                'ground_level': rng.uniform(3, 8),
+                # Every tenth instrument heads a group whose other members are its children
+                'parent': None if index % 10 == 0 else '{}/{}/{}/{:06d}'.format(contract, site, instr_type, index - index % 10)
+            }
+        for index in range(num_instruments - num_contractor):
+            contractor_id = list(self.instruments)[int(index / max(num_instruments - num_contractor, 1) * num_contractor)]
+            self.instruments[contractor_id + '_I'] = dict(self.instruments[contractor_id], index=num_contractor + index, parent=None, pair_index=self.instruments[contractor_id]['index'])
+
+    def instrumentTypes(self) -> list:
+        return list(self.type_subtypes)
+
+    def instrumentSubTypes(self, types: list) -> dict:
+        return {instr_type: self.type_subtypes[instr_type] for instr_type in types if instr_type in self.type_subtypes}
+
+    def instrumentList(self, subtype_dict: dict) -> dict:
+        instr_dict = {}
+        for instr_id, details in self.instruments.items():
+            if details['subtype'] in subtype_dict.get(details['type'], []):
+                instr_dict.setdefault(details['type'], {}).setdefault(details['subtype'], []).append(instr_id)
+        return instr_dict
+
+    def setup(self, instrument_ids: list) -> dict:
+        return {instr_id: {
+            'date_installed': self.start_date.replace(year=self.start_date.year - 1).strftime('%Y-%m-%d %H:%M:%S'),
+            'easting': '{:.3f}'.format(self.instruments[instr_id]['easting']),
+            'northing': '{:.3f}'.format(self.instruments[instr_id]['northing']),
+            'ground_level': '{:.3f}'.format(self.instruments[instr_id]['ground_level']),
+            'instrument_level': '{:.3f}'.format(self.instruments[instr_id]['ground_level']),
+            'location': None,
+            'parent': self.instruments[instr_id]['parent'],
+            'type': self.instruments[instr_id]['type'],
+            'subtype': self.instruments[instr_id]['subtype'],
+            'project': 'LPP',
+            'contract': self.instruments[instr_id]['contract'],
+            'site': self.instruments[instr_id]['site'],
+            'zone': None
+        } for instr_id in instrument_ids if instr_id in self.instruments}
+
+    def master(self, instrument_ids: list) -> dict:
+        return {instr_id: [self.instruments[instr_id]['parent']] for instr_id in instrument_ids
+                if instr_id in self.instruments and self.instruments[instr_id]['parent'] is not None}
+
+    def calibration(self, instrument_ids: list) -> dict:
+        return {instr_id: [{'revision': 1, 'bearing': '{:.1f}'.format(self.instruments[instr_id]['index'] * 37 % 360)}]
+                for instr_id in instrument_ids if instr_id in self.instruments}
+
+    def reviewSettings(self, instrument_ids: list) -> list:
+        levels = {'alert': 10, 'alarm': 15, 'action': 25}
+        review_settings = []
+        for instr_id in instrument_ids:
+            if instr_id not in self.instruments:
+                continue
+            field_settings = {'review_settings': {'instrument': instr_id}}
+            for field_name in self.field_names[:2]:
+                field_settings[field_name] = {
+                    str(level_index): {
+                        direction: {
+                            'Instrument': instr_id,
+                            'review_field_label': field_name,
+                            'review_direction': direction.title(),
+                            'review_level_name': level_name.title(),
+                            'review_value': str(value if direction == 'upper' else -value)
+                        } for direction in ['upper', 'lower']
+                    } for level_index, (level_name, value) in enumerate(levels.items())
+                }
+            review_settings.append({instr_id: field_settings})
+        return review_settings
+
+    def readings(self, instrument_ids: list, from_date: datetime.datetime, to_date: datetime.datetime) -> dict:
+        offsets = np.arange(self.readings_per_instrument) * self.interval
+        readings_dict = {}
+        for instr_id in instrument_ids:
+            if instr_id not in self.instruments:
+                continue
+            details = self.instruments[instr_id]
+            # IMC instruments read their contractor's ground a few hours later, with a little disagreement
+            pair_index = details.get('pair_index', details['index'])
+            shift = 3 * 3600 if 'pair_index' in details else 0
+            times = np.array([self.start_date + datetime.timedelta(seconds=offset + shift) for offset in offsets])
+            in_window = (times >= from_date) & (times <= to_date)
+            if not in_window.any():
+                continue
+            steps = np.arange(self.readings_per_instrument)[in_window]
+            rng = np.random.default_rng((self.seed, details['index']))
+            blanks = rng.random(size=(self.readings_per_instrument, len(self.field_names)))[in_window] < self.blank_ratio
+            values = np.stack([
+                (field_index + 1) * (np.sin(steps / 7 + pair_index) * 12 - steps * 0.05 * (pair_index % 5)) + (0.5 if shift else 0)
+                for field_index in range(len(self.field_names))
+            ], axis=1)
+            readings_dict[instr_id] = {
+                timestamp.strftime('%Y-%m-%d %H:%M:%S'): dict(
+                    zip(self.field_names, ['' if blank else '{:.3f}'.format(value) for value, blank in zip(row, blank_row)]),
+                    Easting='{:.3f}'.format(details['northing']),
+                    Northing='{:.3f}'.format(details['easting'])
+                ) for timestamp, row, blank_row in zip(times[in_window], values, blanks)
+            }
+        if not readings_dict:
+            return {'comment': 'No data found'}
+        return readings_dict
+
+
+class MockApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.respond('GET', parse_qs(urlsplit(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.respond('POST', parse_qs(self.rfile.read(length).decode('utf-8')))
+
+    def respond(self, method: str, query: dict):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.request_count += 1
+        if server.max_url_length and len(self.path) > server.max_url_length:
+            self.send(414, {'error': 'URI Too Long'})
+            return
+
+        project = server.project
+        endpoint = urlsplit(self.path).path.strip('/')
+        instrument_ids = query.get('instruments', [''])[0].split(',') if 'instruments' in query else []
+        match (method, endpoint):
+            case ('POST', 'login'):
+                self.send(200, {'token': 'mock-token'})
+                return
+            case _ if self.headers.get('Authorization') != 'Bearer mock-token':
+                self.send(401, {'error': 'Unauthorised'})
+                return
+            case ('GET', 'api/get_instrument_type'):
+                body = project.instrumentTypes()
+            case ('POST', 'api/get_instrument_sub_type'):
+                body = project.instrumentSubTypes(query.get('types', [''])[0].split(','))
+            case ('POST', 'api/get_instruments'):
+                body = project.instrumentList(json.loads(query.get('types', ['{}'])[0]))
+            case ('GET', 'api/get_instrument_setup'):
+                body = project.setup(instrument_ids)
+            case ('GET', 'api/get_master'):
+                body = project.master(instrument_ids)
+            case ('GET', 'api/get_calib_data'):
+                body = project.calibration(instrument_ids)
+            case ('POST', 'api/get_instrument_setup_review_settings'):
+                body = project.reviewSettings(instrument_ids)
+            case ('POST', 'api/get_instrument_data'):
+                body = project.readings(
+                    instrument_ids,
+                    datetime.datetime.strptime(query['from_date'][0], '%Y-%m-%d %H:%M:%S'),
+                    datetime.datetime.strptime(query['to_date'][0], '%Y-%m-%d %H:%M:%S')
+                )
+            case _:
+                self.send(404, {'error': 'Not found'})
+                return
+        self.send(200, body)
+
+    def send(self, status_code: int, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def startMockServer(
+        project: SyntheticProject = None,
+        latency: float = 0,
+        max_url_length: int = None,
+        port: int = 0
+    ) -> tuple:
+    """
+    **startMockServer** Serves a synthetic project on localhost from a background thread
+
+    :param latency: Seconds to wait before answering each request
+    :type float:
+    :param max_url_length: Answer HTTP 414 to any request whose path and query are longer than this
+    :type int:
+    Returns the server, to pass to stopMockServer, and its URL, to pass to client.setClient.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), MockApiHandler)
+    server.daemon_threads = True
+    server.project = project or SyntheticProject()
+    server.latency = latency
+    server.max_url_length = max_url_length
+    server.request_count = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+
+def stopMockServer(server: ThreadingHTTPServer):
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+import threading
+
+MAX_WORKERS = 8
+
+
+def runTasks(tasks: dict, max_workers: int = MAX_WORKERS) -> dict:
+    """
+    **runTasks** Runs a small graph of dependent tasks, running each task as soon as all its dependencies have finished
+
+    :param tasks: Dictionary of task name to (function, list of dependency names). Each function is called with a
+    dictionary of the results of the tasks finished so far and returns its own result.
+    :type dict:
+    Returns a dictionary of results keyed by task name. The first exception raised by a task is raised again here.
+    """
+    for name, (_, dependencies) in tasks.items():
+        unknown = [dependency for dependency in dependencies if dependency not in tasks]
+        if unknown:
+            raise ValueError('Task {} depends on unknown tasks {}'.format(name, ', '.join(unknown)))
+
+    # Worker threads share the Streamlit session of the script, so that tasks can draw their own status containers
+    script_run_ctx = get_script_run_ctx(suppress_warning=True)
+
+    def attachContext():
+        if script_run_ctx is not None:
+            add_script_run_ctx(threading.current_thread(), script_run_ctx)
+
+    results = {}
+    pending = dict(tasks)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1), initializer=attachContext) as executor:
+        while pending or running:
+            ready = [name for name, (_, dependencies) in pending.items() if all(dependency in results for dependency in dependencies)]
+            if not ready and not running:
+                raise ValueError('Tasks {} have circular dependencies'.format(', '.join(pending)))
+            for name in ready:
+                function, _ = pending.pop(name)
+                running[executor.submit(function, dict(results))] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    for other in running:
+                        other.cancel()
+                    raise
+
+    return results
@@ -1,93 +1,170 @@
 import pydeck
+from pydeck.bindings.json_tools import default_serialize
+import json
 import streamlit as st
 import pandas as pd
-import classes
+import numpy as np
+import matplotlib as mpl
+
+
+SUMMARY_NAMES = ['start', 'end', 'change', 'max_in_period', 'min_in_period']
+COLOUR_CHANNELS = ['r', 'g', 'b']
+# Divergent colour scale for changes, and sequential colour scales for absolute values rising and falling in magnitude
+COLOUR_MAPS = ['PiYG', 'OrRd', 'OrRd_r']
+COLOUR_LUT_SIZE = 256
+
+
+def colourLUT(cmap_name: str, lut_size: int = COLOUR_LUT_SIZE) -> np.ndarray:
+    # RGB of each colour of a matplotlib colormap on a scale of 0 to 255, as a (lut_size, 3) uint8 array
+    rgba = mpl.colormaps[cmap_name].resampled(lut_size)(np.arange(lut_size))
+    return (rgba[:, :3] * 255 + 0.5).astype(np.uint8)
+
+
+COLOUR_LUTS = np.stack([colourLUT(cmap_name) for cmap_name in COLOUR_MAPS])
+
+
+def colourIndex(values: np.ndarray, start_values: np.ndarray, stop_values: np.ndarray, lut_size: int = COLOUR_LUT_SIZE) -> np.ndarray:
+    # Position of each value in a colour lookup table spanning start to stop, as matplotlib's Normalize and Colormap place it
+    span = stop_values - start_values
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scaled = np.where(span != 0, (values - start_values) / span, 0) * lut_size
+    return np.clip(np.nan_to_num(scaled), 0, lut_size - 1).astype(np.intp)
 
 
 def assignColourScales(plotdata_df: pd.DataFrame, field_names: list) -> pd.DataFrame:
-    for summary_name in [
-        'start',
-        'end',
-        'change',
-        'max_in_period',
-        'min_in_period'
-    ]:
-        # Initialise new columns to store RGBA values for each output summary type
-        plotdata_df[summary_name + '_colour'] = [(None, None, None)] * len(plotdata_df)
-
-        for field_name in field_names:
-            # Isolate values unique to a plot
-            plot_values = plotdata_df.loc[plotdata_df['field_name'] == field_name][summary_name + '_value']
-
-            min_value = plot_values.min()
-            max_value = plot_values.max()
-            maxabs_value = max(abs(max_value), abs(min_value))
-            if summary_name == 'change':
-                # Apply divergent colour scale for changes
-                get_colour = classes.MPLColorHelper(
-                    cmap_name='PiYG',
-                    start_val=-maxabs_value,
-                    stop_val=maxabs_value
-                )
-            else:
-                # Apply sequential colour scale for absolute values i.e. start and end readings
-                get_colour = classes.MPLColorHelper(
-                    cmap_name='OrRd' if abs(max_value) == maxabs_value else 'OrRd_r',
-                    start_val=min_value,
-                    stop_val=max_value
-                )
-            for index, value in plot_values.dropna().items():
-                # The get_rgb method returns RGBA values. We only want RGB.
-                # Also, RGB is on a scale of 0 to 1. We want 0 to 255 as an integer.
-                plotdata_df.at[index, summary_name + '_colour'] = tuple([int(colour_value * 255 + 0.5) for colour_value in get_colour.get_rgb(val=value)[0:3]])
-                
-    # Initialise new columns to store RGBA values for review level
-    # plotdata_df['review_level_colour'] = [(None, None, None)] * len(plotdata_df)
-
-    # for index, levels in plotdata_df[['lower_review_level', 'upper_review_level']]:
-    #     review_level = [{
-    #         'alert': 1,
-    #         'alarm': 2,
-    #         'action': 3
-    #     }[level] if level != None else None for level in levels].max()
-    #     st.write('review_level: ': review_level)
-
-    return(plotdata_df)
-
-
-def plotChartTabs(plotdata_df: pd.DataFrame, field_name: str):
-    for index, tab in enumerate(st.tabs(['Start', 'End', 'Change', 'Max', 'Min'])):
-        plotChart(
-            plotdata_df=plotdata_df,
-            field_name=field_name,
-            tab=tab,
-            tab_index=index
-        )
+    """
+    **assignColourScales** Colours the start, end, change, maximum and minimum values of the selected fields
+
+    Each field has its own scale. Changes use a divergent scale symmetrical about zero. Other values use a sequential
+    scale from their minimum to maximum, reversed if the minimum has the larger magnitude. Colours are looked up in
+    precomputed tables for all rows at once and stored as uint8 columns <summary>_colour_r, _g and _b, which are 0
+    for values which are not coloured.
+    """
+    in_fields = plotdata_df['field_name'].isin(field_names).to_numpy()
+    colour_columns = {}
+    for summary_name in SUMMARY_NAMES:
+        values = pd.to_numeric(plotdata_df[summary_name + '_value'], errors='coerce').where(in_fields)
+        grouped = values.groupby(plotdata_df['field_name'].to_numpy(), sort=False)
+        min_values = grouped.transform('min').to_numpy(dtype=float)
+        max_values = grouped.transform('max').to_numpy(dtype=float)
+        maxabs_values = np.fmax(np.abs(max_values), np.abs(min_values))
+        if summary_name == 'change':
+            lut_index = np.zeros(len(values), dtype=np.intp)
+            colour_index = colourIndex(values.to_numpy(dtype=float), -maxabs_values, maxabs_values)
+        else:
+            lut_index = np.where(np.abs(max_values) == maxabs_values, 1, 2)
+            colour_index = colourIndex(values.to_numpy(dtype=float), min_values, max_values)
+
+        colours = COLOUR_LUTS[lut_index, colour_index]
+        colours[values.isnull().to_numpy()] = 0
+        for channel_index, channel in enumerate(COLOUR_CHANNELS):
+            colour_columns[summary_name + '_colour_' + channel] = colours[:, channel_index]
+
+    return(plotdata_df.assign(**colour_columns))
+
+
+SUMMARY_LABELS = ['Start', 'End', 'Change', 'Max', 'Min']
+SUMMARY_CAPTIONS = [
+    'Start of period',
+    'End of period',
+    'Change over period',
+    'Maximum within period',
+    'Minimum within period'
+]
+
+
+def partitionPlotData(plotdata_df: pd.DataFrame, field_names: list) -> dict:
+    """
+    **partitionPlotData** Splits the coloured plot table once into a compact map payload per field
+
+    Each payload holds, for every summary type, the largest and smallest value of the field and the records of one
+    map layer: instrument ID, [longitude, latitude] position, [r, g, b] colour and value text. Only located
+    instruments with a value of that summary type are included. The field's deck is kept in the payload once built,
+    so that reruns reuse it.
+
+    Layers hold short-keyed records rather than column buffers. st.pydeck_chart sends a deck as its JSON, in which
+    pydeck writes a DataFrame as the same records, and pydeck's binary transport only reaches a Jupyter widget. The
+    short keys and rounded positions keep each point to about 90 bytes of JSON (benchmarks.benchmarkPlotPayloads).
+    """
+    located = (plotdata_df['longitude'].notnull() & plotdata_df['latitude'].notnull()).to_numpy()
+    positions = np.column_stack([plotdata_df['longitude'].to_numpy(dtype=float), plotdata_df['latitude'].to_numpy(dtype=float)]).round(7)
+    ids = plotdata_df['id'].to_numpy()
+    field_rows = pd.Series(np.arange(len(plotdata_df))).groupby(plotdata_df['field_name'].to_numpy(), sort=False).indices
+
+    payloads = {}
+    for field_name in field_names:
+        rows = field_rows.get(field_name, np.array([], dtype=np.intp))
+        layers = []
+        for summary_name in SUMMARY_NAMES:
+            values = pd.to_numeric(plotdata_df[summary_name + '_value'], errors='coerce').to_numpy(dtype=float)[rows]
+            colours = plotdata_df[[summary_name + '_colour_' + channel for channel in COLOUR_CHANNELS]].to_numpy()[rows]
+            shown = np.flatnonzero(located[rows] & ~np.isnan(values))
+            layers.append({
+                'max': np.nanmax(values) if (~np.isnan(values)).any() else np.nan,
+                'min': np.nanmin(values) if (~np.isnan(values)).any() else np.nan,
+                'data': [{'id': instr_id, 'p': position, 'c': colour, 'v': '{:.3f}'.format(value)} for instr_id, position, colour, value in zip(
+                    ids[rows][shown].tolist(),
+                    positions[rows][shown].tolist(),
+                    colours[shown].tolist(),
+                    values[shown].tolist()
+                )]
+            })
+        payloads[field_name] = {'layers': layers, 'deck': None}
+
+    return payloads
+
+
+class CompactDeck(pydeck.Deck):
+    """
+    **CompactDeck** A deck whose layers are switched by visibility and whose JSON holds the data of visible layers only
+
+    Streamlit sends the whole deck again whenever its JSON changes, which switching layers does, so hidden layers are
+    sent without their data. The JSON is written without indentation and kept until the visible layers change.
+    """
+    def showLayer(self, layer_index: int) -> None:
+        for index, layer in enumerate(self.layers):
+            if layer.visible != (index == layer_index):
+                layer.visible = index == layer_index
+                self._json = None
+
+    def serialise(self, value) -> dict:
+        attrs = default_serialize(value)
+        if value is self:
+            attrs.pop('_json', None)
+        elif isinstance(value, pydeck.Layer) and not value.visible:
+            attrs['data'] = []
+        return attrs
+
+    def to_json(self):
+        if getattr(self, '_json', None) is None:
+            self._json = json.dumps(self, sort_keys=True, default=self.serialise, separators=(',', ':'))
+        return self._json
+
+
+def plotChartTabs(plot_payload: dict, field_name: str):
+    # One map per field, whose layers are shown one at a time by the summary type selected above it
+    st.subheader(field_name)
+    summary_label = st.radio(
+        label='Summary of ' + field_name,
+        options=SUMMARY_LABELS,
+        horizontal=True,
+        label_visibility='collapsed',
+        key='plot_summary_' + field_name
+    )
+    plotChart(
+        plot_payload=plot_payload,
+        field_name=field_name,
+        summary_index=SUMMARY_LABELS.index(summary_label)
+    )
+
 
+def plotChart(plot_payload: dict, field_name: str, summary_index: int):
+    st.caption(SUMMARY_CAPTIONS[summary_index])
+    st.markdown(':arrow_up_small: ' + f"{plot_payload['layers'][summary_index]['max']:.3f}" + '  '
+                + ':arrow_down_small: ' + f"{plot_payload['layers'][summary_index]['min']:.3f}")
 
-def plotChart(plotdata_df: pd.DataFrame, field_name: str, tab, tab_index: int):
-    with tab:
-        st.subheader(field_name)
-        st.caption([
-            'Start of period',
-            'End of period',
-            'Change over period',
-            'Maximum within period',
-            'Minimum within period'
-        ][tab_index])
-        st.markdown(':arrow_up_small: ' + f"{plotdata_df.loc[plotdata_df['field_name'] == field_name][['start', 'end', 'change', 'max_in_period', 'min_in_period'][tab_index] + '_value'].max():.3f}" + '  ' 
-                    + ':arrow_down_small: ' + f"{plotdata_df.loc[plotdata_df['field_name'] == field_name][['start', 'end', 'change', 'max_in_period', 'min_in_period'][tab_index] + '_value'].min():.3f}")
-    
-    tooltip_html = [
-        "{id}<br>{field_name}: <b>{start_value}</b>",
-        "{id}<br>{field_name}: <b>{end_value}</b>",
-        "{id}<br>{field_name}: <b>{change_value}</b>",
-        "{id}<br>{field_name}: <b>{max_in_period_value}</b>",
-        "{id}<br>{field_name}: <b>{min_in_period_value}</b>"
-    ][tab_index]
-    
-    tab.pydeck_chart(
-        pydeck.Deck(
+    if plot_payload['deck'] is None:
+        plot_payload['deck'] = CompactDeck(
             map_style='light',
             initial_view_state=pydeck.ViewState(
                 latitude=22.2981,
@@ -96,22 +173,25 @@ def plotChart(plotdata_df: pd.DataFrame, field_name: str, tab, tab_index: int):
                 pitch=20
             ),
             tooltip = {
-                "html": tooltip_html,
+                "html": "{id}<br>" + field_name + ": <b>{v}</b>",
                 "style": {"background": "grey", "color": "white", "font-family": '"Helvetica Neue", Arial', "z-index": "10000"},
             },
             layers=[
                 pydeck.Layer(
                     type='ScatterplotLayer',
-                    data=plotdata_df.loc[plotdata_df['field_name'] == field_name].dropna(subset=[['start', 'end', 'change', 'max_in_period', 'min_in_period'][tab_index] + '_value']),
-                    get_position='coordinates',
-                    get_fill_color= ['start', 'end', 'change', 'max_in_period', 'min_in_period'][tab_index] + '_colour',
+                    id=summary_name,
+                    data=layer['data'],
+                    visible=layer_index == summary_index,
+                    get_position='p',
+                    get_fill_color='c',
                     get_line_color=[0, 0, 0],
                     pickable=True,
                     opacity=0.8,
                     stroked=True,
                     filled=True,
                     get_radius=5
-                )
+                ) for layer_index, (summary_name, layer) in enumerate(zip(SUMMARY_NAMES, plot_payload['layers']))
             ]
         )
-    )
\ No newline at end of file
+    plot_payload['deck'].showLayer(summary_index)
+    st.pydeck_chart(plot_payload['deck'])
@@ -0,0 +1,248 @@
+import inputs
+import processes
+import orchestrate
+import datetime
+import json
+import uuid
+
+
+def readingsWindow(report_period: tuple, buffer_start: int) -> tuple:
+    # The period of readings downloaded for a report period, as requested by inputs.getInstrumentReadings
+    start_date = datetime.datetime.combine(report_period[0], datetime.time()) - datetime.timedelta(days=buffer_start)
+    end_date = datetime.datetime.combine(report_period[1], datetime.time()) + datetime.timedelta(days=1)
+    return (start_date, end_date)
+
+
+def rawDataKey(subtype_dict: dict, imc_cc_selection: list, inclinometer_types: list, contracts: list = None) -> str:
+    # Identifies the selection of instruments which raw data was downloaded for
+    return json.dumps([
+        {instr_type: sorted(subtypes) for instr_type, subtypes in subtype_dict.items()},
+        sorted(imc_cc_selection),
+        sorted(inclinometer_types),
+        None if contracts is None else sorted(contracts)
+    ], sort_keys=True)
+
+
+def fetchRawData(
+        subtype_dict: dict,
+        imc_cc_selection: list,
+        inclinometer_types: list,
+        report_period: tuple,
+        buffer_start: int,
+        api_key: str,
+        max_workers: int = inputs.download.MAX_WORKERS,
+        instruments_per_chunk: int = inputs.download.INSTRUMENTS_PER_CHUNK,
+        days_per_chunk: int = inputs.download.DAYS_PER_CHUNK,
+        use_cache: bool = True,
+        contracts: list = None
+    ) -> dict:
+    """
+    **fetchRawData** Downloads the raw layer: instrument set-up, readings and review levels for the selected instruments
+
+    :param contracts: Contracts whose instruments to download, e.g. ['1202'], or None for all contracts
+    :type list:
+
+    Returns a dictionary with the instruments, the review-level table, the readings store, the selected inclinometer
+    types, the key of the instrument selection, the readings window and a version, which changes with every download
+    and invalidates derived results.
+    """
+    # Set-up has to come first because it lists the instruments. The other downloads only need that list, so
+    # they run concurrently once it is available, each in its own status container.
+    def get_setup(results):
+        instruments = inputs.getInstrumentSetup(
+            subtype_list=subtype_dict,
+            imc_cc_selection=imc_cc_selection,
+            api_key=api_key
+        )
+        if contracts is None:
+            return instruments
+        # IMC instruments share the contract of the instruments they are paired with, so pairs are kept together
+        return {name: instrument for name, instrument in instruments.items() if instrument.contract in contracts}
+
+    def get_parent_child(results):
+        return inputs.getParentChildRelationships(
+            instruments=results['setup'],
+            api_key=api_key
+        )
+
+    def get_imc_pairing(results):
+        return inputs.identifyIMCPairing(
+            instruments=results['setup']
+        )
+
+    def get_readings(results):
+        return inputs.getInstrumentReadings(
+            instruments=results['setup'],
+            report_period=report_period,
+            buffer_start=buffer_start,
+            api_key=api_key,
+            max_workers=max_workers,
+            instruments_per_chunk=instruments_per_chunk,
+            days_per_chunk=days_per_chunk,
+            use_cache=use_cache
+        )
+
+    def get_review_levels(results):
+        reviewlevels_df = inputs.getReviewLevelTable(
+            instruments=results['setup'],
+            api_key=api_key
+        )
+        inputs.applyReviewLevels(
+            instruments=results['setup'],
+            reviewlevels_df=reviewlevels_df
+        )
+        return reviewlevels_df
+
+    def get_calibration(results):
+        return inputs.getCalibrationData(
+            instruments=results['setup'],
+            inclinometer_types=inclinometer_types,
+            api_key=api_key
+        )
+
+    # The downloads each write instrument attributes of their own. Parent-child relationships and IMC pairing both link
+    # instruments to each other, so pairing runs once the relationships are in rather than alongside them.
+    fetch_tasks = {
+        'setup': (get_setup, []),
+        'parent_child': (get_parent_child, ['setup']),
+        'imc_pairing': (get_imc_pairing, ['setup', 'parent_child']),
+        'readings': (get_readings, ['setup']),
+        'review_levels': (get_review_levels, ['setup'])
+    }
+    selected_inclinometer_types = sorted(set(subtype_dict) & set(inclinometer_types))
+    if selected_inclinometer_types:
+        fetch_tasks['calibration'] = (get_calibration, ['setup'])
+    fetch_results = orchestrate.runTasks(fetch_tasks)
+
+    # Map contractor 1202 sites ("A", "B", etc.) to IMR sites ("West of TCE", "TCE Station", "East of TCE")
+    instruments = processes.map1202Sites(instruments=fetch_results['setup'])
+
+    # Gather all readings into one long-format store for the batched processing stages. The store then holds the only
+    # copy of the readings, so that a session does not keep them twice.
+    readings_store = processes.buildReadingsStore(instruments=instruments)
+    for instrument in instruments.values():
+        instrument.readings = None
+
+    return {
+        'key': rawDataKey(subtype_dict, imc_cc_selection, inclinometer_types, contracts),
+        'window': readingsWindow(report_period, buffer_start),
+        'version': uuid.uuid4().hex,
+        'instruments': instruments,
+        'reviewlevels_df': fetch_results['review_levels'],
+        'inclinometer_types': selected_inclinometer_types,
+        'readings_store': readings_store
+    }
+
+
+def coversWindow(raw: dict, report_period: tuple, buffer_start: int) -> bool:
+    # Whether the downloaded readings include every reading needed for the report period
+    start_date, end_date = readingsWindow(report_period, buffer_start)
+    return raw['window'][0] <= start_date and end_date <= raw['window'][1]
+
+
+def windowStore(raw: dict, upstream: dict, params: dict):
+    # Restrict the store to the readings the report period would have downloaded, so that results do not depend on
+    # how much more was downloaded earlier
+    return raw['readings_store'].between(*readingsWindow(params['report_period'], params['buffer_start']))
+
+
+def summaryStage(raw: dict, upstream: dict, params: dict):
+    return processes.summariseReadings(
+        store=upstream['store'],
+        report_period=params['report_period']
+    )
+
+
+def exceedanceStage(raw: dict, upstream: dict, params: dict):
+    return processes.classifyExceedances(
+        store=upstream['store'],
+        reviewlevels_df=raw['reviewlevels_df'],
+        start_dates=processes.summaryStartDates(upstream['summary']),
+        report_period=params['report_period'],
+        period_exceedances=params['period_exceedances']
+    )
+
+
+def imcStage(raw: dict, upstream: dict, params: dict):
+    return processes.compareIMCReadings(
+        store=upstream['store'],
+        instruments=raw['instruments'],
+        report_period=params['report_period'],
+        imc_maxdatediff=params['imc_maxdatediff']
+    )
+
+
+def plotDataStage(raw: dict, upstream: dict, params: dict):
+    return processes.collatePlotData(
+        instruments=raw['instruments'],
+        summary_df=upstream['summary'],
+        imc_df=upstream['imc'],
+        exceedance_df=upstream['exceedance'],
+        reviewlevels_df=raw['reviewlevels_df']
+    )
+
+
+def appendixFStage(raw: dict, upstream: dict, params: dict):
+    return processes.collateAppendixF(all_data=upstream['plotdata'])
+
+
+def appendixGStage(raw: dict, upstream: dict, params: dict):
+    return processes.collateAppendixG(all_data=upstream['plotdata'])
+
+
+def inclinometerStoreStage(raw: dict, upstream: dict, params: dict):
+    if not raw['inclinometer_types']:
+        return None
+    return processes.rotateABToNE(
+        store=upstream['store'],
+        instruments=raw['instruments'],
+        inclinometer_types=raw['inclinometer_types']
+    )
+
+
+def inclinometerVectorStage(raw: dict, upstream: dict, params: dict):
+    if upstream['inclinometer_store'] is None:
+        return None
+    # The summary of the rotated store is part of building the vectors, so it is not reported as a stage of its own
+    return processes.collateInclinometerVectors(
+        instruments=raw['instruments'],
+        summary_df=processes.summaryTable(store=upstream['inclinometer_store'], report_period=params['report_period'])
+    )
+
+
+# Derived stages in the order they run: function, the analysis parameters it reads and the stages it reads
+DERIVED_STAGES = {
+    'store': (windowStore, ['report_period', 'buffer_start'], []),
+    'summary': (summaryStage, ['report_period'], ['store']),
+    'exceedance': (exceedanceStage, ['report_period', 'period_exceedances'], ['store', 'summary']),
+    'imc': (imcStage, ['report_period', 'imc_maxdatediff'], ['store']),
+    'plotdata': (plotDataStage, [], ['summary', 'imc', 'exceedance']),
+    'appendix_f': (appendixFStage, [], ['plotdata']),
+    'appendix_g': (appendixGStage, [], ['plotdata']),
+    'inclinometer_store': (inclinometerStoreStage, [], ['store']),
+    'inclinometer_vectors': (inclinometerVectorStage, ['report_period'], ['inclinometer_store'])
+}
+
+
+def runDerivedStages(raw: dict, derived: dict, params: dict) -> dict:
+    """
+    **runDerivedStages** Brings the derived layer up to date with the raw layer and analysis parameters, recomputing only what changed
+
+    A stage's key is the raw data version, the values of the parameters it reads and the keys of the stages it reads.
+    A stage runs again only when its key differs from the key it was last run with.
+
+    :param derived: Results of a previous run, keyed by stage name, each a dictionary of key and result. Updated in place.
+    :type dict:
+    :param params: Analysis parameters report_period, buffer_start, period_exceedances and imc_maxdatediff
+    :type dict:
+    """
+    for name, (function, param_names, dependencies) in DERIVED_STAGES.items():
+        key = (raw['version'], tuple(params[param_name] for param_name in param_names), tuple(derived[dependency]['key'] for dependency in dependencies))
+        if name in derived and derived[name]['key'] == key:
+            continue
+        derived[name] = {
+            'key': key,
+            'result': function(raw, {dependency: derived[dependency]['result'] for dependency in dependencies}, params)
+        }
+
+    return derived
@@ -1,10 +1,12 @@
 import pandas as pd
-import streamlit as st
+from status import statusContainer
 from contextlib import suppress
-from hk1980 import HK80
+from collections import OrderedDict
+from pyproj import Transformer
 import datetime
 import numpy as np
-import math
+import threading
+from classes import ReadingsStore
 
 def map1202Sites(instruments: dict) -> dict:
     mapping1202sites = {
@@ -31,329 +33,739 @@ def map1202Sites(instruments: dict) -> dict:
 
     return(instruments)
 
-def findSummaryOutput(instruments: dict, report_period: tuple) -> dict:
-    status_container = st.status(
+def buildReadingsStore(instruments: dict) -> ReadingsStore:
+    """
+    **buildReadingsStore** Gathers the readings of every instrument into one long-format ReadingsStore
+
+    Null values are left out, so an instrument's reading times in the store are those at which it has at least one value.
+    """
+    status_container = statusContainer(
+        label='Building readings store...',
+        expanded=False,
+        state='running'
+    )
+
+    # Build integer category codes directly, rather than hashing an instrument ID and field name for every value
+    instrument_codes, field_codes, timestamps, values = [], [], [], []
+    field_instrument_codes, field_name_codes = [], []
+    field_categories = {}
+    for instrument_code, instrument in enumerate(instruments.values()):
+        if instrument.readings is None:
+            continue
+        instr_fields = [field_name for field_name in instrument.readings.columns if field_name != 'Timestamp']
+        if not instr_fields:
+            continue
+        instr_field_codes = np.array([field_categories.setdefault(field_name, len(field_categories)) for field_name in instr_fields], dtype=np.int32)
+        field_instrument_codes.append(np.full(len(instr_fields), instrument_code, dtype=np.int32))
+        field_name_codes.append(instr_field_codes)
+        # Flatten the instrument's readings row by row, so that each instrument's values stay sorted by time then field
+        instr_values = np.column_stack([column.to_numpy(dtype=np.float64) for field_name, column in instrument.readings.items() if field_name != 'Timestamp']).ravel()
+        not_null = ~np.isnan(instr_values)
+        instrument_codes.append(np.full(not_null.sum(), instrument_code, dtype=np.int32))
+        field_codes.append(np.tile(instr_field_codes, len(instrument.readings))[not_null])
+        timestamps.append(np.repeat(instrument.readings['Timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64), len(instr_fields))[not_null])
+        values.append(instr_values[not_null])
+
+    def concatenate(arrays: list, dtype) -> np.ndarray:
+        return np.concatenate(arrays) if arrays else np.array([], dtype=dtype)
+
+    instrument_categories = pd.Index(list(instruments.keys()))
+    field_categories = pd.Index(list(field_categories.keys()), dtype=object)
+    readings_df = pd.DataFrame({
+        'instrument_id': pd.Categorical.from_codes(concatenate(instrument_codes, np.int32), categories=instrument_categories),
+        'field': pd.Categorical.from_codes(concatenate(field_codes, np.int32), categories=field_categories),
+        'timestamp': concatenate(timestamps, np.int64),
+        'value': concatenate(values, np.float64)
+    })
+    # Instruments' readings may arrive out of time order
+    readings_df = readings_df.sort_values(by=['instrument_id', 'timestamp'], kind='stable').reset_index(drop=True)
+    fields_df = pd.DataFrame({
+        'instrument_id': pd.Categorical.from_codes(concatenate(field_instrument_codes, np.int32), categories=instrument_categories),
+        'field': pd.Categorical.from_codes(concatenate(field_name_codes, np.int32), categories=field_categories)
+    })
+    store = ReadingsStore(readings=readings_df, fields=fields_df)
+
+    status_container.record(rows_in=len(instruments), rows_out=len(readings_df))
+    status_container.update(
+        label='Built readings store! {:,} values from {:,} instruments in {:.1f} MB'.format(len(readings_df), readings_df['instrument_id'].nunique(), store.memoryUsage() / 1e6),
+        state='complete',
+        expanded=False
+    )
+
+    return(store)
+
+
+def summariseReadings(store: ReadingsStore, report_period: tuple) -> pd.DataFrame:
+    """
+    **summariseReadings** Finds the start, end, change, maximum and minimum of every field of every instrument at once
+
+    The end reading is an instrument's latest reading. The start reading is its latest reading at or before the day after
+    the period start date. The maximum and minimum are taken over readings from the period start date onwards.
+    Returns one row per (instrument_id, field) for instruments with any readings.
+    """
+    status_container = statusContainer(
         label='Finding summary output...',
         expanded=False,
         state='running'
     )
 
-    for instrument in instruments.values():
-        if instrument.readings is not None:
-            if not instrument.readings.drop(columns='Timestamp').isnull().all(axis=None):
-                readings = instrument.readings.loc[~instrument.readings.drop(columns='Timestamp').isnull().all(axis=1)].reset_index(drop=True)
-                if not readings.empty:
-                    instrument.end_reading = readings.iloc[readings['Timestamp'].idxmax()]
-                    if not readings.loc[readings['Timestamp'] <= pd.to_datetime(report_period[0] + datetime.timedelta(days=1))].empty:
-                        instrument.start_reading = readings.iloc[readings['Timestamp'].loc[readings['Timestamp'] <= pd.to_datetime(report_period[0] + datetime.timedelta(days=1))].idxmax()]
-                        instrument.change = instrument.end_reading - instrument.start_reading
-                    if not readings.loc[(readings['Timestamp'] >= pd.to_datetime(report_period[0]))].empty:
-                        instrument.max_in_period = readings.loc[readings['Timestamp'] >= pd.to_datetime(report_period[0])].max(axis=0)
-                        instrument.min_in_period = readings.loc[readings['Timestamp'] >= pd.to_datetime(report_period[0])].min(axis=0)
+    summary_df = summaryTable(store, report_period)
 
+    status_container.record(rows_in=len(store.readings), rows_out=len(summary_df))
     status_container.update(
         label='Found summary output!',
         state='complete',
         expanded=False
     )
 
-    return(instruments)
+    return summary_df
+
+
+def summaryTable(store: ReadingsStore, report_period: tuple) -> pd.DataFrame:
+    # The table of summariseReadings without a status of its own, for stages which summarise as part of their work
+    readings = store.readings
+    codes = readings['instrument_id'].cat.codes.to_numpy()
+    timestamps = readings['timestamp'].to_numpy()
+    starts = store.offsets['start'].to_numpy()
+    stops = store.offsets['stop'].to_numpy()
+    num_instruments = len(starts)
+    has_readings = stops > starts
+    start_cutoff = pd.Timestamp(report_period[0] + datetime.timedelta(days=1)).value
+    period_start = pd.Timestamp(report_period[0]).value
+
+    # Readings are sorted by time within each instrument, so the end reading is at the last row of each instrument,
+    # readings up to the start cut-off are a prefix and readings within the period are a suffix of its rows.
+    missing = np.iinfo(np.int64).min
+    end_timestamps = np.full(num_instruments, missing)
+    end_timestamps[has_readings] = timestamps[stops[has_readings] - 1]
+    num_before = np.bincount(codes[timestamps <= start_cutoff], minlength=num_instruments)
+    has_start = num_before > 0
+    start_timestamps = np.full(num_instruments, missing)
+    start_timestamps[has_start] = timestamps[starts[has_start] + num_before[has_start] - 1]
+    in_period = timestamps >= period_start
+
+    index_columns = ['instrument_id', 'field']
+    end_values = readings.loc[timestamps == end_timestamps[codes]].set_index(index_columns)['value']
+    start_values = readings.loc[timestamps == start_timestamps[codes]].set_index(index_columns)['value']
+    period_values = readings.loc[in_period].groupby(index_columns, observed=True, sort=False)['value'].agg(['max', 'min'])
+
+    summary_df = store.fields.loc[has_readings[store.fields['instrument_id'].cat.codes.to_numpy()]].set_index(index_columns, drop=False)
+    summary_df = summary_df.assign(
+        start_value=start_values.reindex(summary_df.index).to_numpy(),
+        end_value=end_values.reindex(summary_df.index).to_numpy(),
+        max_in_period_value=period_values['max'].reindex(summary_df.index).to_numpy(),
+        min_in_period_value=period_values['min'].reindex(summary_df.index).to_numpy()
+    )
+    summary_df['change_value'] = summary_df['end_value'] - summary_df['start_value']
 
+    instrument_codes = summary_df['instrument_id'].cat.codes.to_numpy()
+    summary_df['start_date'] = pd.to_datetime(np.where(has_start[instrument_codes], start_timestamps[instrument_codes], missing))
+    summary_df['end_date'] = pd.to_datetime(end_timestamps[instrument_codes])
+    summary_df['change_period'] = summary_df['end_date'] - summary_df['start_date']
 
-def findInclinometerOutput(
+    return summary_df.reset_index(drop=True)
+
+
+# Cumulative displacement fields of inclinometer children along their A and B axes, and the scale of plotted vectors
+INCLINOMETER_DISPLACEMENT_FIELDS = {
+    'A': 'child_cumulative_displacement_a',
+    'B': 'child_cumulative_displacement_b'
+}
+INCLINOMETER_DISPLACEMENT_SCALE_FACTOR = 100 / 1000
+INCLINOMETER_VECTOR_COLUMNS = ['id', 'x', 'y', 'z', 'u', 'v', 'w', 'contract', 'site']
+
+
+def rotateABToNE(
+        store: ReadingsStore,
         instruments: dict,
         inclinometer_types: list,
-        displacement_scale_factor: float
-):
-    status_container = st.status(
-        label='Building a tabular inclinometer summary for output...',
+        inclinometer_displacement_fields: dict = INCLINOMETER_DISPLACEMENT_FIELDS
+    ) -> ReadingsStore:
+    """
+    **rotateABToNE** Rotates the A and B displacements of every inclinometer child to north and east in one operation
+
+    Each child takes the bearing of its first parent. Returns a ReadingsStore sharing the instrument categories of store,
+    with fields north_displacement and east_displacement at every reading time of each rotated child. Unlike other
+    stores it keeps NaN values where A or B is missing, so that summaries start and end at the child's reading times.
+    """
+    status_container = statusContainer(
+        label='Converting A and B to N and E inclinometer readings...',
         expanded=False,
         state='running'
     )
 
-    inclinometer_children = [instrument for instrument in instruments.values() if (instrument.type in inclinometer_types) & (instrument.parents is not None) & (instrument.readings is not None)]
-    inc_plotdata_list = [[
-        instrument.id,
-        instrument.easting + displacement_scale_factor * instrument.start_reading['east_displacement'],
-        instrument.northing + displacement_scale_factor * instrument.start_reading['north_displacement'],
-        instrument.instrument_level,
-        displacement_scale_factor * instrument.change['east_displacement'],
-        displacement_scale_factor * instrument.change['north_displacement'],
-        0,
-        instrument.contract,
-        instrument.site
-    ] for instrument in inclinometer_children if (instrument.change is not None) & bool(list(set(['east_displacement', 'north_displacement']) & set(instrument.readings.columns)))]
-    inc_plotdata_df = pd.DataFrame(
-        data=inc_plotdata_list,
-        columns=[
-            'id',
-            'x',
-            'y',
-            'z',
-            'u',
-            'v',
-            'w',
-            'contract',
-            'site'
-        ]
+    readings = store.readings
+    instrument_ids = readings['instrument_id'].cat.categories
+
+    # Bearing of the first parent of each inclinometer child, indexed by instrument code and NaN where unknown
+    bearings = np.full(len(instrument_ids), np.nan)
+    children = [(instr_id, instruments[instrument.parents[0]].bearing) for instr_id, instrument in instruments.items()
+                if instrument.type in inclinometer_types and instrument.parents
+                and instrument.parents[0] in instruments and instruments[instrument.parents[0]].bearing is not None]
+    child_codes = instrument_ids.get_indexer([instr_id for instr_id, _ in children])
+    bearings[child_codes[child_codes >= 0]] = np.array([bearing for _, bearing in children], dtype=float)[child_codes >= 0]
+
+    codes = readings['instrument_id'].cat.codes.to_numpy()
+    field_codes = readings['field'].cat.codes.to_numpy()
+    a_code, b_code = readings['field'].cat.categories.get_indexer([inclinometer_displacement_fields['A'], inclinometer_displacement_fields['B']])
+    timestamps = readings['timestamp'].to_numpy()
+    has_bearing = ~np.isnan(bearings[codes])
+    axis_dfs = [pd.DataFrame({
+        'code': codes[rows],
+        'timestamp': timestamps[rows],
+        'value': readings['value'].to_numpy()[rows]
+    }) for rows in [np.flatnonzero(has_bearing & (field_codes == field_code)) for field_code in [a_code, b_code]]]
+
+    # Distinct reading times of the children with both fields, in store order, which left merges keep
+    has_ab = np.zeros(len(instrument_ids), dtype=bool)
+    has_ab[np.intersect1d(axis_dfs[0]['code'].to_numpy(), axis_dfs[1]['code'].to_numpy())] = True
+    first_rows = np.flatnonzero(np.r_[True, (codes[1:] != codes[:-1]) | (timestamps[1:] != timestamps[:-1])] & has_ab[codes])
+    ab_df = pd.DataFrame({'code': codes[first_rows], 'timestamp': timestamps[first_rows]}) \
+        .merge(axis_dfs[0], on=['code', 'timestamp'], how='left') \
+        .merge(axis_dfs[1], on=['code', 'timestamp'], how='left', suffixes=('_a', '_b'))
+
+    radians = np.radians(bearings[ab_df['code'].to_numpy()])
+    cos_bearing, sin_bearing = np.cos(radians), np.sin(radians)
+    a_values, b_values = ab_df['value_a'].to_numpy(), ab_df['value_b'].to_numpy()
+    ne_values = np.column_stack([a_values * cos_bearing - b_values * sin_bearing, a_values * sin_bearing + b_values * cos_bearing])
+
+    field_categories = ['north_displacement', 'east_displacement']
+    ne_readings = pd.DataFrame({
+        'instrument_id': pd.Categorical.from_codes(np.repeat(ab_df['code'].to_numpy(), 2), categories=instrument_ids),
+        'field': pd.Categorical.from_codes(np.tile(np.arange(2, dtype=np.int8), len(ab_df)), categories=field_categories),
+        'timestamp': np.repeat(ab_df['timestamp'].to_numpy(), 2),
+        'value': ne_values.ravel()
+    })
+    ne_codes = np.unique(ab_df['code'].to_numpy())
+    ne_fields = pd.DataFrame({
+        'instrument_id': pd.Categorical.from_codes(np.repeat(ne_codes, 2), categories=instrument_ids),
+        'field': pd.Categorical.from_codes(np.tile(np.arange(2, dtype=np.int8), len(ne_codes)), categories=field_categories)
+    })
+    ne_store = ReadingsStore(readings=ne_readings, fields=ne_fields)
+
+    status_container.record(rows_in=len(readings), rows_out=len(ne_readings))
+    status_container.update(
+        label='Converted A and B to N and E inclinometer readings!',
+        state='complete',
+        expanded=False
+    )
+
+    return ne_store
+
+
+def collateInclinometerVectors(
+        instruments: dict,
+        summary_df: pd.DataFrame,
+        displacement_scale_factor: float = INCLINOMETER_DISPLACEMENT_SCALE_FACTOR
+    ) -> pd.DataFrame:
+    """
+    **collateInclinometerVectors** Builds the inclinometer vector table, with one row per inclinometer child
+
+    Vectors start at the child's location displaced by its scaled start displacement and point along its scaled change
+    in displacement.
+
+    :param summary_df: Summary table of the store from rotateABToNE, from summaryTable
+    :type pd.DataFrame:
+    """
+    status_container = statusContainer(
+        label='Building a tabular inclinometer summary for output...',
+        expanded=False,
+        state='running'
     )
 
+    summary_df = summary_df.assign(instrument_id=summary_df['instrument_id'].astype(str), field=summary_df['field'].astype(str))
+    vectors_df = summary_df.pivot(index='instrument_id', columns='field', values=['start_value', 'change_value']) \
+        .reindex(columns=pd.MultiIndex.from_product([['start_value', 'change_value'], ['east_displacement', 'north_displacement']]))
+    children = [instruments[instr_id] for instr_id in vectors_df.index]
+    inc_plotdata_df = pd.DataFrame({
+        'id': vectors_df.index.to_numpy(),
+        'x': np.array([instrument.easting for instrument in children], dtype=float) + displacement_scale_factor * vectors_df[('start_value', 'east_displacement')].to_numpy(),
+        'y': np.array([instrument.northing for instrument in children], dtype=float) + displacement_scale_factor * vectors_df[('start_value', 'north_displacement')].to_numpy(),
+        'z': [instrument.instrument_level for instrument in children],
+        'u': displacement_scale_factor * vectors_df[('change_value', 'east_displacement')].to_numpy(),
+        'v': displacement_scale_factor * vectors_df[('change_value', 'north_displacement')].to_numpy(),
+        'w': 0,
+        'contract': [instrument.contract for instrument in children],
+        'site': [instrument.site for instrument in children]
+    }, columns=INCLINOMETER_VECTOR_COLUMNS)
+
+    status_container.record(rows_in=len(summary_df), rows_out=len(inc_plotdata_df))
     status_container.update(
         label='Built a tabular inclinometer summary!',
         state='complete',
         expanded=False
     )
-    st.write(inc_plotdata_df)
 
-    return(inc_plotdata_df)
+    return inc_plotdata_df
+
 
+def findInclinometerOutput(
+        instruments: dict,
+        inclinometer_types: list,
+        displacement_scale_factor: float,
+        summary_df: pd.DataFrame
+):
+    # summary_df summarises the store from rotateABToNE, which holds the inclinometer_types children only
+    return(collateInclinometerVectors(instruments, summary_df, displacement_scale_factor))
 
 
 def ab_to_ne(
         instruments: dict,
         inclinometer_types: list,
-        inclinometer_displacement_fields: dict
+        inclinometer_displacement_fields: dict,
+        store: ReadingsStore = None
     ) -> dict:
+    if store is None:
+        store = buildReadingsStore(instruments)
+    ne_store = rotateABToNE(store, instruments, inclinometer_types, inclinometer_displacement_fields)
 
-    status_container = st.status(
-        label='Converting A and B to N and E inclinometer readings...',
+    # Write the rotated displacements back to each child's readings, aligned on reading time
+    for instr_id in ne_store.offsets.index[ne_store.offsets['stop'] > ne_store.offsets['start']]:
+        if instruments[instr_id].readings is None:
+            continue
+        ne_df = ne_store.wide(instr_id).set_index('Timestamp')
+        timestamps = instruments[instr_id].readings['Timestamp']
+        instruments[instr_id].readings['north_displacement'] = timestamps.map(ne_df['north_displacement']).to_numpy()
+        instruments[instr_id].readings['east_displacement'] = timestamps.map(ne_df['east_displacement']).to_numpy()
+
+    return(instruments)
+
+
+def compareIMCReadings(
+        store: ReadingsStore,
+        instruments: dict,
+        report_period: tuple,
+        imc_maxdatediff: float
+    ) -> pd.DataFrame:
+    """
+    **compareIMCReadings** Finds the closest-in-time pair of readings of every IMC and Contractor pair at once
+
+    Only reading times within the report period are paired, and only pairs at most imc_maxdatediff days apart are kept.
+    Ties go to the earliest IMC reading, then to the earliest Contractor reading. Returns one row per (instrument_id,
+    field) for both instruments of each matched pair, with the instrument's compare_value and compare_date, and its
+    diff_value and diff_date relative to the other instrument of the pair.
+    """
+    status_container = statusContainer(
+        label='Comparing IMC and Contractor readings...',
         expanded=False,
         state='running'
     )
 
-    inclinometer_instruments = [instrument for instrument in instruments.values() if instrument.type in inclinometer_types]
-    for instrument in inclinometer_instruments:
-        # Assume only one parent
-        if (instrument.parents is not None) & (instrument.readings is not None):
-            parent_instrument = instruments[instrument.parents[0]]
-            if (parent_instrument.bearing is not None) & all([field_name in instrument.readings.columns for field_name in inclinometer_displacement_fields.values()]):
-                cos_bearing = math.cos(math.radians(parent_instrument.bearing))
-                sin_bearing = math.sin(math.radians(parent_instrument.bearing))
-                instrument.readings['north_displacement'] = instrument.readings[inclinometer_displacement_fields['A']] * cos_bearing - instrument.readings[inclinometer_displacement_fields['B']] * sin_bearing
-                instrument.readings['east_displacement'] = instrument.readings[inclinometer_displacement_fields['A']] * sin_bearing + instrument.readings[inclinometer_displacement_fields['B']] * cos_bearing
+    readings = store.readings
+    instrument_ids = readings['instrument_id'].cat.categories
+    pairs = [(instr_id, instrument.imc_id) for instr_id, instrument in instruments.items()
+             if not instrument.is_imc and instrument.imc_id is not None and instrument.imc_id in instruments]
+    contractor_codes = instrument_ids.get_indexer([contractor_id for contractor_id, _ in pairs])
+    imc_codes = instrument_ids.get_indexer([imc_id for _, imc_id in pairs])
+
+    # Distinct reading times of each instrument within the report period. The store holds non-null values only, so
+    # these are the times at which an instrument has at least one value.
+    codes = readings['instrument_id'].cat.codes.to_numpy()
+    timestamps = readings['timestamp'].to_numpy()
+    in_period = (timestamps >= pd.Timestamp(report_period[0]).value) & (timestamps <= pd.Timestamp(report_period[1] + datetime.timedelta(days=1)).value)
+    times_df = pd.DataFrame({'code': codes[in_period], 'timestamp': timestamps[in_period]}).drop_duplicates()
+
+    # For each IMC reading time, the nearest Contractor reading time of its pair, preferring the earlier on a tie
+    pairs_df = pd.DataFrame({'pair': np.arange(len(pairs)), 'contractor_code': contractor_codes, 'imc_code': imc_codes})
+    imc_times = times_df.merge(pairs_df, left_on='code', right_on='imc_code').rename(columns={'timestamp': 'imc_timestamp'})
+    contractor_times = times_df.merge(pairs_df[['pair', 'contractor_code']], left_on='code', right_on='contractor_code')
+    nearest_df = pd.merge_asof(
+        imc_times[['pair', 'contractor_code', 'imc_code', 'imc_timestamp']].sort_values('imc_timestamp'),
+        contractor_times[['pair', 'timestamp']].sort_values('timestamp').rename(columns={'timestamp': 'contractor_timestamp'}),
+        left_on='imc_timestamp',
+        right_on='contractor_timestamp',
+        by='pair',
+        direction='nearest',
+        tolerance=int(pd.Timedelta(days=imc_maxdatediff).value)
+    ).dropna(subset='contractor_timestamp')
+    nearest_df['contractor_timestamp'] = nearest_df['contractor_timestamp'].astype(np.int64)
+    nearest_df['date_diff'] = (nearest_df['contractor_timestamp'] - nearest_df['imc_timestamp']).abs()
+    matches_df = nearest_df.sort_values(['pair', 'date_diff', 'imc_timestamp'], kind='stable').drop_duplicates('pair')
+
+    # Each matched pair compares in both directions: Contractor against IMC and IMC against Contractor
+    sides_df = pd.concat([
+        pd.DataFrame({
+            'code': matches_df['contractor_code'].to_numpy(),
+            'timestamp': matches_df['contractor_timestamp'].to_numpy(),
+            'partner_code': matches_df['imc_code'].to_numpy(),
+            'partner_timestamp': matches_df['imc_timestamp'].to_numpy()
+        }),
+        pd.DataFrame({
+            'code': matches_df['imc_code'].to_numpy(),
+            'timestamp': matches_df['imc_timestamp'].to_numpy(),
+            'partner_code': matches_df['contractor_code'].to_numpy(),
+            'partner_timestamp': matches_df['contractor_timestamp'].to_numpy()
+        })
+    ], ignore_index=True)
+    fields_df = pd.DataFrame({
+        'code': store.fields['instrument_id'].cat.codes.to_numpy(),
+        'field_code': store.fields['field'].cat.codes.to_numpy()
+    })
+    values_df = pd.DataFrame({
+        'code': codes,
+        'timestamp': timestamps,
+        'field_code': readings['field'].cat.codes.to_numpy(),
+        'value': readings['value'].to_numpy()
+    }).loc[in_period]
+    compare_df = sides_df.merge(fields_df, on='code')
+    compare_df = compare_df.merge(values_df, on=['code', 'timestamp', 'field_code'], how='left')
+    compare_df = compare_df.merge(
+        values_df.rename(columns={'code': 'partner_code', 'timestamp': 'partner_timestamp', 'value': 'partner_value'}),
+        on=['partner_code', 'partner_timestamp', 'field_code'],
+        how='left'
+    )
 
+    status_container.record(rows_in=len(readings), rows_out=len(compare_df))
     status_container.update(
-        label='Converted A and B to N and E inclinometer readings!',
+        label='Compared IMC and Contractor readings!',
         state='complete',
         expanded=False
     )
 
-    return(instruments)    
+    return pd.DataFrame({
+        'instrument_id': pd.Categorical.from_codes(compare_df['code'], categories=instrument_ids),
+        'field': pd.Categorical.from_codes(compare_df['field_code'], categories=readings['field'].cat.categories),
+        'partner_id': pd.Categorical.from_codes(compare_df['partner_code'], categories=instrument_ids),
+        'compare_value': compare_df['value'],
+        'compare_date': pd.to_datetime(compare_df['timestamp']),
+        'diff_value': compare_df['value'] - compare_df['partner_value'],
+        'diff_date': pd.to_timedelta(compare_df['timestamp'] - compare_df['partner_timestamp'])
+    })
+
+
+def applyIMCComparison(instruments: dict, imc_df: pd.DataFrame) -> dict:
+    # Populate the per-instrument comparison Series from the IMC comparison table
+    for instr_id, instr_compare in imc_df.groupby('instrument_id', observed=True, sort=False):
+        instrument = instruments[instr_id]
+        index = ['Timestamp'] + instr_compare['field'].astype(str).tolist()
+        instrument.imc_compare_reading = pd.Series([instr_compare['compare_date'].iloc[0]] + instr_compare['compare_value'].tolist(), index=index)
+        instrument.end_imc_diff = pd.Series([instr_compare['diff_date'].iloc[0]] + instr_compare['diff_value'].tolist(), index=index)
+
+    return(instruments)
 
 
 def compareIMCWithContractor(
         instruments: dict,
         report_period: tuple,
-        imc_maxdatediff: int
+        imc_maxdatediff: int,
+        store: ReadingsStore = None
     ) -> dict:
-    status_container = st.status(
-        label='Comparing IMC and Contractor readings...',
+    imc_df = compareIMCReadings(
+        store=store if store is not None else buildReadingsStore(instruments),
+        instruments=instruments,
+        report_period=report_period,
+        imc_maxdatediff=imc_maxdatediff
+    )
+    instruments = applyIMCComparison(instruments, imc_df)
+
+    return(instruments)
+
+
+def recode(values: pd.Series, categories: pd.Index) -> np.ndarray:
+    # Positions of values in categories, -1 where absent, looking up only the distinct values of a categorical
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        positions = categories.get_indexer(values.cat.categories.astype(str))
+        return np.where(values.cat.codes.to_numpy() >= 0, positions[values.cat.codes.to_numpy()], -1)
+    return categories.get_indexer(values.astype(str))
+
+
+REVIEWLEVEL_NAMES = ['alert', 'alarm', 'action']
+
+
+def classifyExceedances(
+        store: ReadingsStore,
+        reviewlevels_df: pd.DataFrame,
+        start_dates: pd.Series,
+        report_period: tuple,
+        period_exceedances: bool
+    ) -> pd.DataFrame:
+    """
+    **classifyExceedances** Finds the extreme reading and the highest review level it exceeds for every instrument field and direction at once
+
+    Readings are taken from the period start date if period_exceedances, or otherwise from the instrument's start date.
+    Instruments without a start date use all their readings. The extreme is the earliest maximum for upper review levels
+    and the earliest minimum for lower review levels. Levels are checked in the order alert, alarm, action, and a level
+    only counts as exceeded if the levels before it are exceeded too.
+
+    :param start_dates: Start reading dates indexed by instrument ID, NaT where an instrument has no start reading
+    :type pd.Series:
+    Returns one row per (instrument_id, field, direction) with the exceeded level (None if no level is exceeded), and
+    the extreme value and date.
+    """
+    status_container = statusContainer(
+        label='Finding maximum exceedances...',
         expanded=False,
         state='running'
     )
 
-    for instrument in instruments.values():
-        if instrument.is_imc or instrument.imc_id is None:
-            continue
-        if instrument.readings is not None and instruments[instrument.imc_id].readings is not None:
-            # Constrain readings strictly within selected report period.
-            readings = instrument.readings.loc[(instrument.readings['Timestamp'] >= pd.to_datetime(report_period[0])) & (instrument.readings['Timestamp'] <= pd.to_datetime(report_period[1] + datetime.timedelta(days=1)))]
-            readings_imc = instruments[instrument.imc_id].readings.loc[(instruments[instrument.imc_id].readings['Timestamp'] >= pd.to_datetime(report_period[0])) & (instruments[instrument.imc_id].readings['Timestamp'] <= pd.to_datetime(report_period[1] + datetime.timedelta(days=1)))]
-            
-            if not readings.drop(columns='Timestamp').isnull().all(axis=None) and not readings_imc.drop(columns='Timestamp').isnull().all(axis=None):
-                readings = readings.loc[~readings.drop(columns='Timestamp').isnull().all(axis=1)].reset_index(drop=True)
-                readings_imc = readings_imc.loc[~readings_imc.drop(columns='Timestamp').isnull().all(axis=1)].reset_index(drop=True)
-
-                # Find IMC-contractor readings pair with the minimum date separation.
-                date_diffs = pd.DataFrame(abs(readings['Timestamp'].values - readings_imc['Timestamp'].values[:, None]))
-                index_imc, index = date_diffs.stack().idxmin()
-
-                if date_diffs.iloc[(index_imc, index)] / datetime.timedelta(days=1) <= imc_maxdatediff:
-                    instrument.imc_compare_reading = readings.iloc[index]
-                    instruments[instrument.imc_id].imc_compare_reading = readings_imc.iloc[index_imc]
-                    instrument.end_imc_diff = readings.iloc[index] - readings_imc.iloc[index_imc]
-                    instruments[instrument.imc_id].end_imc_diff = readings_imc.iloc[index_imc] - readings.iloc[index]
-
+    readings = store.readings
+    instrument_ids = readings['instrument_id'].cat.categories
+    field_names = readings['field'].cat.categories
+
+    # Review levels as one row of alert, alarm and action thresholds per instrument field and direction
+    levels_df = reviewlevels_df[['instrument', 'field', 'direction', 'level', 'value']].reset_index(drop=True)
+    levels_df = levels_df.loc[levels_df['direction'].isin(['upper', 'lower']) & levels_df['level'].isin(REVIEWLEVEL_NAMES)]
+    levels_df = levels_df.assign(
+        code=recode(levels_df['instrument'], instrument_ids),
+        field_code=recode(levels_df['field'], field_names),
+        direction=levels_df['direction'].astype(str),
+        level=levels_df['level'].astype(str)
+    )
+    levels_df = levels_df.loc[(levels_df['code'] >= 0) & (levels_df['field_code'] >= 0)]
+    thresholds_df = levels_df.pivot_table(index=['code', 'field_code', 'direction'], columns='level', values='value', aggfunc='last') \
+        .reindex(columns=REVIEWLEVEL_NAMES).reset_index()
+
+    # Readings within each instrument's exceedance window, of fields which have review levels
+    codes = readings['instrument_id'].cat.codes.to_numpy().astype(np.int64)
+    field_codes = readings['field'].cat.codes.to_numpy().astype(np.int64)
+    timestamps = readings['timestamp'].to_numpy()
+    instr_start_dates = pd.to_datetime(start_dates.reindex(instrument_ids))
+    cutoffs = np.where(instr_start_dates.isnull(), np.iinfo(np.int64).min,
+                       pd.Timestamp(report_period[0]).value if period_exceedances else instr_start_dates.to_numpy(dtype='datetime64[ns]').view(np.int64))
+    keys = codes * len(field_names) + field_codes
+    threshold_keys = thresholds_df['code'].to_numpy(dtype=np.int64) * len(field_names) + thresholds_df['field_code'].to_numpy(dtype=np.int64)
+    in_window = (timestamps >= cutoffs[codes]) & np.isin(keys, threshold_keys)
+
+    # The first row of the greatest and of the least value of each instrument field
+    values = pd.Series(readings['value'].to_numpy()[in_window], index=np.flatnonzero(in_window))
+    grouped = values.groupby(keys[in_window], sort=False)
+    extremes_df = pd.concat([
+        pd.DataFrame({'key': grouped.idxmax().index, 'direction': 'upper', 'row': grouped.idxmax().to_numpy()}),
+        pd.DataFrame({'key': grouped.idxmin().index, 'direction': 'lower', 'row': grouped.idxmin().to_numpy()})
+    ], ignore_index=True)
+    exceedance_df = thresholds_df.assign(key=threshold_keys).merge(extremes_df, on=['key', 'direction'])
+
+    # Lower levels are compared as upper levels of the negated values. Taking the running maximum of the thresholds in
+    # level order makes each row a sorted threshold vector, so the levels exceeded are always the first few.
+    rows = exceedance_df['row'].to_numpy()
+    sign = np.where(exceedance_df['direction'] == 'upper', 1.0, -1.0)
+    signed_thresholds = exceedance_df[REVIEWLEVEL_NAMES].to_numpy() * sign[:, None]
+    sorted_thresholds = np.fmax.accumulate(signed_thresholds, axis=1)
+    exceeded = ~np.isnan(signed_thresholds) & ((readings['value'].to_numpy()[rows] * sign)[:, None] >= sorted_thresholds)
+    level_index = (exceeded * np.arange(1, len(REVIEWLEVEL_NAMES) + 1)).max(axis=1, initial=0)
+
+    status_container.record(rows_in=len(readings), rows_out=len(rows))
     status_container.update(
-        label='Compared IMC and Contractor readings!',
+        label='Found maximum exceedances!',
         state='complete',
         expanded=False
     )
 
+    return pd.DataFrame({
+        'instrument_id': pd.Categorical.from_codes(exceedance_df['code'], categories=instrument_ids),
+        'field': pd.Categorical.from_codes(exceedance_df['field_code'], categories=field_names),
+        'direction': exceedance_df['direction'],
+        'level': pd.Categorical.from_codes(level_index - 1, categories=REVIEWLEVEL_NAMES),
+        'value': readings['value'].to_numpy()[rows],
+        'date': pd.to_datetime(timestamps[rows])
+    })
+
+
+def applyExceedances(instruments: dict, exceedance_df: pd.DataFrame) -> dict:
+    # Populate the nested maxexceedance dictionaries of each instrument from the exceedance table
+    for instr_id, field_name, direction, level, value, date in exceedance_df.itertuples(index=False, name=None):
+        instrument = instruments[instr_id]
+        if instrument.maxexceedance is None:
+            instrument.maxexceedance = {}
+        instrument.maxexceedance.setdefault(field_name, {})[direction] = {
+            'maxabs_reading': pd.Series([date, value], index=['Timestamp', field_name]),
+            'level': None if pd.isnull(level) else level
+        }
+
     return(instruments)
 
 
 def findMaxExceedance(
         instruments: dict,
         report_period: tuple,
-        period_exceedances: bool
+        period_exceedances: bool,
+        store: ReadingsStore = None,
+        reviewlevels_df: pd.DataFrame = None
     ) -> dict:
-    status_container = st.status(
-        label='Finding maximum exceedances...',
-        expanded=False,
-        state='running'
+    if reviewlevels_df is None:
+        reviewlevels_df = pd.DataFrame.from_records([
+            (instr_id, field_name, direction, level, value)
+            for instr_id, instrument in instruments.items() if instrument.review_levels is not None
+            for field_name, directions in instrument.review_levels.items()
+            for direction, levels in directions.items()
+            for level, value in levels.items()
+        ], columns=['instrument', 'field', 'direction', 'level', 'value'])
+    if store is None:
+        store = buildReadingsStore(instruments)
+    exceedance_df = classifyExceedances(
+        store=store,
+        reviewlevels_df=reviewlevels_df,
+        start_dates=summaryStartDates(summaryTable(store, report_period)),
+        report_period=report_period,
+        period_exceedances=period_exceedances
     )
+    instruments = applyExceedances(instruments, exceedance_df)
 
-    for instrument in instruments.values():
-        if instrument.readings is None or instrument.review_levels is None:
-            continue
+    return(instruments)
 
-        field_names = list(instrument.readings)
-        if 'Timestamp' in field_names:
-            field_names.remove('Timestamp')
-
-        for field_name in field_names:
-            if instrument.start_reading is not None:
-                readings = instrument.readings.loc[instrument.readings['Timestamp'] >= {
-                    False: instrument.start_reading['Timestamp'],
-                    True: pd.to_datetime(report_period[0])
-                }[period_exceedances]]
-            else:
-                readings = instrument.readings
-            
-            if field_name not in instrument.review_levels.keys():
-                continue
-            
-            if readings[field_name].isnull().all():
-                continue
-            
-            reviewlevel_dict = instrument.review_levels[field_name]
-            instrument.maxexceedance = {}
 
-            for review_direction, review_levels in reviewlevel_dict.items():
-                exceeding_readings = readings
-
-                match review_direction:
-                    case 'upper':
-                        instrument.maxexceedance.setdefault(field_name, {})[review_direction] = {
-                            'maxabs_reading': exceeding_readings.loc[exceeding_readings[field_name].idxmax()],
-                            'level': None
-                        }
-                    case 'lower':
-                        instrument.maxexceedance.setdefault(field_name, {})[review_direction] = {
-                            'maxabs_reading': exceeding_readings.loc[exceeding_readings[field_name].idxmin()],
-                            'level': None
-                        }
-
-                for reviewlevel_name in ['alert', 'alarm', 'action']:
-                    if reviewlevel_name in review_levels:
-                        match review_direction:
-                            case 'upper':
-                                exceeding_readings = readings.loc[readings[field_name] >= review_levels[reviewlevel_name]].reset_index()
-                            case 'lower':
-                                exceeding_readings = readings.loc[readings[field_name] <= review_levels[reviewlevel_name]].reset_index()
-                        if exceeding_readings.empty:
-                            break
-                        else:
-                            match review_direction:
-                                case 'upper':
-                                    instrument.maxexceedance[field_name][review_direction]['maxabs_reading'] = exceeding_readings.iloc[exceeding_readings[field_name].idxmax()]
-                                case 'lower':
-                                    instrument.maxexceedance[field_name][review_direction]['maxabs_reading'] = exceeding_readings.iloc[exceeding_readings[field_name].idxmin()]
-                            instrument.maxexceedance[field_name][review_direction]['level'] = reviewlevel_name
+PLOTDATA_REVIEWLEVEL_COLUMNS = ['lower_alert', 'lower_alarm', 'lower_action', 'upper_alert', 'upper_alarm', 'upper_action']
 
-    status_container.update(
-        label='Found maximum exceedances!',
-        state='complete',
-        expanded=False
-    )
-    
-    return(instruments)        
+
+def summaryStartDates(summary_df: pd.DataFrame) -> pd.Series:
+    # Start reading date of each instrument in the summary table, NaT where it has no start reading
+    return summary_df.groupby('instrument_id', observed=True, sort=False)['start_date'].first()
 
 
-def collatePlotData(instruments: dict) -> pd.DataFrame:
-    status_container = st.status(
+def collatePlotData(
+        instruments: dict,
+        summary_df: pd.DataFrame,
+        imc_df: pd.DataFrame,
+        exceedance_df: pd.DataFrame,
+        reviewlevels_df: pd.DataFrame
+    ) -> pd.DataFrame:
+    """
+    **collatePlotData** Builds the plot table, with one row per instrument field, by joining the analysis tables on (id, field_name)
+
+    :param summary_df: Summary table from summariseReadings, which sets the rows of the plot table
+    :param imc_df: IMC comparison table from compareIMCReadings
+    :param exceedance_df: Exceedance table from classifyExceedances
+    :param reviewlevels_df: Review-level table from inputs.getReviewLevelTable or inputs.readReviewLevelsFromCSV
+    :type pd.DataFrame:
+    """
+    status_container = statusContainer(
         label='Building a tabular summary for output...',
         expanded=False,
         state='running'
     )
 
-    plotdata_list = [[
+    # Every table shares the instrument and field categories of the readings store, so rows are joined on one integer
+    # key per instrument field rather than on pairs of strings
+    instrument_ids = summary_df['instrument_id'].cat.categories
+    field_names = summary_df['field'].cat.categories
+
+    def tableKeys(table_instrument_ids: pd.Series, table_field_names: pd.Series) -> np.ndarray:
+        instrument_codes = recode(table_instrument_ids, instrument_ids).astype(np.int64)
+        field_codes = recode(table_field_names, field_names).astype(np.int64)
+        return np.where((instrument_codes >= 0) & (field_codes >= 0), instrument_codes * len(field_names) + field_codes, -1)
+
+    def joinTable(table_df: pd.DataFrame, table_keys: np.ndarray) -> pd.DataFrame:
+        table_df = table_df.set_axis(table_keys, axis=0)
+        return table_df.loc[~table_df.index.duplicated(keep='last')].reindex(plot_keys).reset_index(drop=True)
+
+    instrument_codes = summary_df['instrument_id'].cat.codes.to_numpy()
+    field_codes = summary_df['field'].cat.codes.to_numpy()
+    plot_keys = instrument_codes.astype(np.int64) * len(field_names) + field_codes
+    plotdata_df = pd.DataFrame({
+        'id': instrument_ids.to_numpy(dtype=object)[instrument_codes],
+        'field_name': field_names.to_numpy(dtype=object)[field_codes]
+    })
+
+    attributes_df = pd.DataFrame.from_records([(
         instrument.id,
-        field_name,
         instrument.easting,
         instrument.northing,
         instrument.date_installed,
-        instrument.start_reading[field_name] if instrument.start_reading is not None else None,
-        field_value,
-        instrument.change[field_name] if instrument.change is not None else None,
-        abs(instrument.change[field_name]) if instrument.change is not None else None,
-        1/math.tan(math.radians(abs(instrument.change[field_name]))) if instrument.change is not None and instrument.change[field_name] != 0 and all(x in str(field_name).lower() for x in ['deg', 'change']) else None,
-        1/abs(instrument.change[field_name]) if instrument.change is not None and instrument.change[field_name] != 0 and any(x in str(field_name).lower() for x in ['tilt', 'ratio', 'gradient']) and 'change' in str(field_name).lower() else None,
-        instrument.max_in_period[field_name] if instrument.max_in_period is not None else None,
-        instrument.min_in_period[field_name] if instrument.min_in_period is not None else None,
-        instrument.max_in_period[field_name] - instrument.min_in_period[field_name] if instrument.max_in_period is not None and instrument.min_in_period is not None and instrument.max_in_period[field_name] is not None and instrument.min_in_period[field_name] is not None else None,
-        instrument.start_reading['Timestamp'] if instrument.start_reading is not None else None,
-        instrument.end_reading['Timestamp'],
-        instrument.change['Timestamp'] if instrument.change is not None else None,
         instrument.is_imc,
         instrument.imc_id,
-        instrument.imc_compare_reading[field_name] if instrument.end_imc_diff is not None else None,
-        instrument.imc_compare_reading['Timestamp'] if instrument.end_imc_diff is not None else None,
-        instrument.end_imc_diff[field_name] if instrument.end_imc_diff is not None else None,
-        instrument.end_imc_diff['Timestamp'] if instrument.end_imc_diff is not None else None,
-        instrument.maxexceedance[field_name]['lower']['level'] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'lower' in instrument.maxexceedance[field_name].keys() else None,
-        instrument.maxexceedance[field_name]['lower']['maxabs_reading'][field_name] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'lower' in instrument.maxexceedance[field_name].keys() else None,
-        instrument.maxexceedance[field_name]['lower']['maxabs_reading']['Timestamp'] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'lower' in instrument.maxexceedance[field_name].keys() else None,
-        instrument.maxexceedance[field_name]['upper']['level'] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'upper' in instrument.maxexceedance[field_name].keys() else None,
-        instrument.maxexceedance[field_name]['upper']['maxabs_reading'][field_name] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'upper' in instrument.maxexceedance[field_name].keys() else None,
-        instrument.maxexceedance[field_name]['upper']['maxabs_reading']['Timestamp'] if instrument.maxexceedance is not None and field_name in instrument.maxexceedance.keys() and 'upper' in instrument.maxexceedance[field_name].keys() else None,
-        instrument.review_levels[field_name]['lower']['alert'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'lower' in instrument.review_levels[field_name].keys() else None,
-        instrument.review_levels[field_name]['lower']['alarm'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'lower' in instrument.review_levels[field_name].keys() else None,
-        instrument.review_levels[field_name]['lower']['action'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'lower' in instrument.review_levels[field_name].keys() else None,
-        instrument.review_levels[field_name]['upper']['alert'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'upper' in instrument.review_levels[field_name].keys() else None,
-        instrument.review_levels[field_name]['upper']['alarm'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'upper' in instrument.review_levels[field_name].keys() else None,
-        instrument.review_levels[field_name]['upper']['action'] if instrument.review_levels is not None and field_name in instrument.review_levels.keys() and 'upper' in instrument.review_levels[field_name].keys() else None,
         instrument.contract,
         instrument.site,
         instrument.type,
         instrument.subtype
-    ] for instrument in instruments.values() if instrument.end_reading is not None for field_name, field_value in instrument.end_reading.items() if field_name != 'Timestamp']
-    plotdata_df = pd.DataFrame(
-        data=plotdata_list,
-        columns=[
-            'id',
-            'field_name',
-            'easting',
-            'northing',
-            'installation_date',
-            'start_value',
-            'end_value',
-            'change_value',
-            'abs_change',
-            'gradient_from_degrees',
-            'gradient_from_ratio',
-            'max_in_period_value',
-            'min_in_period_value',
-            'range_in_period',
-            'start_date',
-            'end_date',
-            'change_period',
-            'is_imc',
-            'corresponding_imc_id',
-            'imc_compare_reading',
-            'imc_compare_date',
-            'end_diff_with_imc',
-            'date_diff_with_imc',
-            'lower_review_level',
-            'lower_max_exceedance_value',
-            'lower_max_exceedance_date',
-            'upper_review_level',
-            'upper_max_exceedance_value',
-            'upper_max_exceedance_date',
-            'lower_alert',
-            'lower_alarm',
-            'lower_action',
-            'upper_alert',
-            'upper_alarm',
-            'upper_action',
-            'contract',
-            'site',
-            'type',
-            'sub-type'
-        ]
-    )
+    ) for instrument in instruments.values()], columns=[
+        'id', 'easting', 'northing', 'installation_date', 'is_imc', 'corresponding_imc_id', 'contract', 'site', 'type', 'sub-type'
+    ]).set_index('id').reindex(instrument_ids)
+    plotdata_df = plotdata_df.join(attributes_df.iloc[instrument_codes].reset_index(drop=True))
+
+    compare_df = joinTable(pd.DataFrame({
+        'imc_compare_reading': imc_df['compare_value'].to_numpy(),
+        'imc_compare_date': imc_df['compare_date'].to_numpy(),
+        'end_diff_with_imc': imc_df['diff_value'].to_numpy(),
+        'date_diff_with_imc': imc_df['diff_date'].to_numpy()
+    }), tableKeys(imc_df['instrument_id'], imc_df['field']))
+    plotdata_df = plotdata_df.join(compare_df)
+
+    for direction in ['lower', 'upper']:
+        direction_df = exceedance_df.loc[exceedance_df['direction'] == direction]
+        direction_df = joinTable(pd.DataFrame({
+            direction + '_review_level': direction_df['level'].astype(object).to_numpy(),
+            direction + '_max_exceedance_value': direction_df['value'].to_numpy(),
+            direction + '_max_exceedance_date': direction_df['date'].to_numpy()
+        }), tableKeys(direction_df['instrument_id'], direction_df['field']))
+        level = direction_df[direction + '_review_level']
+        direction_df[direction + '_review_level'] = level.where(level.notnull(), None)
+        plotdata_df = plotdata_df.join(direction_df)
+
+    # Review levels go straight into a (row, direction and level) array
+    levels = np.full((len(plotdata_df), len(PLOTDATA_REVIEWLEVEL_COLUMNS)), np.nan)
+    level_rows = pd.Index(plot_keys).get_indexer(tableKeys(reviewlevels_df['instrument'], reviewlevels_df['field']))
+    direction_codes = recode(reviewlevels_df['direction'], pd.Index(['lower', 'upper']))
+    level_codes = recode(reviewlevels_df['level'], pd.Index(REVIEWLEVEL_NAMES))
+    level_columns = np.where((direction_codes >= 0) & (level_codes >= 0), direction_codes * len(REVIEWLEVEL_NAMES) + level_codes, -1)
+    in_plot = (level_rows >= 0) & (level_columns >= 0)
+    levels[level_rows[in_plot], level_columns[in_plot]] = reviewlevels_df['value'].to_numpy()[in_plot]
+    plotdata_df = plotdata_df.join(pd.DataFrame(levels, columns=PLOTDATA_REVIEWLEVEL_COLUMNS))
+
+    change = summary_df['change_value'].to_numpy()
+    lower_field_names = pd.Series(field_names.astype(str)).str.lower()
+    is_change = lower_field_names.str.contains('change', regex=False).to_numpy()[field_codes]
+    from_degrees = is_change & lower_field_names.str.contains('deg', regex=False).to_numpy()[field_codes] & (change != 0)
+    from_ratio = is_change & lower_field_names.str.contains('tilt|ratio|gradient').to_numpy()[field_codes] & (change != 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        gradient_from_degrees = np.where(from_degrees, 1 / np.tan(np.radians(np.abs(change))), np.nan)
+        gradient_from_ratio = np.where(from_ratio, 1 / np.abs(change), np.nan)
+
+    plotdata_df = plotdata_df.assign(
+        start_value=summary_df['start_value'].to_numpy(),
+        end_value=summary_df['end_value'].to_numpy(),
+        change_value=change,
+        abs_change=np.abs(change),
+        gradient_from_degrees=gradient_from_degrees,
+        gradient_from_ratio=gradient_from_ratio,
+        max_in_period_value=summary_df['max_in_period_value'].to_numpy(),
+        min_in_period_value=summary_df['min_in_period_value'].to_numpy(),
+        range_in_period=summary_df['max_in_period_value'].to_numpy() - summary_df['min_in_period_value'].to_numpy(),
+        start_date=summary_df['start_date'].to_numpy(),
+        end_date=summary_df['end_date'].to_numpy(),
+        change_period=summary_df['change_period'].to_numpy()
+    )[[
+        'id',
+        'field_name',
+        'easting',
+        'northing',
+        'installation_date',
+        'start_value',
+        'end_value',
+        'change_value',
+        'abs_change',
+        'gradient_from_degrees',
+        'gradient_from_ratio',
+        'max_in_period_value',
+        'min_in_period_value',
+        'range_in_period',
+        'start_date',
+        'end_date',
+        'change_period',
+        'is_imc',
+        'corresponding_imc_id',
+        'imc_compare_reading',
+        'imc_compare_date',
+        'end_diff_with_imc',
+        'date_diff_with_imc',
+        'lower_review_level',
+        'lower_max_exceedance_value',
+        'lower_max_exceedance_date',
+        'upper_review_level',
+        'upper_max_exceedance_value',
+        'upper_max_exceedance_date',
+        'lower_alert',
+        'lower_alarm',
+        'lower_action',
+        'upper_alert',
+        'upper_alarm',
+        'upper_action',
+        'contract',
+        'site',
+        'type',
+        'sub-type'
+    ]]
 
+    status_container.record(rows_in=len(summary_df), rows_out=len(plotdata_df))
     status_container.update(
         label='Built a tabular summary!',
         state='complete',
@@ -364,24 +776,25 @@ def collatePlotData(instruments: dict) -> pd.DataFrame:
 
 
 def collateAppendixF(all_data: pd.DataFrame) -> pd.DataFrame:
-    def most_onerous(row):
-        if row['lower_review_level'] != None:
-            return [row['lower_review_level'], row['lower_max_exceedance_value'], row['lower_max_exceedance_date']]
-        elif row['upper_review_level'] != None:
-            return [row['upper_review_level'], row['upper_max_exceedance_value'], row['upper_max_exceedance_date']]
-        else:
-            return [None, None, None]
-    
+    status_container = statusContainer(
+        label='Collating Appendix F...',
+        expanded=False,
+        state='running'
+    )
+
     appendix_f = all_data.dropna(
         axis=0,
         how='all',
         subset=['lower_review_level', 'upper_review_level']
     )
 
-    if not appendix_f.empty:
-        appendix_f[['Exceeded Review Level', 'Reporting Period Value (Most Onerous)', 'Reporting Period Date (Most Onerous)']] = appendix_f.apply(most_onerous, axis=1, result_type='expand')
-    else:
-        appendix_f[['Exceeded Review Level', 'Reporting Period Value (Most Onerous)', 'Reporting Period Date (Most Onerous)']] = [None, None, None]
+    # The most onerous exceedance is the lower one where a lower review level is exceeded, otherwise the upper one
+    is_lower = appendix_f['lower_review_level'].notnull()
+    appendix_f = appendix_f.assign(**{
+        'Exceeded Review Level': appendix_f['lower_review_level'].where(is_lower, appendix_f['upper_review_level']),
+        'Reporting Period Value (Most Onerous)': appendix_f['lower_max_exceedance_value'].where(is_lower, appendix_f['upper_max_exceedance_value']),
+        'Reporting Period Date (Most Onerous)': appendix_f['lower_max_exceedance_date'].where(is_lower, appendix_f['upper_max_exceedance_date'])
+    })
     
     appendix_f = appendix_f[[
         'contract',
@@ -423,22 +836,34 @@ def collateAppendixF(all_data: pd.DataFrame) -> pd.DataFrame:
         'upper_action': 'Upper AAA (Action)'
     })
     appendix_f['Exceeded Review Level'] = appendix_f['Exceeded Review Level'].str.title()
+
+    status_container.record(rows_in=len(all_data), rows_out=len(appendix_f))
+    status_container.update(
+        label='Collated Appendix F!',
+        state='complete',
+        expanded=False
+    )
+
     return appendix_f
 
 
 def collateAppendixG(all_data: pd.DataFrame) -> pd.DataFrame:
-    def imc_reading(row):
-        imc_row = all_data.loc[(all_data['id'] == row['corresponding_imc_id']) & (all_data['field_name'] == row['field_name'])]
-        if not imc_row.empty:
-            return [imc_row['imc_compare_reading'].item(), imc_row['imc_compare_date'].item()]
-        else:
-            return [None, None]
-
-    appendix_g = all_data.loc[~all_data['is_imc']].dropna(subset=['end_diff_with_imc'])
-    if not appendix_g.empty:
-        appendix_g[['Value (IMC)', 'Date (IMC)']] = appendix_g.apply(imc_reading, axis=1, result_type='expand')
-    else:
-        appendix_g[['Value (IMC)', 'Date (IMC)']] = [None, None]
+    status_container = statusContainer(
+        label='Collating Appendix G...',
+        expanded=False,
+        state='running'
+    )
+
+    # Join each Contractor row to the row of its IMC instrument for the same field
+    imc_readings = all_data[['id', 'field_name', 'imc_compare_reading', 'imc_compare_date']] \
+        .drop_duplicates(subset=['id', 'field_name']) \
+        .rename(columns={
+            'id': 'corresponding_imc_id',
+            'imc_compare_reading': 'Value (IMC)',
+            'imc_compare_date': 'Date (IMC)'
+        })
+    appendix_g = all_data.loc[~all_data['is_imc'].astype(bool)].dropna(subset=['end_diff_with_imc'])
+    appendix_g = appendix_g.merge(imc_readings, on=['corresponding_imc_id', 'field_name'], how='left').set_axis(appendix_g.index, axis=0)
     appendix_g = appendix_g[[
         'field_name',
         'contract',
@@ -468,21 +893,61 @@ def collateAppendixG(all_data: pd.DataFrame) -> pd.DataFrame:
         'date_diff_with_imc': 'Date (Difference)'
     })
 
+    status_container.record(rows_in=len(all_data), rows_out=len(appendix_g))
+    status_container.update(
+        label='Collated Appendix G!',
+        state='complete',
+        expanded=False
+    )
+
     return appendix_g
 
 
+# Conversions are shared by every session, since an instrument's coordinates rarely change. Only the most recently
+# used WGS84_COORDINATES points are kept, well above the number of instruments in a project.
+HK1980_TO_WGS84 = Transformer.from_crs('EPSG:2326', 'EPSG:4326', always_xy=True)
+WGS84_COORDINATES = 20000
+_wgs84_coordinates = OrderedDict()
+_wgs84_lock = threading.Lock()
+
+
 def hk1980_to_latlong(plotdata_df: pd.DataFrame) -> pd.DataFrame:
-    plotdata_df['coordinates'] = [(None, None)] * len(plotdata_df)
-    plotdata_df['longitude'] = None
-    plotdata_df['latitude'] = None
-    for index, row in plotdata_df.iterrows():
-        coords = HK80(
-            # The API seems to swap the eastings and northings
-            northing=row['easting'],
-            easting=row['northing']
-        ).to_wgs84()
-        plotdata_df.at[index, 'coordinates'] = (coords.longitude, coords.latitude)
-        plotdata_df.at[index, 'longitude'] = coords.longitude
-        plotdata_df.at[index, 'latitude'] = coords.latitude
-
-    return(plotdata_df)
\ No newline at end of file
+    """
+    **hk1980_to_latlong** Adds WGS84 longitude, latitude and (longitude, latitude) coordinates to the plot table
+
+    Each distinct coordinate is converted once, in one batch, and the most recent are remembered across reruns and sessions.
+    """
+    # The API seems to swap the eastings and northings, and HK80 swapped them back by passing its easting as the first,
+    # northing, axis of EPSG:2326. Together these amount to converting the easting and northing columns as they are.
+    eastings = pd.to_numeric(plotdata_df['easting'], errors='coerce').round(3).to_numpy(dtype=float)
+    northings = pd.to_numeric(plotdata_df['northing'], errors='coerce').round(3).to_numpy(dtype=float)
+    located = np.isfinite(eastings) & np.isfinite(northings)
+    # Factorising each coordinate as one complex number finds the distinct points, in practice one per instrument
+    point_index, points = pd.factorize(eastings[located] + 1j * northings[located])
+    points = list(zip(points.real.tolist(), points.imag.tolist()))
+
+    with _wgs84_lock:
+        known = {point: _wgs84_coordinates[point] for point in points if point in _wgs84_coordinates}
+        missing = [point for point in points if point not in known]
+        if missing:
+            longitudes, latitudes = HK1980_TO_WGS84.transform(*np.array(missing).T)
+            for point, longitude, latitude in zip(missing, np.atleast_1d(longitudes).tolist(), np.atleast_1d(latitudes).tolist()):
+                known[point] = (round(longitude, 8), round(latitude, 8))
+        for point in points:
+            _wgs84_coordinates[point] = known[point]
+            _wgs84_coordinates.move_to_end(point)
+        while len(_wgs84_coordinates) > WGS84_COORDINATES:
+            _wgs84_coordinates.popitem(last=False)
+    point_coordinates = np.empty(len(points) + 1, dtype=object)
+    point_coordinates[:-1] = [known[point] for point in points]
+
+    # Rows without a location take the last entry, which is left as (nan, nan)
+    point_coordinates[-1] = (np.nan, np.nan)
+    row_points = np.full(len(plotdata_df), len(points))
+    row_points[located] = point_index
+    lonlats = np.array(point_coordinates.tolist(), dtype=float).reshape(-1, 2)[row_points]
+    plotdata_df['longitude'] = lonlats[:, 0]
+    plotdata_df['latitude'] = lonlats[:, 1]
+    plotdata_df['coordinates'] = point_coordinates[row_points]
+
+    return(plotdata_df)
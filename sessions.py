@@ -0,0 +1,276 @@
+import pandas as pd
+import numpy as np
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from classes import ReadingsStore
+import cache
+import copy
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+
+# Memory allowed to the data of one session and of all sessions together. Override with the LPP_SESSION_MEMORY_MB and
+# LPP_SERVER_MEMORY_MB environment variables.
+SESSION_MEMORY_BUDGET = int(float(os.environ.get('LPP_SESSION_MEMORY_MB', 1024)) * 2 ** 20)
+SERVER_MEMORY_BUDGET = int(float(os.environ.get('LPP_SERVER_MEMORY_MB', 8192)) * 2 ** 20)
+# Seconds after which the data of a session which has gone is deleted, including from disk
+SESSION_TTL = 24 * 60 * 60
+SPILL_DIR = os.path.join(cache.CACHE_DIR, 'sessions')
+HEADLESS_SESSION_ID = 'headless'
+# Containers with more items than this are measured from an even sample of their items
+SIZE_SAMPLE = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def sizeOf(value, seen: set = None) -> int:
+    """
+    **sizeOf** Approximate bytes held by a value, counting the buffers of dataframes, arrays and readings stores
+
+    :param seen: IDs of dataframes, arrays and readings stores already counted, which are not counted again and to
+    which those found are added
+    :type set:
+    """
+    seen = set() if seen is None else seen
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index, np.ndarray, ReadingsStore)):
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        if isinstance(value, ReadingsStore):
+            return value.memoryUsage()
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum()) if isinstance(value, pd.DataFrame) else int(usage)
+    if isinstance(value, dict):
+        items = list(value.items())
+        sample = items[::max(len(items) // SIZE_SAMPLE, 1)]
+        return sys.getsizeof(value) + sum(sizeOf(key, seen) + sizeOf(item, seen) for key, item in sample) * len(items) // max(len(sample), 1)
+    if isinstance(value, (list, tuple, set)):
+        items = list(value)
+        sample = items[::max(len(items) // SIZE_SAMPLE, 1)]
+        return sys.getsizeof(value) + sum(sizeOf(item, seen) for item in sample) * len(items) // max(len(sample), 1)
+    if hasattr(value, '__dict__') and not isinstance(value, type):
+        return sys.getsizeof(value) + sizeOf(vars(value), seen)
+    return sys.getsizeof(value)
+
+
+def compactFrame(table: pd.DataFrame, max_category_ratio: float = 0.5) -> pd.DataFrame:
+    """
+    **compactFrame** Stores repetitive text columns of a table as categoricals
+
+    Text columns with fewer distinct values than max_category_ratio of their rows become categorical. Other columns,
+    including float64 values, keep their dtype, so that results are unchanged. The returned table shares the buffers
+    of the columns it keeps, so columns should be replaced rather than modified in place.
+    """
+    compact = table.copy(deep=False)
+    for column in table.columns:
+        values = table[column]
+        if values.dtype == object and values.map(lambda value: value is None or isinstance(value, str)).all() \
+                and values.nunique() < max_category_ratio * len(values):
+            compact[column] = values.astype('category')
+    return compact
+
+
+class SessionData:
+    """
+    **SessionData** Holds the bulky data of one session, measured against the memory budgets and spilled to disk when cold
+
+    Values are stored and read like a dictionary, and measured when stored, so a value changed in place should be
+    touched to be measured again. Buffers shared between values are counted once. A spilled session is pickled
+    to disk as a whole, which keeps shared buffers shared, and read back on its next use. A session is not spilled
+    while its script is running, since the script may be changing its values in place.
+
+    :param evictable: Values which the session can do without, such as prepared exports, keyed by name with the value
+    they are reset to when the session is over its budget. Each reset stores a fresh copy of the value.
+    :type dict:
+    """
+    def __init__(self, session_id: str, evictable: dict = None) -> None:
+        self.session_id = session_id
+        self.evictable = dict(evictable or {})
+        self.values = {}
+        self.sizes = {}
+        self.buffers = {}
+        self.touched = time.time()
+        self.spilled = False
+        self.script_thread = None
+        self.lock = threading.RLock()
+
+    def spillPath(self) -> str:
+        return os.path.join(SPILL_DIR, self.session_id + '.pickle')
+
+    def load(self) -> None:
+        with self.lock:
+            self.touched = time.time()
+            if not self.spilled:
+                return
+            with open(self.spillPath(), 'rb') as spill_file:
+                self.values = pickle.load(spill_file)
+            os.remove(self.spillPath())
+            self.spilled = False
+        logger.info('Read {:,.1f} MB of session {} back from disk'.format(self.memoryUsage() / 2 ** 20, self.session_id))
+
+    def __contains__(self, name: str) -> bool:
+        with self.lock:
+            return name in self.sizes
+
+    def __getitem__(self, name: str):
+        with self.lock:
+            spilled = self.spilled
+            self.load()
+            value = self.values[name]
+        if spilled:
+            enforceBudgets(self)
+        return value
+
+    def get(self, name: str, default=None):
+        with self.lock:
+            return self[name] if name in self.sizes else default
+
+    def __setitem__(self, name: str, value) -> None:
+        with self.lock:
+            self.load()
+            self.values[name] = value
+            self.measure(name)
+        enforceBudgets(self)
+
+    def touch(self, name: str) -> None:
+        # Measure again a value which was changed in place, and bring the session back within its budgets
+        with self.lock:
+            self.load()
+            self.measure(name)
+        enforceBudgets(self)
+
+    def measure(self, name: str) -> None:
+        # Buffers of the other values are not counted again, e.g. a readings store shared by raw and derived data
+        seen = set().union(*[buffers for other, buffers in self.buffers.items() if other != name])
+        already_seen = set(seen)
+        self.sizes[name] = sizeOf(self.values[name], seen)
+        self.buffers[name] = seen - already_seen
+
+    def memoryUsage(self) -> int:
+        with self.lock:
+            return 0 if self.spilled else sum(self.sizes.values())
+
+    def spilledUsage(self) -> int:
+        with self.lock:
+            return sum(self.sizes.values()) if self.spilled else 0
+
+    def evict(self) -> int:
+        # Reset the evictable values, returning the bytes released
+        released = 0
+        with self.lock:
+            for name, default in self.evictable.items():
+                if name in self.sizes and not self.spilled:
+                    released += self.sizes[name]
+                    self.values[name] = copy.deepcopy(default)
+                    self.sizes[name] = sizeOf(self.values[name])
+                    self.buffers[name] = set()
+        return released
+
+    def isRunning(self) -> bool:
+        # Streamlit runs each script run in its own thread, which ends when the run does
+        return self.script_thread is not None and self.script_thread.is_alive()
+
+    def spill(self) -> int:
+        # Move all values to disk, returning the bytes released from memory. A script starting meanwhile waits for the
+        # lock in sessionData, so it finds the values on disk rather than half written.
+        with self.lock:
+            if self.spilled or not self.values or self.isRunning():
+                return 0
+            values = dict(self.values)
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            with open(self.spillPath(), 'wb') as spill_file:
+                pickle.dump(values, spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.values = {}
+            self.spilled = True
+            return sum(self.sizes.values())
+
+    def close(self) -> None:
+        with self.lock:
+            self.values.clear()
+            self.sizes.clear()
+            self.buffers.clear()
+            if self.spilled and os.path.exists(self.spillPath()):
+                os.remove(self.spillPath())
+            self.spilled = False
+
+
+# Data of every session in the server process, for accounting across sessions
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def currentSessionId() -> str:
+    script_run_ctx = get_script_run_ctx(suppress_warning=True)
+    return HEADLESS_SESSION_ID if script_run_ctx is None else script_run_ctx.session_id
+
+
+def sessionData(evictable: dict = None) -> SessionData:
+    # The data of the session running this script, registered with the server on first use
+    session_id = currentSessionId()
+    with _sessions_lock:
+        if session_id not in _sessions:
+            _sessions[session_id] = SessionData(session_id, evictable=evictable)
+        session = _sessions[session_id]
+    with session.lock:
+        session.script_thread = threading.current_thread()
+    return session
+
+
+def isActiveSession(session_id: str) -> bool:
+    if session_id == HEADLESS_SESSION_ID or not Runtime.exists():
+        return True
+    return Runtime.instance().is_active_session(session_id)
+
+
+def enforceBudgets(session: SessionData) -> None:
+    """
+    **enforceBudgets** Brings a session and the server within their memory budgets
+
+    A session over its own budget loses its evictable values. Over the server budget, other sessions are spilled to
+    disk whole, disconnected sessions first and then the least recently used, except while their script is running.
+    Sessions gone for longer than SESSION_TTL are deleted.
+    """
+    if session.memoryUsage() > SESSION_MEMORY_BUDGET:
+        released = session.evict()
+        if session.memoryUsage() > SESSION_MEMORY_BUDGET:
+            logger.warning('Session {} holds {:,.1f} MB, over its budget of {:,.1f} MB'.format(
+                session.session_id, session.memoryUsage() / 2 ** 20, SESSION_MEMORY_BUDGET / 2 ** 20))
+        elif released:
+            logger.info('Evicted {:,.1f} MB of prepared data from session {}'.format(released / 2 ** 20, session.session_id))
+
+    with _sessions_lock:
+        sessions = [other for other in _sessions.values() if other is not session]
+    now = time.time()
+    for other in [other for other in sessions if now - other.touched > SESSION_TTL and not isActiveSession(other.session_id)]:
+        other.close()
+        sessions.remove(other)
+        with _sessions_lock:
+            _sessions.pop(other.session_id, None)
+
+    usage = session.memoryUsage() + sum(other.memoryUsage() for other in sessions)
+    for other in sorted(sessions, key=lambda other: (isActiveSession(other.session_id), other.touched)):
+        if usage <= SERVER_MEMORY_BUDGET:
+            break
+        released = other.spill()
+        if released:
+            logger.info('Spilled {:,.1f} MB of session {} to disk'.format(released / 2 ** 20, other.session_id))
+        usage -= released
+
+
+def serverUsage() -> dict:
+    # Accounting of the memory and disk used by the data of each session and in total
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+    usage = {
+        'sessions': {session.session_id: {'memory': session.memoryUsage(), 'spilled': session.spilledUsage()} for session in sessions},
+        'session_budget': SESSION_MEMORY_BUDGET,
+        'server_budget': SERVER_MEMORY_BUDGET
+    }
+    usage['memory'] = sum(session['memory'] for session in usage['sessions'].values())
+    usage['spilled'] = sum(session['spilled'] for session in usage['sessions'].values())
+    return usage
@@ -0,0 +1,139 @@
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import datetime
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class HeadlessStatus:
+    # Stands in for st.status when there is no Streamlit session, e.g. in benchmarks, by logging the labels instead
+    def __init__(self, label: str) -> None:
+        self.logger = logging.getLogger(__name__)
+        self.logger.info(label)
+
+    def update(self, label: str = None, state: str = None, expanded: bool = None) -> None:
+        if label is not None:
+            self.logger.info(label)
+
+
+# Trace of the current run when there is no Streamlit session. Sessions keep their own trace in session state.
+_headless_trace = {'run': None, 'started_at': None, 'stages': []}
+_trace_lock = threading.Lock()
+
+
+def currentTrace() -> dict:
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return _headless_trace
+    if 'perf_trace' not in st.session_state:
+        st.session_state.perf_trace = {'run': None, 'started_at': None, 'stages': []}
+    return st.session_state.perf_trace
+
+
+def startTrace(run: str) -> None:
+    # Begin a new trace, e.g. for each press of Get data. Stages completed afterwards are recorded in it.
+    trace = currentTrace()
+    with _trace_lock:
+        trace['run'] = run
+        trace['started_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+        trace['stages'] = []
+
+
+def traceJSON() -> str:
+    trace = currentTrace()
+    with _trace_lock:
+        return json.dumps(trace, indent=2)
+
+
+def peakMemory() -> float:
+    # Peak resident set size of the server process in MiB, which only ever rises. macOS reports it in bytes, Linux
+    # and the BSDs in KiB.
+    if resource is None:
+        return float('nan')
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def residentMemory() -> float:
+    # Current resident set size of the server process in MiB, where /proc reports it (Linux), otherwise nan
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return float('nan')
+
+
+class StageStatus:
+    """
+    **StageStatus** Wraps a status container to measure the stage it reports on
+
+    Wall time and CPU time of the stage's thread are measured from opening the container until it is updated to
+    complete or error. The change in the process's resident set size over the same span is the stage's memory delta,
+    which also counts the allocations of any stage running at the same time. The process's peak resident set size is
+    taken when the stage ends. Counts such as rows_in, rows_out and bytes are given with record(). The measurements
+    are appended to the completed label and to the current trace.
+    """
+    def __init__(self, container, label: str) -> None:
+        self.container = container
+        self.stage = label.rstrip('.')
+        self.counters = {}
+        self.finished = False
+        self.started = time.perf_counter()
+        self.cpu_started = time.thread_time()
+        self.rss_started = residentMemory()
+
+    def record(self, **counters) -> None:
+        self.counters.update(counters)
+
+    def update(self, label: str = None, state: str = None, expanded: bool = None) -> None:
+        if state in ['complete', 'error'] and not self.finished:
+            self.finished = True
+            measurements = dict(
+                stage=self.stage,
+                state=state,
+                wall_seconds=round(time.perf_counter() - self.started, 3),
+                cpu_seconds=round(time.thread_time() - self.cpu_started, 3),
+                rss_delta_mib=round(residentMemory() - self.rss_started, 1),
+                process_peak_rss_mib=round(peakMemory(), 1),
+                **self.counters
+            )
+            trace = currentTrace()
+            with _trace_lock:
+                trace['stages'].append(measurements)
+            if label is not None:
+                label = '{} ({})'.format(label, formatMeasurements(measurements))
+        self.container.update(label=label, state=state, expanded=expanded)
+
+
+def formatMeasurements(measurements: dict) -> str:
+    parts = ['{:.2f} s'.format(measurements['wall_seconds']), 'CPU {:.2f} s'.format(measurements['cpu_seconds'])]
+    if 'rows_in' in measurements and 'rows_out' in measurements:
+        parts.append('{:,} → {:,} rows'.format(measurements['rows_in'], measurements['rows_out']))
+    elif 'rows_out' in measurements:
+        parts.append('{:,} rows'.format(measurements['rows_out']))
+    if 'bytes' in measurements:
+        parts.append('{:,.1f} MB downloaded'.format(measurements['bytes'] / 1e6))
+    if not math.isnan(measurements['rss_delta_mib']):
+        parts.append('RSS {:+,.0f} MiB'.format(measurements['rss_delta_mib']))
+    if not math.isnan(measurements['process_peak_rss_mib']):
+        parts.append('process peak RSS {:,.0f} MiB'.format(measurements['process_peak_rss_mib']))
+    return ', '.join(parts)
+
+
+def statusContainer(label: str, expanded: bool = False, state: str = 'running') -> StageStatus:
+    """
+    **statusContainer** Opens an st.status container, or a HeadlessStatus when not running inside a Streamlit session
+
+    The container is wrapped in a StageStatus, which adds the stage's measurements to its label when it completes.
+    """
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return StageStatus(HeadlessStatus(label=label), label=label)
+    return StageStatus(st.status(label=label, expanded=expanded, state=state), label=label)
@@ -0,0 +1,82 @@
+import datetime
+from unittest import mock
+import numpy as np
+import pandas as pd
+import requests as rq
+from pandas.testing import assert_frame_equal
+import cache
+
+START, END = datetime.datetime(2024, 1, 1), datetime.datetime(2024, 1, 3)
+
+
+def instrumentReadings(value: float) -> pd.DataFrame:
+    return pd.DataFrame({
+        'Timestamp': pd.to_datetime(['2024-01-01 06:00', '2024-01-02 06:00']),
+        'Settlement': [value, np.nan]
+    })
+
+
+def test_cache_reads_only_the_selected_instruments(tmp_path):
+    connection = cache.openCache(str(tmp_path / 'readings.sqlite'))
+    instrument_ids = ['1201/A/GSM/{:03d}'.format(index) for index in range(5)]
+    cache.storeReadings(connection, {instr_id: instrumentReadings(index) for index, instr_id in enumerate(instrument_ids[:4])}, [(instrument_ids, START, END)])
+    cache.storeReadings(connection, {instrument_ids[4]: instrumentReadings(np.nan)}, [])
+
+    statements = []
+    connection.set_trace_callback(statements.append)
+    # Chunks of two instruments, one of which holds only null values
+    with mock.patch.object(cache, 'INSTRUMENTS_PER_QUERY', 2):
+        readings = cache.loadReadings(connection, instrument_ids[1:], START, END)
+        coverage = cache.readCoverage(connection, instrument_ids[3:])
+
+    assert list(readings) == instrument_ids[1:]
+    assert_frame_equal(readings[instrument_ids[2]], instrumentReadings(2.0))
+    assert readings[instrument_ids[4]]['Settlement'].isnull().all()
+    assert coverage == {instr_id: [(cache.toEpoch(START), cache.toEpoch(END))] for instr_id in instrument_ids[3:]}
+    selects = [statement for statement in statements if statement.startswith('SELECT')]
+    assert len(selects) == 3
+    assert all('instrument_id IN (' in statement for statement in selects)
+
+
+def metadataClient(*responses) -> mock.Mock:
+    api_client = mock.Mock(url='http://lpp.invalid')
+    api_client.request.side_effect = list(responses)
+    return api_client
+
+
+def metadataResponse(status_code: int, body: bytes = b'', etag: str = None) -> rq.Response:
+    response = rq.Response()
+    response.status_code, response._content = status_code, body
+    if etag is not None:
+        response.headers['ETag'] = etag
+    return response
+
+
+def test_review_levels_are_revalidated_on_every_request(tmp_path):
+    api_client = metadataClient(metadataResponse(200, b'[1]', etag='"v1"'), metadataResponse(304), metadataResponse(200, b'[2]', etag='"v2"'))
+    open_cache = cache.openMetadataCache
+    with mock.patch.object(cache, 'openMetadataCache', lambda: open_cache(str(tmp_path / 'metadata.sqlite'))), \
+            mock.patch.dict(cache._metadata, clear=True):
+        bodies = [
+            cache.cachedRequest(api_client, 'POST', 'api/get_instrument_setup_review_settings', api_key='key', ttl=cache.REVIEW_LEVELS_TTL).content
+            for _ in range(3)
+        ]
+
+    assert bodies == [b'[1]', b'[1]', b'[2]']
+    assert [call.kwargs['headers'].get('If-None-Match') for call in api_client.request.call_args_list] == [None, '"v1"', '"v1"']
+
+
+def test_metadata_in_memory_is_bounded(tmp_path):
+    api_client = metadataClient(*[metadataResponse(200, str(index).encode()) for index in range(4)])
+    open_cache = cache.openMetadataCache
+    with mock.patch.object(cache, 'openMetadataCache', lambda: open_cache(str(tmp_path / 'metadata.sqlite'))), \
+            mock.patch.object(cache, 'METADATA_ENTRIES', 2), mock.patch.dict(cache._metadata, clear=True):
+        for index in range(4):
+            cache.cachedRequest(api_client, 'GET', 'api/get_instrument_type', api_key='key', params={'page': index})
+        kept = [entry['body'] for entry in cache._metadata.values()]
+        # An entry dropped from memory is read back from disk without another request
+        assert cache.cachedRequest(api_client, 'GET', 'api/get_instrument_type', api_key='key', params={'page': 0}).content == b'0'
+
+    assert kept == [b'2', b'3']
+    assert api_client.request.call_count == 4
+    assert cache._metadata_locks == {}
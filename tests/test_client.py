@@ -0,0 +1,41 @@
+import datetime
+from unittest import mock
+import pytest
+import requests as rq
+import client
+import download
+
+
+def failingClient() -> client.LppApiClient:
+    api_client = client.LppApiClient(url='http://lpp.invalid')
+    api_client.session.request = mock.Mock(side_effect=rq.ConnectionError('refused'))
+    return api_client
+
+
+@pytest.mark.parametrize('method, retry, attempts', [
+    ('GET', None, client.MAX_ATTEMPTS),
+    ('POST', None, 1),
+    ('POST', True, client.MAX_ATTEMPTS),
+    ('GET', False, 1)
+])
+def test_only_idempotent_requests_are_retried(method, retry, attempts):
+    api_client = failingClient()
+    with mock.patch('time.sleep'), pytest.raises(rq.ConnectionError):
+        api_client.request(method, 'login', retry=retry)
+
+    assert api_client.session.request.call_count == attempts
+
+
+def test_readings_chunks_are_retried_by_the_downloader_alone():
+    api_client = failingClient()
+    with mock.patch('time.sleep'), pytest.raises(RuntimeError):
+        download.downloadReadings(
+            instrument_ids=['1201/A/GSM/001'],
+            start_date=datetime.datetime(2024, 1, 1),
+            end_date=datetime.datetime(2024, 1, 2),
+            client=api_client,
+            api_key='key',
+            max_retries=3
+        )
+
+    assert api_client.session.request.call_count == 4
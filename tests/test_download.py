@@ -0,0 +1,53 @@
+import json
+import download
+
+
+def chunked(text: str, size: int) -> list:
+    data = text.encode('utf-8')
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def test_streamed_object_matches_json_loads_at_any_chunk_size():
+    response = {
+        'A/1': {'2024-01-01 00:00:00': {'Easting': '816500.123', 'Settlement': '-1.25', 'Note': 'café ✓'}},
+        'comment': 'readings',
+        'B/2': {'2024-01-01 00:15:00': {'Settlement': 12345678901234567890, 'Tilt': None}},
+        'C/3': {}
+    }
+    text = json.dumps(response, ensure_ascii=False, indent=1)
+    for size in [1, 2, 3, 7, 64, len(text)]:
+        assert dict(download.iterJSONObject(chunked(text, size))) == response
+
+
+def test_long_value_is_decoded_across_many_chunks():
+    response = {'A/1': {'{:06d}'.format(index): {'Settlement': str(index / 7)} for index in range(20000)}, 'B/2': 1.5}
+    assert dict(download.iterJSONObject(chunked(json.dumps(response), 1 << 12))) == response
+
+
+def test_response_which_is_not_an_object():
+    assert list(download.iterJSONObject(chunked('["not", "an", "object"]', 4))) == []
+    assert list(download.iterJSONObject([])) == []
+
+
+def test_readings_are_normalised_column_wise():
+    readings_df = download.columnariseReadings({
+        '2024-01-01 00:00:00': {'Easting': '816500.1', 'Settlement': '-1.5', 'Tilt': ''},
+        # Blank apart from its coordinates, so skipped
+        '2024-01-01 00:15:00': {'Easting': '816500.1', 'Settlement': '', 'Tilt': ''},
+        # Nulls are values, so the reading is kept
+        '2024-01-01 00:30:00': {'Settlement': None, 'Tilt': None},
+        # Fields missing from a reading are NaN, and anything float() cannot read is NaN too
+        '2024-01-01 00:45:00': {'Tilt': 'n/a', 'Settlement': 2}
+    })
+
+    assert list(readings_df.columns) == ['Timestamp', 'Easting', 'Settlement', 'Tilt']
+    assert readings_df['Timestamp'].dt.strftime('%H:%M').tolist() == ['00:00', '00:30', '00:45']
+    assert readings_df['Easting'].tolist()[0] == 816500.1
+    assert readings_df[['Easting', 'Tilt']].iloc[1:].isnull().all(axis=None)
+    assert readings_df['Settlement'].tolist()[::2] == [-1.5, 2.0]
+    assert all(dtype == 'float64' for dtype in readings_df.dtypes.iloc[1:])
+
+
+def test_blank_readings_are_skipped():
+    assert download.columnariseReadings({'2024-01-01 00:00:00': {'Easting': '1', 'Northing': '2', 'Settlement': ''}}).empty
+    assert download.columnariseReadings({}).empty
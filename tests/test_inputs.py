@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import inputs
+
+
+def reviewLevelRows(instr_id: str, field: str, levels: list) -> pd.DataFrame:
+    return pd.DataFrame(
+        [(instr_id, field, value, name) for name, value in levels],
+        columns=['instr_id', 'field', 'review_value', 'review_name']
+    )
+
+
+def reviewLevelTable(setup_data: pd.DataFrame) -> pd.DataFrame:
+    setup_data = setup_data.assign(direction=inputs.reviewLevelDirections(setup_data))
+    table = inputs.buildReviewLevelTable(setup_data[['instr_id', 'field', 'direction', 'review_name', 'review_value']].itertuples(index=False, name=None))
+    return table.reset_index(drop=True).astype({column: str for column in ['instrument', 'field', 'direction', 'level']})
+
+
+def levelsOf(table: pd.DataFrame, instr_id: str) -> set:
+    return set(table.loc[table['instrument'] == instr_id, ['direction', 'level', 'value']].itertuples(index=False, name=None))
+
+
+def test_three_row_groups_take_direction_from_action_and_alert():
+    table = reviewLevelTable(pd.concat([
+        reviewLevelRows('settlement', 'Calculated Settlement', [('alert', -12), ('alarm', -18), ('action', -25)]),
+        reviewLevelRows('water', 'Calculated Water Level', [('alert', 3.75), ('alarm', 4.25), ('action', 4.75)])
+    ], ignore_index=True))
+
+    assert levelsOf(table, 'settlement') == {('lower', 'alert', -12), ('lower', 'alarm', -18), ('lower', 'action', -25)}
+    assert levelsOf(table, 'water') == {('upper', 'alert', 3.75), ('upper', 'alarm', 4.25), ('upper', 'action', 4.75)}
+
+
+def test_four_row_groups_keep_both_alerts():
+    # IMC difference groups give an alert either side of zero and no alarm or action level
+    table = reviewLevelTable(reviewLevelRows(
+        'difference', 'Calculated_Difference_in_Settlement',
+        [('alert', 3), ('alert', -3), ('alarm', np.nan), ('action', np.nan)]
+    ))
+
+    assert levelsOf(table, 'difference') == {('upper', 'alert', 3), ('lower', 'alert', -3)}
+
+
+def test_six_row_groups_split_each_level_by_value():
+    table = reviewLevelTable(pd.concat([
+        reviewLevelRows('tilt', 'Tilt', [('alert', 0.057), ('alert', -0.057), ('alarm', 0.076), ('alarm', -0.076), ('action', 0.115), ('action', -0.115)]),
+        # Both levels of a water level can be positive
+        reviewLevelRows('water', 'Water Level', [('action', 0.01), ('alarm', 0.31), ('alert', 0.51), ('alert', 3.75), ('alarm', 4.25), ('action', 4.75)])
+    ], ignore_index=True))
+
+    assert levelsOf(table, 'tilt') == {
+        ('upper', 'alert', 0.057), ('upper', 'alarm', 0.076), ('upper', 'action', 0.115),
+        ('lower', 'alert', -0.057), ('lower', 'alarm', -0.076), ('lower', 'action', -0.115)
+    }
+    assert levelsOf(table, 'water') == {
+        ('upper', 'alert', 3.75), ('upper', 'alarm', 4.25), ('upper', 'action', 4.75),
+        ('lower', 'alert', 0.51), ('lower', 'alarm', 0.31), ('lower', 'action', 0.01)
+    }
+
+
+def test_conflicting_levels_are_not_collapsed():
+    table = inputs.buildReviewLevelTable([
+        ('instrument', 'field', 'upper', 'alert', 1.0),
+        ('instrument', 'field', 'upper', 'alert', 1.0),
+        ('instrument', 'field', 'upper', 'alert', 2.0)
+    ])
+
+    assert sorted(table['value']) == [1.0, 2.0]
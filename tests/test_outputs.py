@@ -0,0 +1,65 @@
+import json
+from unittest import mock
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+import outputs
+
+
+def plotTable(num_instruments: int = 20) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    plotdata_df = pd.DataFrame({
+        'id': ['instrument {}'.format(index) for index in range(num_instruments)] * 2,
+        'field_name': ['settlement'] * num_instruments + ['tilt'] * num_instruments,
+        'longitude': 113.96 + rng.uniform(0, 0.01, 2 * num_instruments),
+        'latitude': 22.29 + rng.uniform(0, 0.01, 2 * num_instruments)
+    })
+    return outputs.assignColourScales(
+        plotdata_df.assign(**{summary_name + '_value': rng.normal(size=2 * num_instruments) for summary_name in outputs.SUMMARY_NAMES}),
+        ['settlement', 'tilt']
+    )
+
+
+def test_one_deck_per_field_sends_only_the_selected_layer():
+    payloads = outputs.partitionPlotData(plotTable(), ['settlement', 'tilt'])
+    sent = []
+    with mock.patch.object(outputs.st, 'pydeck_chart', side_effect=lambda deck: sent.append((deck, deck.to_json()))), \
+            mock.patch.object(outputs.st, 'caption'), mock.patch.object(outputs.st, 'markdown'):
+        for summary_index in [0, 2, 2]:
+            outputs.plotChart(payloads['settlement'], 'settlement', summary_index=summary_index)
+
+    decks = {id(deck) for deck, _ in sent}
+    assert len(decks) == 1
+    for (deck, spec), summary_index in zip(sent, [0, 2, 2]):
+        layers = json.loads(spec)['layers']
+        assert [layer['visible'] for layer in layers] == [index == summary_index for index in range(len(outputs.SUMMARY_NAMES))]
+        assert [len(layer['data']) for layer in layers] == [len(payloads['settlement']['layers'][index]['data']) if index == summary_index else 0 for index in range(len(layers))]
+    # Reruns without a change of summary reuse the JSON
+    assert sent[1][1] is sent[2][1]
+    # The deck keeps every layer's data for later switches
+    assert all(len(layer.data) == 20 for layer in sent[0][0].layers)
+
+
+def test_colour_scales_span_each_field():
+    plotdata_df = outputs.assignColourScales(pd.DataFrame({
+        'field_name': ['settlement'] * 3 + ['tilt'] * 2,
+        'start_value': [1.0, 2.0, 3.0, -1.0, -4.0],
+        'end_value': [0.0, 5.0, np.nan, -2.0, -2.0],
+        'change_value': [-1.0, 0.0, 2.0, 1.0, -3.0],
+        'max_in_period_value': [1.0, 1.0, 1.0, -5.0, 0.0],
+        'min_in_period_value': [-3.0, -2.0, -1.0, 2.0, 8.0]
+    }), ['settlement', 'tilt'])
+
+    # Changes diverge about zero. Other values run from pale to dark towards the larger magnitude, and blank values
+    # are not coloured.
+    pale, dark = (255, 247, 236), (127, 0, 0)
+    expected_colours = {
+        'start': [pale, (252, 140, 89), dark, pale, dark],
+        'end': [pale, dark, (0, 0, 0), pale, pale],
+        'change': [(232, 151, 196), (247, 247, 246), (39, 100, 25), (199, 232, 159), (142, 1, 82)],
+        'max_in_period': [pale, pale, pale, dark, pale],
+        'min_in_period': [dark, (252, 142, 90), pale, pale, dark]
+    }
+    for summary_name, colours in expected_colours.items():
+        colour_columns = [summary_name + '_colour_' + channel for channel in outputs.COLOUR_CHANNELS]
+        assert_frame_equal(plotdata_df[colour_columns], pd.DataFrame(colours, columns=colour_columns, dtype=np.uint8))
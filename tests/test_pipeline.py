@@ -0,0 +1,37 @@
+import datetime
+import threading
+import time
+from unittest import mock
+import pandas as pd
+import classes
+import inputs
+import pipeline
+
+
+def test_imc_pairing_waits_for_parent_child_relationships():
+    instruments = {instr_id: classes.instrument(id=instr_id) for instr_id in ['1201/A/IW/001', '1201/A/IW/001_I']}
+    running = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def task(name: str, result):
+        def run(**kwargs):
+            with lock:
+                running.add(name)
+                overlaps.append(set(running))
+            time.sleep(0.05)
+            with lock:
+                running.discard(name)
+            return result
+        return run
+
+    with mock.patch.object(inputs, 'getInstrumentSetup', return_value=instruments), \
+            mock.patch.object(inputs, 'getParentChildRelationships', side_effect=task('parent_child', instruments)), \
+            mock.patch.object(inputs, 'identifyIMCPairing', side_effect=task('imc_pairing', instruments)), \
+            mock.patch.object(inputs, 'getInstrumentReadings', return_value=instruments), \
+            mock.patch.object(inputs, 'getReviewLevelTable', return_value=pd.DataFrame(columns=inputs.REVIEWLEVEL_COLUMNS)), \
+            mock.patch.object(inputs, 'applyReviewLevels'):
+        pipeline.fetchRawData({'IW': ['IW']}, ['IMC', 'Contractor'], [], (datetime.date(2024, 1, 1), datetime.date(2024, 1, 7)), 3, 'key')
+
+    assert not any({'parent_child', 'imc_pairing'} <= tasks for tasks in overlaps)
+    assert [tasks for tasks in overlaps if 'imc_pairing' in tasks]
@@ -0,0 +1,277 @@
+import datetime
+from unittest import mock
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+import classes
+import pipeline
+import processes
+
+REPORT_PERIOD = (datetime.date(2024, 1, 2), datetime.date(2024, 1, 4))
+CONTRACTOR_ID, IMC_ID, UNPAIRED_ID = '1201/A/GSM/001', '1201/A/GSM/001_I', '1201/B/GSM/002'
+PARENT_ID = '1201/A/IW/001'
+
+
+def readingsTable(rows: list, field_names: list) -> pd.DataFrame:
+    readings = pd.DataFrame(rows, columns=['Timestamp'] + field_names)
+    readings['Timestamp'] = pd.to_datetime(readings['Timestamp'])
+    return readings
+
+
+def plain(table: pd.DataFrame) -> pd.DataFrame:
+    # Categorical columns as plain values, so that expected tables need not repeat the store's categories
+    return table.astype({column: object for column in table.columns if isinstance(table[column].dtype, pd.CategoricalDtype)})
+
+
+def gaugeProject() -> dict:
+    # A Contractor instrument paired with an IMC instrument, and an unpaired instrument without readings in the period
+    instruments = {}
+    for instr_id, is_imc, imc_id, rows in [
+        (CONTRACTOR_ID, False, IMC_ID, [
+            ('2024-01-01 00:00', -1.0, 0.5),
+            ('2024-01-02 12:00', -2.0, np.nan),
+            ('2024-01-03 06:00', -14.0, 0.8),
+            ('2024-01-04 18:00', -20.0, np.nan)
+        ]),
+        (IMC_ID, True, CONTRACTOR_ID, [
+            ('2024-01-02 13:00', -2.5, 0.4),
+            ('2024-01-04 12:00', -19.0, 0.9)
+        ]),
+        (UNPAIRED_ID, False, None, [
+            ('2024-01-01 00:00', 5.0, np.nan),
+            ('2024-01-01 06:00', 6.0, np.nan)
+        ])
+    ]:
+        instrument = instruments[instr_id] = classes.instrument(id=instr_id)
+        instrument.is_imc, instrument.imc_id = is_imc, imc_id
+        instrument.contract, instrument.site, instrument.type = '1201', instr_id.split('/')[1], 'GSM'
+        instrument.easting, instrument.northing = 816500.0, 811700.0
+        instrument.readings = readingsTable(rows, ['Settlement', 'Tilt Change'])
+    return instruments
+
+
+def gaugeReviewLevels() -> pd.DataFrame:
+    return pd.DataFrame.from_records([
+        (CONTRACTOR_ID, 'Settlement', 'lower', 'alert', -10.0),
+        (CONTRACTOR_ID, 'Settlement', 'lower', 'alarm', -15.0),
+        (CONTRACTOR_ID, 'Settlement', 'lower', 'action', -25.0),
+        (CONTRACTOR_ID, 'Tilt Change', 'upper', 'alert', 0.6),
+        (CONTRACTOR_ID, 'Tilt Change', 'upper', 'alarm', 1.0),
+        (IMC_ID, 'Settlement', 'lower', 'alert', -10.0),
+        (IMC_ID, 'Settlement', 'lower', 'alarm', -30.0),
+        (UNPAIRED_ID, 'Settlement', 'upper', 'alert', 10.0)
+    ], columns=['instrument', 'field', 'direction', 'level', 'value'])
+
+
+def gaugePlotData() -> pd.DataFrame:
+    instruments = gaugeProject()
+    reviewlevels_df = gaugeReviewLevels()
+    store = processes.buildReadingsStore(instruments)
+    summary_df = processes.summariseReadings(store, REPORT_PERIOD)
+    return processes.collatePlotData(
+        instruments=instruments,
+        summary_df=summary_df,
+        imc_df=processes.compareIMCReadings(store, instruments, REPORT_PERIOD, imc_maxdatediff=1),
+        exceedance_df=processes.classifyExceedances(store, reviewlevels_df, processes.summaryStartDates(summary_df), REPORT_PERIOD, period_exceedances=True),
+        reviewlevels_df=reviewlevels_df
+    )
+
+
+def test_summary_takes_start_end_and_period_extremes_of_each_field():
+    summary_df = processes.summariseReadings(processes.buildReadingsStore(gaugeProject()), REPORT_PERIOD)
+
+    start_dates = pd.to_datetime(['2024-01-02 12:00'] * 2 + ['2024-01-02 13:00'] * 2 + ['2024-01-01 06:00'] * 2)
+    end_dates = pd.to_datetime(['2024-01-04 18:00'] * 2 + ['2024-01-04 12:00'] * 2 + ['2024-01-01 06:00'] * 2)
+    assert_frame_equal(plain(summary_df), pd.DataFrame({
+        'instrument_id': [CONTRACTOR_ID, CONTRACTOR_ID, IMC_ID, IMC_ID, UNPAIRED_ID, UNPAIRED_ID],
+        'field': ['Settlement', 'Tilt Change'] * 3,
+        # The start reading is the latest up to the day after the period starts and is blank where that reading is
+        'start_value': [-2.0, np.nan, -2.5, 0.4, 6.0, np.nan],
+        'end_value': [-20.0, np.nan, -19.0, 0.9, 6.0, np.nan],
+        'max_in_period_value': [-2.0, 0.8, -2.5, 0.9, np.nan, np.nan],
+        'min_in_period_value': [-20.0, 0.8, -19.0, 0.4, np.nan, np.nan],
+        'change_value': [-18.0, np.nan, -16.5, 0.5, 0.0, np.nan],
+        'start_date': start_dates,
+        'end_date': end_dates,
+        'change_period': end_dates - start_dates
+    }))
+
+
+def test_imc_comparison_pairs_the_closest_readings_in_the_period():
+    instruments = gaugeProject()
+    imc_df = processes.compareIMCReadings(processes.buildReadingsStore(instruments), instruments, REPORT_PERIOD, imc_maxdatediff=1)
+
+    # 13:00 on 2 January is an hour from a Contractor reading, closer than the pair six hours apart on 4 January
+    assert_frame_equal(plain(imc_df), pd.DataFrame({
+        'instrument_id': [CONTRACTOR_ID, CONTRACTOR_ID, IMC_ID, IMC_ID],
+        'field': ['Settlement', 'Tilt Change'] * 2,
+        'partner_id': [IMC_ID, IMC_ID, CONTRACTOR_ID, CONTRACTOR_ID],
+        'compare_value': [-2.0, np.nan, -2.5, 0.4],
+        'compare_date': pd.to_datetime(['2024-01-02 12:00'] * 2 + ['2024-01-02 13:00'] * 2),
+        'diff_value': [0.5, np.nan, -0.5, np.nan],
+        'diff_date': pd.to_timedelta(['-1h', '-1h', '1h', '1h'])
+    }))
+
+
+def test_exceedances_take_the_highest_level_exceeded_in_order():
+    instruments = gaugeProject()
+    store = processes.buildReadingsStore(instruments)
+    exceedance_df = processes.classifyExceedances(
+        store=store,
+        reviewlevels_df=gaugeReviewLevels(),
+        start_dates=processes.summaryStartDates(processes.summariseReadings(store, REPORT_PERIOD)),
+        report_period=REPORT_PERIOD,
+        period_exceedances=True
+    )
+
+    # The unpaired instrument has no readings in the period, so nothing to classify
+    assert_frame_equal(plain(exceedance_df), pd.DataFrame({
+        'instrument_id': [CONTRACTOR_ID, CONTRACTOR_ID, IMC_ID],
+        'field': ['Settlement', 'Tilt Change', 'Settlement'],
+        'direction': ['lower', 'upper', 'lower'],
+        'level': ['alarm', 'alert', 'alert'],
+        'value': [-20.0, 0.8, -19.0],
+        'date': pd.to_datetime(['2024-01-04 18:00', '2024-01-03 06:00', '2024-01-04 12:00'])
+    }))
+
+
+def test_plot_data_joins_each_table_on_instrument_and_field():
+    plotdata_df = gaugePlotData()
+
+    assert_frame_equal(plotdata_df[[
+        'id', 'field_name', 'start_value', 'change_value', 'gradient_from_ratio', 'range_in_period', 'is_imc', 'corresponding_imc_id',
+        'imc_compare_reading', 'end_diff_with_imc', 'lower_review_level', 'lower_max_exceedance_value', 'upper_review_level',
+        'upper_max_exceedance_value', 'lower_alert', 'lower_alarm', 'lower_action', 'upper_alert', 'upper_alarm', 'site'
+    ]], pd.DataFrame({
+        'id': [CONTRACTOR_ID, CONTRACTOR_ID, IMC_ID, IMC_ID, UNPAIRED_ID, UNPAIRED_ID],
+        'field_name': ['Settlement', 'Tilt Change'] * 3,
+        'start_value': [-2.0, np.nan, -2.5, 0.4, 6.0, np.nan],
+        'change_value': [-18.0, np.nan, -16.5, 0.5, 0.0, np.nan],
+        'gradient_from_ratio': [np.nan, np.nan, np.nan, 2.0, np.nan, np.nan],
+        'range_in_period': [18.0, 0.0, 16.5, 0.5, np.nan, np.nan],
+        'is_imc': [False, False, True, True, False, False],
+        'corresponding_imc_id': [IMC_ID, IMC_ID, CONTRACTOR_ID, CONTRACTOR_ID, None, None],
+        'imc_compare_reading': [-2.0, np.nan, -2.5, 0.4, np.nan, np.nan],
+        'end_diff_with_imc': [0.5, np.nan, -0.5, np.nan, np.nan, np.nan],
+        'lower_review_level': ['alarm', None, 'alert', None, None, None],
+        'lower_max_exceedance_value': [-20.0, np.nan, -19.0, np.nan, np.nan, np.nan],
+        'upper_review_level': [None, 'alert', None, None, None, None],
+        'upper_max_exceedance_value': [np.nan, 0.8, np.nan, np.nan, np.nan, np.nan],
+        'lower_alert': [-10.0, np.nan, -10.0, np.nan, np.nan, np.nan],
+        'lower_alarm': [-15.0, np.nan, -30.0, np.nan, np.nan, np.nan],
+        'lower_action': [-25.0, np.nan, np.nan, np.nan, np.nan, np.nan],
+        'upper_alert': [np.nan, 0.6, np.nan, np.nan, 10.0, np.nan],
+        'upper_alarm': [np.nan, 1.0, np.nan, np.nan, np.nan, np.nan],
+        'site': ['A', 'A', 'A', 'A', 'B', 'B']
+    }))
+
+
+def test_appendix_f_lists_the_most_onerous_exceedance_of_each_field():
+    appendix_f = processes.collateAppendixF(gaugePlotData())
+
+    assert_frame_equal(appendix_f, pd.DataFrame({
+        'Contract': ['1201'] * 3,
+        'Site': ['A'] * 3,
+        'Instrument Type': ['GSM'] * 3,
+        'Instrument ID': [IMC_ID, CONTRACTOR_ID, CONTRACTOR_ID],
+        'Measurand': ['Settlement', 'Settlement', 'Tilt Change'],
+        'Exceeded Review Level': ['Alert', 'Alarm', 'Alert'],
+        'Reporting Period Value (Beginning)': [-2.5, -2.0, np.nan],
+        'Reporting Period Value (End)': [-19.0, -20.0, np.nan],
+        'Reporting Period Value (Most Onerous)': [-19.0, -20.0, 0.8],
+        'Reporting Period Date (Beginning)': pd.to_datetime(['2024-01-02 13:00', '2024-01-02 12:00', '2024-01-02 12:00']),
+        'Reporting Period Date (End)': pd.to_datetime(['2024-01-04 12:00', '2024-01-04 18:00', '2024-01-04 18:00']),
+        'Reporting Period Date (Most Onerous)': pd.to_datetime(['2024-01-04 12:00', '2024-01-04 18:00', '2024-01-03 06:00']),
+        'Lower AAA (Alert)': [-10.0, -10.0, np.nan],
+        'Lower AAA (Alarm)': [-30.0, -15.0, np.nan],
+        'Lower AAA (Action)': [np.nan, -25.0, np.nan],
+        'Upper AAA (Alert)': [np.nan, np.nan, 0.6],
+        'Upper AAA (Alarm)': [np.nan, np.nan, 1.0],
+        'Upper AAA (Action)': [np.nan, np.nan, np.nan]
+    }, index=[2, 0, 1]))
+
+
+def test_appendix_g_pairs_each_contractor_difference_with_its_imc_reading():
+    appendix_g = processes.collateAppendixG(gaugePlotData())
+
+    # The Tilt Change difference is blank, as the Contractor reading compared has no tilt
+    assert_frame_equal(appendix_g, pd.DataFrame({
+        'Measurand': ['Settlement'],
+        'Contract': ['1201'],
+        'Site': ['A'],
+        'Instrument Type': ['GSM'],
+        'Instrument Name (Contractor)': [CONTRACTOR_ID],
+        'Instrument Name (IMC)': [IMC_ID],
+        'imc_compare_reading': [-2.0],
+        'Value (IMC)': [-2.5],
+        'Value (Difference)': [0.5],
+        'Date (Contractor)': pd.to_datetime(['2024-01-02 12:00']),
+        'Date (IMC)': pd.to_datetime(['2024-01-02 13:00']),
+        'Date (Difference)': pd.to_timedelta(['-1h'])
+    }))
+
+
+def test_coordinates_convert_hk1980_grid_to_wgs84():
+    plotdata_df = processes.hk1980_to_latlong(pd.DataFrame({
+        'easting': [816500.0, 836055.0, np.nan, 816500.0],
+        'northing': [811700.0, 832591.0, 811700.0, 811700.0]
+    }))
+
+    assert_frame_equal(plotdata_df[['longitude', 'latitude']], pd.DataFrame({
+        'longitude': [113.98510994, 114.17480535, np.nan, 113.98510994],
+        'latitude': [22.24393543, 22.43270616, np.nan, 22.24393543]
+    }))
+    assert plotdata_df['coordinates'][0] == (113.98510994, 22.24393543)
+
+
+def test_coordinates_remember_only_the_latest_points():
+    with mock.patch.object(processes, 'WGS84_COORDINATES', 1), mock.patch.object(processes, '_wgs84_coordinates', processes.OrderedDict()):
+        plotdata_df = processes.hk1980_to_latlong(pd.DataFrame({'easting': [816500.0, 836055.0], 'northing': [811700.0, 832591.0]}))
+
+        assert list(processes._wgs84_coordinates) == [(836055.0, 832591.0)]
+    # A batch of more points than are remembered is still converted in full
+    assert plotdata_df['coordinates'].tolist() == [(113.98510994, 22.24393543), (114.17480535, 22.43270616)]
+
+
+def inclinometerString() -> dict:
+    # A parent bearing east, with one child reading A and B together and one reading them at separate times
+    instruments = {PARENT_ID: classes.instrument(id=PARENT_ID)}
+    instruments[PARENT_ID].type, instruments[PARENT_ID].bearing = 'IW', 90.0
+    for sensor_index, rows in enumerate([
+        [('2024-01-02 00:00', 1.0, 2.0), ('2024-01-04 00:00', 3.0, 2.0)],
+        [('2024-01-02 00:00', 0.5, np.nan), ('2024-01-02 06:00', np.nan, -1.0), ('2024-01-04 00:00', 1.5, -2.0)]
+    ]):
+        child_id = '{}/{}'.format(PARENT_ID, sensor_index + 1)
+        child = instruments[child_id] = classes.instrument(id=child_id)
+        child.type, child.parents, child.contract, child.site = 'IW', [PARENT_ID], '1201', 'A'
+        child.easting, child.northing, child.instrument_level = 1000.0, 2000.0, 5.0 - sensor_index
+        child.readings = readingsTable(rows, list(processes.INCLINOMETER_DISPLACEMENT_FIELDS.values()))
+    return instruments
+
+
+def test_inclinometer_vectors_rotate_a_and_b_to_north_and_east():
+    instruments = inclinometerString()
+    ne_store = processes.rotateABToNE(processes.buildReadingsStore(instruments), instruments, ['IW'])
+    vectors_df = processes.collateInclinometerVectors(instruments, processes.summaryTable(ne_store, REPORT_PERIOD))
+
+    # Bearing east turns A into east and B into south. The second child has no start reading with both A and B.
+    assert_frame_equal(vectors_df, pd.DataFrame({
+        'id': [PARENT_ID + '/1', PARENT_ID + '/2'],
+        'x': [1000.1, np.nan],
+        'y': [1999.8, np.nan],
+        'z': [5.0, 4.0],
+        'u': [0.2, np.nan],
+        'v': [0.0, np.nan],
+        'w': [0, 0],
+        'contract': ['1201', '1201'],
+        'site': ['A', 'A']
+    }))
+
+
+def test_inclinometer_vector_stage_reports_one_status():
+    instruments = inclinometerString()
+    ne_store = processes.rotateABToNE(processes.buildReadingsStore(instruments), instruments, ['IW'])
+    with mock.patch.object(processes, 'statusContainer', wraps=processes.statusContainer) as status_container:
+        pipeline.inclinometerVectorStage({'instruments': instruments}, {'inclinometer_store': ne_store}, {'report_period': REPORT_PERIOD})
+
+    assert [status_call.kwargs['label'] for status_call in status_container.call_args_list] == ['Building a tabular inclinometer summary for output...']
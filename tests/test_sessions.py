@@ -0,0 +1,40 @@
+import threading
+import numpy as np
+import pandas as pd
+import exports
+import sessions
+
+
+def test_eviction_resets_to_a_fresh_default(monkeypatch):
+    monkeypatch.setattr(sessions, 'SESSION_MEMORY_BUDGET', 2 ** 20)
+    session = sessions.SessionData('evicted', evictable={'exports': {}})
+    tables = {'plotdata': pd.DataFrame({'value': np.arange(300000, dtype=float)})}
+    session['exports'] = {}
+
+    for version in ['first', 'second', 'third']:
+        exports.exportArtefact(session['exports'], version, 'all_data', 'csv', tables)
+        session.touch('exports')
+
+        # Over budget, the prepared export is dropped and the default is never filled in place
+        assert session['exports'] == {}
+        assert session.evictable['exports'] == {}
+        assert session.memoryUsage() < sessions.SESSION_MEMORY_BUDGET
+
+
+def test_running_session_is_not_spilled(monkeypatch, tmp_path):
+    monkeypatch.setattr(sessions, 'SPILL_DIR', str(tmp_path))
+    session = sessions.SessionData('running')
+    session['table'] = pd.DataFrame({'value': np.arange(1000, dtype=float)})
+    finish = threading.Event()
+    session.script_thread = threading.Thread(target=finish.wait)
+    session.script_thread.start()
+
+    assert session.spill() == 0
+    assert not session.spilled
+
+    finish.set()
+    session.script_thread.join()
+    assert session.spill() > 0
+    assert session.memoryUsage() == 0
+    pd.testing.assert_frame_equal(session['table'], pd.DataFrame({'value': np.arange(1000, dtype=float)}))
+    assert not session.spilled
@@ -0,0 +1,44 @@
+import math
+from unittest import mock
+import pytest
+import status
+
+
+@pytest.mark.parametrize('platform, ru_maxrss', [('linux', 512 * 2 ** 10), ('darwin', 512 * 2 ** 20)])
+def test_peak_memory_is_in_mib_on_every_platform(platform, ru_maxrss):
+    with mock.patch.object(status.sys, 'platform', platform), \
+            mock.patch.object(status.resource, 'getrusage', return_value=mock.Mock(ru_maxrss=ru_maxrss)):
+        assert status.peakMemory() == 512
+
+
+def test_stages_report_the_process_peak_rss():
+    status.startTrace('test')
+    with mock.patch.object(status, 'peakMemory', return_value=512.0):
+        stage_status = status.statusContainer(label='Testing...')
+        stage_status.update(label='Tested!', state='complete')
+
+    measurements = status.currentTrace()['stages'][-1]
+    assert measurements['process_peak_rss_mib'] == 512.0
+    assert 'peak_memory_increase_mb' not in measurements
+    assert 'process peak RSS 512 MiB' in status.formatMeasurements(measurements)
+
+
+def test_stages_report_their_change_in_resident_memory():
+    status.startTrace('test')
+    with mock.patch.object(status, 'residentMemory', side_effect=[100.0, 164.0]):
+        stage_status = status.statusContainer(label='Testing...')
+        stage_status.update(label='Tested!', state='complete')
+
+    measurements = status.currentTrace()['stages'][-1]
+    assert measurements['rss_delta_mib'] == 64.0
+    assert 'RSS +64 MiB' in status.formatMeasurements(measurements)
+
+
+def test_resident_memory_grows_with_allocations():
+    before = status.residentMemory()
+    if math.isnan(before):
+        pytest.skip('no /proc on this platform')
+    # Filled rather than zeroed, so that every page is resident
+    block = b'\x01' * (64 * 2 ** 20)
+    assert status.residentMemory() - before > 32
+    del block